@@ -0,0 +1,57 @@
+"""
+End to end ingestion throughput, fetching pages from a local stand-in API server and storing them in the database
+
+Usage: python -m benchmarks.bench_ingest
+"""
+
+import time
+import logging
+import tempfile
+import whalealert.settings as settings
+from whalealert.whalealert import WhaleAlert
+from whalealert.api.standin import StandInServer, synthetic_transactions
+
+logging.disable(logging.CRITICAL)
+
+TRANSACTIONS = 5000
+LATENCIES = [0.0, 0.01]
+START_TIME = 1588000000
+
+
+def configure(directory, base_url):
+    config = WhaleAlert(directory).get_configuration()
+    config.set_value(settings.API_section_name, settings.API_option_base_url, base_url)
+    config.set_value(settings.API_section_name, settings.API_option_rate_limit, 0)
+    config.write_configuration_file()
+    return WhaleAlert(directory)
+
+
+def ingest(whale, server):
+    cursor = None
+    pages = 0
+    while True:
+        served = server.get_statistics()['transactions']
+        whale.fetch_and_store_data(START_TIME - 1, api_key='key', cursor=cursor, min_value=0)
+        pages += 1
+        if server.get_statistics()['transactions'] - served < 100:
+            return pages
+        cursor = whale.transactions.get_last_cursor()
+
+
+def main():
+    transactions = synthetic_transactions(TRANSACTIONS, START_TIME, START_TIME + TRANSACTIONS)
+    print("{:>12} {:>8} {:>10} {:>20} {:>16}".format('latency (s)', 'pages', 'time (s)', 'transactions/second',
+                                                    'rows/second'))
+    for latency in LATENCIES:
+        with StandInServer(transactions, latency=latency) as server, tempfile.TemporaryDirectory() as directory:
+            whale = configure(directory, server.get_base_url())
+            start = time.perf_counter()
+            pages = ingest(whale, server)
+            elapsed = time.perf_counter() - start
+            rows_per_second = whale.get_write_statistics()['rows_per_second']
+        print("{:>12} {:>8} {:>10.3f} {:>20.0f} {:>16.0f}".format(latency, pages, elapsed, TRANSACTIONS / elapsed,
+                                                                  rows_per_second))
+
+
+if __name__ == '__main__':
+    main()
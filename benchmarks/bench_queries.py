@@ -0,0 +1,107 @@
+"""
+Query latency on large blockchain tables: before and after the schema upgrade adds the timestamp index, and for a
+request across every blockchain before and after migrating to the unified transactions table
+
+Usage: python -m benchmarks.bench_queries
+"""
+
+import os
+import time
+import timeit
+import logging
+import tempfile
+from unittest import mock
+from dbops.sqhelper import SQHelper
+import whalealert.settings as settings
+import whalealert.publisher.schema as schema
+from whalealert.publisher.reader import Reader
+from whalealert.api.record import Transaction
+
+logging.disable(logging.CRITICAL)
+
+ROWS = 1000000
+BLOCKCHAINS = ['bitcoin', 'ethereum', 'tron', 'ripple', 'eos', 'stellar', 'neo', 'binancechain', 'litecoin', 'icon']
+START_TIME = 1588000000
+WINDOW_SECONDS = 3600
+REPEATS = 5
+
+
+def make_rows(count, blockchain='bitcoin'):
+    template = {column: '' for column in Transaction.FIELDS}
+    for index in range(count):
+        template.update(blockchain=blockchain, symbol='BTC', id=str(index), timestamp=START_TIME + index, amount=1.0,
+                        amount_usd=500000.0, transaction_count=1)
+        yield Transaction.from_dict(template).to_row()
+
+
+def fill_table(database, table, rows, blockchain='bitcoin'):
+    database.create_table(table, settings.database_columns)
+    with database.con:
+        database.con.executemany("INSERT INTO {} VALUES ({})".format(table, ','.join('?' * len(Transaction.FIELDS))),
+                                 make_rows(rows, blockchain))
+
+
+def best(function, number=10):
+    return min(timeit.repeat(function, number=number, repeat=REPEATS)) / number
+
+
+def measure(database):
+    end_time = START_TIME + ROWS
+    row_range = best(lambda: database.get_row_range('bitcoin', 'timestamp', end_time - WINDOW_SECONDS, end_time))
+    last_entry = best(lambda: database.get_last_time_entry('bitcoin'))
+    return row_range, last_entry
+
+
+def measure_all_blockchains(database, from_time=START_TIME + ROWS // len(BLOCKCHAINS) - WINDOW_SECONDS):
+    request = dict(settings.request_format)
+    request[settings.request_blockchain] = ['*']
+    request[settings.request_symbols] = ['*']
+    request[settings.request_from_time] = from_time
+    request[settings.request_maximum_results] = 20
+    reader = Reader(database=database)
+    with mock.patch('time.time', return_value=START_TIME + ROWS):
+        return best(lambda: reader.data_request(request, as_df=True), number=3)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        database = SQHelper(os.path.join(directory, settings.database_file_name))
+        fill_table(database, 'bitcoin', ROWS)
+
+        print("{:>10} {:>24} {:>26}".format('rows', 'last hour range (ms)', 'last time entry (ms)'))
+        row_range, last_entry = measure(database)
+        print("{:>10} {:>24.3f} {:>26.3f}  no index".format(ROWS, row_range * 1e3, last_entry * 1e3))
+
+        start = time.perf_counter()
+        schema.upgrade(database)
+        upgrade_seconds = time.perf_counter() - start
+        row_range, last_entry = measure(database)
+        print("{:>10} {:>24.3f} {:>26.3f}  indexed".format(ROWS, row_range * 1e3, last_entry * 1e3))
+        print("Schema upgrade took {:.1f} seconds".format(upgrade_seconds))
+        database.con.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = SQHelper(os.path.join(directory, settings.database_file_name))
+        for blockchain in BLOCKCHAINS:
+            fill_table(database, blockchain, ROWS // len(BLOCKCHAINS), blockchain)
+        schema.upgrade(database)
+
+        print("\n{:>10} {:>12} {:>30} {:>26}".format('rows', 'tables', 'all blockchains, last hour (ms)',
+                                                     'all blockchains, ever (ms)'))
+        latency = measure_all_blockchains(database)
+        history_latency = measure_all_blockchains(database, from_time=0)
+        print("{:>10} {:>12} {:>30.3f} {:>26.3f}  table per blockchain".format(ROWS, len(BLOCKCHAINS), latency * 1e3,
+                                                                               history_latency * 1e3))
+
+        start = time.perf_counter()
+        schema.migrate_to_unified(database)
+        migrate_seconds = time.perf_counter() - start
+        latency = measure_all_blockchains(database)
+        history_latency = measure_all_blockchains(database, from_time=0)
+        print("{:>10} {:>12} {:>30.3f} {:>26.3f}  unified table".format(ROWS, 1, latency * 1e3, history_latency * 1e3))
+        print("Migration took {:.1f} seconds".format(migrate_seconds))
+        database.con.close()
+
+
+if __name__ == '__main__':
+    main()
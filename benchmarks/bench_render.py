@@ -0,0 +1,54 @@
+"""
+Time to render query results as plain text, pretty (coloured) text and dictionaries
+
+Usage: python -m benchmarks.bench_render [rows]
+"""
+
+import sys
+import time
+import logging
+import pandas as pd
+import whalealert.settings as settings
+from whalealert.publisher.reader import Reader
+
+logging.disable(logging.CRITICAL)
+
+ROWS = 1000000
+START_TIME = 1588000000
+AMOUNTS_USD = [500000.0, 2500000.0, 45000000.0]
+TRANSACTION_TYPES = ['transfer', 'transfer', 'burn', 'mint']
+OWNERS = ['binance', '', 'huobi', None]
+
+
+def make_frame(rows):
+    columns = {column: [''] * rows for column in settings.database_columns}
+    columns[settings.database_column_blockchain] = ['ethereum'] * rows
+    columns[settings.database_column_symbol] = ['USDT'] * rows
+    columns[settings.database_column_id] = [str(index) for index in range(rows)]
+    columns[settings.database_column_transaction_type] = [
+        TRANSACTION_TYPES[index % len(TRANSACTION_TYPES)] for index in range(rows)
+    ]
+    columns[settings.database_column_from_owner] = [OWNERS[index % len(OWNERS)] for index in range(rows)]
+    columns[settings.database_column_to_owner] = [OWNERS[(index + 1) % len(OWNERS)] for index in range(rows)]
+    columns[settings.database_column_timestamp] = [START_TIME + index for index in range(rows)]
+    columns[settings.database_column_amount] = [1000000.0 + index for index in range(rows)]
+    columns[settings.database_column_amount_usd] = [AMOUNTS_USD[index % len(AMOUNTS_USD)] for index in range(rows)]
+    columns[settings.database_column_transaction_count] = [1] * rows
+    return pd.DataFrame(columns)
+
+
+def main(rows):
+    reader = Reader()
+    df = make_frame(rows)
+    print("{:>10} {:>8} {:>8} {:>12} {:>14}".format('rows', 'pretty', 'as_dict', 'seconds', 'rows/second'))
+    for pretty in [False, True]:
+        for as_dict in [False, True]:
+            start = time.perf_counter()
+            reader.dataframe_to_transaction_output(df, pretty=pretty, as_dict=as_dict)
+            elapsed = time.perf_counter() - start
+            print("{:>10} {:>8} {:>8} {:>12.2f} {:>14.0f}".format(rows, str(pretty), str(as_dict), elapsed,
+                                                                   rows / elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
@@ -0,0 +1,66 @@
+"""
+Per-transaction cost of validating and flattening API responses
+
+Usage: python -m benchmarks.bench_validator
+"""
+
+import json
+import timeit
+import logging
+from whalealert.api.validator import TransactionValidator
+from whalealert.api.transactions import Transactions
+from whalealert.api.ratelimit import RateLimiter
+
+logging.disable(logging.CRITICAL)
+
+PAGE_SIZES = [100, 10000]
+REPEATS = 5
+
+
+def make_transaction(index):
+    return {
+        "blockchain": "ethereum",
+        "symbol": "usdt",
+        "id": str(index),
+        "transaction_type": "transfer",
+        "hash": "{:064x}".format(index),
+        "from": {
+            "address": "477b8d5ef7c2c42db84deb555419cd817c336b6f",
+            "owner_type": "unknown"
+        },
+        "to": {
+            "address": "b3fe1649862d7889ab002e0224a2db54870eafa9",
+            "owner_type": "exchange",
+            "owner": "binance"
+        },
+        "timestamp": 1588578025 + index,
+        "amount": 500000,
+        "amount_usd": 503430.84,
+        "transaction_count": 1
+    }
+
+
+def make_page(size):
+    transactions = [make_transaction(i) for i in range(size)]
+    return {"result": "success", "cursor": "abcd", "count": size, "transactions": transactions}
+
+
+def best_per_transaction(function, size, number):
+    return min(timeit.repeat(function, number=number, repeat=REPEATS)) / (number * size)
+
+
+def main():
+    validator = TransactionValidator()
+    transactions = Transactions(rate_limiter=RateLimiter())
+    print("{:>8} {:>22} {:>29}".format('records', 'validate (us/record)', 'decode+validate (us/record)'))
+    for size in PAGE_SIZES:
+        page = make_page(size)
+        content = json.dumps(page).encode()
+        number = max(1, 100000 // size)
+        validate = best_per_transaction(lambda: validator.validate_page(page), size, number)
+        check = best_per_transaction(lambda: transactions._check_response(200, content), size, number)
+        print("{:>8} {:>22.3f} {:>29.3f}".format(size, validate * 1e6, check * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,7 @@ setuptools.setup(
     python_requires = '>=3.6',
     install_requires=[
         'requests',
+        'aiohttp',
         'colorama',
         'config-checker',
         'db-ops',
@@ -33,4 +34,7 @@ setuptools.setup(
         'python-dateutil',
         'urllib3'
     ],
+    extras_require={
+        'fast': ['orjson'],
+    },
     )
@@ -0,0 +1,88 @@
+"""
+Stand-ins for the HTTP sessions and responses used by the API tests
+"""
+
+from unittest import mock
+import asyncio
+from requests.models import Response
+
+
+def make_response(status_code, content, headers=None):
+    """ Make a requests Response with the given status code, body (str or bytes) and headers """
+    response = Response()
+    response.status_code = status_code
+    response._content = content.encode() if isinstance(content, str) else content
+    if headers is not None:
+        response.headers.update(headers)
+    return response
+
+
+class FakeAsyncResponse():
+    """ Stands in for an aiohttp response. Reading the body takes delay seconds, counted as in flight by the session """
+    def __init__(self, status, text, headers=None, delay=0):
+        self.status = status
+        self.headers = headers if headers is not None else {}
+        self.session = None
+        self.__body = text.encode()
+        self.__delay = delay
+
+    async def read(self):
+        if self.session is not None:
+            self.session.in_flight += 1
+            self.session.max_in_flight = max(self.session.max_in_flight, self.session.in_flight)
+        if self.__delay > 0:
+            await asyncio.sleep(self.__delay)
+        if self.session is not None:
+            self.session.in_flight -= 1
+        return self.__body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        return False
+
+
+class FakeAsyncSession():
+    """ Stands in for an aiohttp ClientSession, serving the given responses in order. Exceptions are raised. """
+    def __init__(self, responses=None):
+        self.responses = list(responses) if responses is not None else []
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+
+    def respond(self, params):
+        """ Get the response for a call. Override to serve responses based on the request parameters """
+        return self.responses.pop(0)
+
+    def get(self, url, params=None):
+        self.calls.append(mock.call(url, params=params))
+        response = self.respond(params)
+        if isinstance(response, Exception):
+            raise response
+        response.session = self
+        return response
+
+    async def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+        return False
+
+
+async def no_sleep(delay):
+    pass
+
+
+def run(coroutine):
+    """ Run a coroutine to completion on a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
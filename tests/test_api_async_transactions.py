@@ -0,0 +1,211 @@
+import unittest
+from unittest import mock
+import asyncio
+import json
+import logging
+import aiohttp
+import whalealert.settings as settings
+from whalealert.api.async_transactions import AsyncTransactions
+from whalealert.api.ratelimit import RateLimiter
+from tests.fakes import FakeAsyncResponse, FakeAsyncSession, no_sleep, run
+
+logging.disable(logging.CRITICAL)
+
+text_error = {"result": "error", "message": "invalid api_key"}
+text_empty = {"result": "success", "cursor": "2712e8b6-2712e8b6-5eafc647", "count": 0}
+text_success = {
+    "result":
+    "success",
+    "cursor":
+    "2712f286-2712f286-5eafc711",
+    "count":
+    1,
+    "transactions": [{
+        "blockchain": "ethereum",
+        "symbol": "usdt",
+        "id": "655552612",
+        "transaction_type": "transfer",
+        "hash": "4cdfc57c737b4214fbce384e57f50d8b52f80c2eb470654f9fdc2062c534bf42",
+        "from": {
+            "address": "477b8d5ef7c2c42db84deb555419cd817c336b6f",
+            "owner_type": "unknown"
+        },
+        "to": {
+            "address": "b3fe1649862d7889ab002e0224a2db54870eafa9",
+            "owner_type": "exchange",
+            "owner": "binance"
+        },
+        "timestamp": 1588578025,
+        "amount": 500000,
+        "amount_usd": 503430.84,
+        "transaction_count": 1
+    }]
+}
+
+
+class AsyncWhaleAlertAPI(unittest.TestCase):
+    def setUp(self):
+        self.rate_limiter = RateLimiter()
+        self.transactions = AsyncTransactions(rate_limiter=self.rate_limiter)
+        self.old_sleep = asyncio.sleep
+        asyncio.sleep = no_sleep
+
+    def tearDown(self):
+        asyncio.sleep = self.old_sleep
+
+    def use_session(self, responses):
+        session = FakeAsyncSession(responses)
+        self.transactions = AsyncTransactions(session=session, rate_limiter=self.rate_limiter)
+        return session
+
+    def make_normal_request(self):
+        return run(self.transactions.get_transactions(123456, 234567, '123', 'asdf', 500000, 100))
+
+    def test_correctly_formed_api_call_all_parameters(self):
+        session = self.use_session([FakeAsyncResponse(200, json.dumps(text_empty))])
+        self.make_normal_request()
+        call_parameters = {
+            'api_key': '123',
+            'start': 123456,
+            'min_value': 500000,
+            'limit': 100,
+            'end': 234567,
+            'cursor': 'asdf'
+        }
+        expected = [mock.call(settings.whale_get_transactions_url, params=call_parameters)]
+        self.assertEqual(session.calls, expected)
+
+    def test_parsing_good_response_with_transactions(self):
+        self.use_session([FakeAsyncResponse(200, json.dumps(text_success))])
+        success, transactions, status = self.make_normal_request()
+        self.assertIs(success, True)
+        self.assertEqual(status[settings.status_file_option_error_code], 200)
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0]['symbol'], 'USDT')
+        self.assertEqual(self.transactions.get_last_cursor(), text_success['cursor'])
+
+    def test_parsing_error_response(self):
+        self.use_session([FakeAsyncResponse(401, json.dumps(text_error))])
+        success, transactions, status = self.make_normal_request()
+        self.assertIs(success, False)
+        self.assertIs(transactions, None)
+        self.assertEqual(status[settings.status_file_option_error_code], 401)
+
+    def test_bad_json_response_handled_ok(self):
+        self.use_session([FakeAsyncResponse(200, 'not a good json format')])
+        success, transactions, status = self.make_normal_request()
+        self.assertIs(success, False)
+        self.assertEqual(status[settings.status_file_option_error_code], 5)
+
+    def test_handle_connection_error_exception(self):
+        session = self.use_session([aiohttp.ClientConnectionError()] * (settings.whale_retries_on_failure + 1))
+        success, transactions, status = self.make_normal_request()
+        self.assertEqual(len(session.calls), settings.whale_retries_on_failure + 1)
+        self.assertIs(success, False)
+        self.assertEqual(status[settings.status_file_option_error_code], 1)
+
+    def test_handle_timeout_exception(self):
+        session = self.use_session([asyncio.TimeoutError()] * (settings.whale_retries_on_failure + 1))
+        success, transactions, status = self.make_normal_request()
+        self.assertEqual(len(session.calls), settings.whale_retries_on_failure + 1)
+        self.assertIs(success, False)
+        self.assertEqual(status[settings.status_file_option_error_code], 2)
+
+    def test_handle_other_exception(self):
+        session = self.use_session([ValueError()] * (settings.whale_retries_on_failure + 1))
+        success, transactions, status = self.make_normal_request()
+        self.assertEqual(len(session.calls), settings.whale_retries_on_failure + 1)
+        self.assertIs(success, False)
+        self.assertEqual(status[settings.status_file_option_error_code], 4)
+
+    def test_retry_recovers_after_exception(self):
+        session = self.use_session([aiohttp.ClientConnectionError(), FakeAsyncResponse(200, json.dumps(text_success))])
+        success, transactions, status = self.make_normal_request()
+        self.assertEqual(len(session.calls), 2)
+        self.assertIs(success, True)
+
+    def test_every_attempt_waits_on_the_rate_limiter(self):
+        self.use_session([aiohttp.ClientConnectionError(), FakeAsyncResponse(200, json.dumps(text_success))])
+        self.make_normal_request()
+        self.assertEqual(self.rate_limiter.get_statistics()['calls'], 2)
+
+    def test_concurrent_calls_share_one_event_loop(self):
+        session = self.use_session([FakeAsyncResponse(200, json.dumps(text_empty)) for i in range(5)])
+
+        async def many_calls():
+            calls = [self.transactions.get_transactions(i, None, '123', None, 500000, 100) for i in range(5)]
+            return await asyncio.gather(*calls)
+
+        results = run(many_calls())
+        self.assertEqual(len(session.calls), 5)
+        self.assertEqual([result[0] for result in results], [True] * 5)
+
+    def test_closed_event_loop_is_not_retried_or_counted(self):
+        session = self.use_session([RuntimeError('Event loop is closed')] * (settings.whale_retries_on_failure + 1))
+        breaker = self.transactions.get_circuit_breaker()
+        success, transactions, status = self.make_normal_request()
+        self.assertEqual(len(session.calls), 1)
+        self.assertIs(success, False)
+        self.assertEqual(status[settings.status_file_option_error_code], 4)
+        self.assertEqual(breaker.get_statistics()['consecutive_failures'], 0)
+
+    def test_no_requests_session_is_made(self):
+        with mock.patch('whalealert.api.transactions.make_session') as make_session:
+            transactions = AsyncTransactions(rate_limiter=self.rate_limiter)
+        make_session.assert_not_called()
+        self.assertIs(transactions.get_transport_statistics(), None)
+
+
+class AsyncSessionLifetime(unittest.TestCase):
+    def setUp(self):
+        self.sessions = []
+        patcher = mock.patch('aiohttp.ClientSession', side_effect=self.make_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.transactions = AsyncTransactions(rate_limiter=RateLimiter())
+
+    def make_session(self, **kwargs):
+        session = FakeAsyncSession([FakeAsyncResponse(200, json.dumps(text_empty))] * 2)
+        self.sessions.append(session)
+        return session
+
+    def make_request(self):
+        return self.transactions.get_transactions(123456, 234567, '123', None, 500000, 100)
+
+    @unittest.skipUnless(hasattr(asyncio, 'run'), "asyncio.run requires Python 3.7")
+    def test_each_asyncio_run_gets_its_own_session(self):
+        first = asyncio.run(self.make_request())
+        second = asyncio.run(self.make_request())
+        self.assertIs(first[0], True)
+        self.assertIs(second[0], True)
+        self.assertEqual(len(self.sessions), 2)
+        self.assertEqual([session.closed for session in self.sessions], [True, True])
+
+    def test_session_is_reused_on_the_same_loop(self):
+        async def two_calls():
+            await self.make_request()
+            await self.make_request()
+            await self.transactions.close()
+
+        run(two_calls())
+        self.assertEqual(len(self.sessions), 1)
+        self.assertEqual(len(self.sessions[0].calls), 2)
+        self.assertIs(self.sessions[0].closed, True)
+
+    def test_new_loop_replaces_the_session(self):
+        run(self.make_request())
+        success, transactions, status = run(self.make_request())
+        self.assertIs(success, True)
+        self.assertEqual(len(self.sessions), 2)
+
+    def test_supplied_session_is_not_closed(self):
+        session = FakeAsyncSession([FakeAsyncResponse(200, json.dumps(text_empty))])
+        transactions = AsyncTransactions(session=session, rate_limiter=RateLimiter())
+
+        async def call_and_close():
+            await transactions.get_transactions(123456, 234567, '123', None, 500000, 100)
+            await transactions.close()
+
+        run(call_and_close())
+        self.assertEqual(self.sessions, [])
+        self.assertIs(session.closed, False)
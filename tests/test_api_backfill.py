@@ -0,0 +1,135 @@
+import unittest
+from unittest import mock
+import asyncio
+import json
+import logging
+import whalealert.settings as settings
+from whalealert.api.backfill import Backfill
+from whalealert.api.ratelimit import RateLimiter
+from tests.fakes import FakeAsyncResponse, FakeAsyncSession
+
+logging.disable(logging.CRITICAL)
+
+
+def make_transaction(transaction_id, timestamp, blockchain='bitcoin', symbol='btc'):
+    return {
+        "blockchain": blockchain,
+        "symbol": symbol,
+        "id": str(transaction_id),
+        "transaction_type": "transfer",
+        "hash": "hash{}".format(transaction_id),
+        "from": {
+            "address": "from_address",
+            "owner_type": "unknown"
+        },
+        "to": {
+            "address": "to_address",
+            "owner_type": "unknown"
+        },
+        "timestamp": timestamp,
+        "amount": 500000,
+        "amount_usd": 503430.84,
+        "transaction_count": 1
+    }
+
+
+def make_page(transactions, cursor='cursor'):
+    return json.dumps({"result": "success", "cursor": cursor, "count": len(transactions), "transactions": transactions})
+
+
+class PagingSession(FakeAsyncSession):
+    """ Serves two pages for the first window (following the cursor) and one page for every other window"""
+    def __init__(self, fail_start=None):
+        super().__init__()
+        self.fail_start = fail_start
+
+    def respond(self, params):
+        start = params['start']
+        if start == self.fail_start:
+            return FakeAsyncResponse(401, json.dumps({"result": "error", "message": "invalid api_key"}), delay=0.01)
+        if start == 0 and 'cursor' not in params:
+            return FakeAsyncResponse(200, make_page([make_transaction(1, 1), make_transaction(2, 2)], 'page_2'),
+                                     delay=0.01)
+        if start == 0:
+            return FakeAsyncResponse(200, make_page([make_transaction(3, 3)]), delay=0.01)
+        return FakeAsyncResponse(200, make_page([make_transaction(start, start + 1)]), delay=0.01)
+
+    def requested(self):
+        """ The request parameters of every call made """
+        return [kwargs['params'] for name, args, kwargs in self.calls]
+
+
+def run_backfill(backfill, session, start_time, end_time):
+    loop = asyncio.new_event_loop()
+    try:
+        with mock.patch('aiohttp.ClientSession', return_value=session):
+            return loop.run_until_complete(backfill.fetch(start_time, end_time, '123', 500000, limit=2))
+    finally:
+        loop.close()
+
+
+class SplittingWindows(unittest.TestCase):
+    def test_window_is_split_into_contiguous_shards(self):
+        backfill = Backfill(shards=4)
+        self.assertEqual(backfill.split_window(0, 3600), [(0, 900), (900, 1800), (1800, 2700), (2700, 3600)])
+
+    def test_uneven_window_covers_whole_period(self):
+        shards = Backfill(shards=3).split_window(100, 200)
+        self.assertEqual(shards[0][0], 100)
+        self.assertEqual(shards[-1][1], 200)
+        for first, second in zip(shards, shards[1:]):
+            self.assertEqual(first[1], second[0])
+
+    def test_small_window_uses_fewer_shards(self):
+        self.assertEqual(Backfill(shards=10).split_window(0, 3), [(0, 1), (1, 2), (2, 3)])
+
+    def test_empty_window_has_no_shards(self):
+        self.assertEqual(Backfill(shards=10).split_window(10, 10), [])
+
+    def test_bad_shards_or_concurrency_raise(self):
+        self.assertRaises(ValueError, Backfill, shards=0)
+        self.assertRaises(ValueError, Backfill, concurrency=0)
+
+
+class MergingShards(unittest.TestCase):
+    def test_duplicates_are_removed_and_sorted_by_time(self):
+        first = make_transaction(1, 50)
+        second = make_transaction(2, 10)
+        other_chain = make_transaction(1, 30, blockchain='ethereum')
+        merged = Backfill().merge([[first, second], [dict(first), other_chain]])
+        self.assertEqual(merged, [second, other_chain, first])
+
+
+class FetchingShards(unittest.TestCase):
+    def test_every_shard_is_fetched_following_cursors(self):
+        session = PagingSession()
+        backfill = Backfill(shards=3, concurrency=3, rate_limiter=RateLimiter())
+        success, transactions, status = run_backfill(backfill, session, 0, 300)
+        self.assertIs(success, True)
+        self.assertEqual(len(session.calls), 4)
+        self.assertEqual([t['id'] for t in transactions], ['1', '2', '3', '100', '200'])
+        self.assertEqual(status[settings.status_file_option_error_code], 200)
+        self.assertEqual(status[settings.status_file_option_transaction_count], 5)
+
+    def test_concurrency_is_limited(self):
+        session = PagingSession()
+        run_backfill(Backfill(shards=6, concurrency=2, rate_limiter=RateLimiter()), session, 0, 600)
+        self.assertEqual(session.max_in_flight, 2)
+
+    def test_shards_are_split_by_currency(self):
+        session = PagingSession()
+        run_backfill(Backfill(shards=2, currencies=['btc', 'eth'], rate_limiter=RateLimiter()), session, 100, 300)
+        requested = sorted((call['start'], call['end'], call['currency']) for call in session.requested())
+        self.assertEqual(requested, [(100, 200, 'btc'), (100, 200, 'eth'), (200, 300, 'btc'), (200, 300, 'eth')])
+
+    def test_shard_calls_wait_on_the_rate_limiter(self):
+        rate_limiter = RateLimiter()
+        run_backfill(Backfill(shards=3, rate_limiter=rate_limiter), PagingSession(), 0, 300)
+        self.assertEqual(rate_limiter.get_statistics()['calls'], 4)
+
+    def test_a_failed_shard_fails_the_backfill(self):
+        session = PagingSession(fail_start=100)
+        backfill = Backfill(shards=3, rate_limiter=RateLimiter())
+        success, transactions, status = run_backfill(backfill, session, 0, 300)
+        self.assertIs(success, False)
+        self.assertEqual(status[settings.status_file_option_error_code], 401)
@@ -0,0 +1,83 @@
+import unittest
+import json
+import logging
+import whalealert.settings as settings
+from whalealert.api import decoder as decoder_module
+from whalealert.api.decoder import Decoder, preview
+from whalealert.api.transactions import Transactions
+from whalealert.api.ratelimit import RateLimiter
+
+logging.disable(logging.CRITICAL)
+
+page = {"result": "success", "cursor": "2712e8b6-2712e8b6-5eafc647", "count": 0}
+
+
+class DecodingResponses(unittest.TestCase):
+    def test_bytes_are_decoded(self):
+        self.assertEqual(Decoder().decode(json.dumps(page).encode()), page)
+
+    def test_malformed_bytes_raise_json_error(self):
+        self.assertRaises(json.JSONDecodeError, Decoder().decode, b'not json')
+
+    def test_statistics_record_bytes_and_time(self):
+        decoder = Decoder()
+        content = json.dumps(page).encode()
+        decoder.decode(content)
+        decoder.decode(content + b' ')
+        statistics = decoder.get_statistics()
+        self.assertEqual(statistics['pages'], 2)
+        self.assertEqual(statistics['total_bytes'], 2 * len(content) + 1)
+        self.assertEqual(statistics['max_bytes'], len(content) + 1)
+        self.assertEqual(statistics['average_bytes'], len(content) + 0.5)
+        self.assertGreaterEqual(statistics['total_decode_seconds'], 0)
+        self.assertEqual(statistics['backend'], 'json')
+
+    def test_failed_decodes_are_counted(self):
+        decoder = Decoder()
+        self.assertRaises(json.JSONDecodeError, decoder.decode, b'not json')
+        self.assertEqual(decoder.get_statistics()['pages'], 1)
+
+    def test_reset_statistics(self):
+        decoder = Decoder()
+        decoder.decode(b'{}')
+        decoder.reset_statistics()
+        self.assertEqual(decoder.get_statistics()['pages'], 0)
+        self.assertEqual(decoder.get_statistics()['average_decode_seconds'], 0.0)
+
+    def test_unknown_backend_raises(self):
+        self.assertRaises(ValueError, Decoder, 'yaml')
+
+    def test_auto_backend_falls_back_to_stdlib(self):
+        installed = decoder_module.orjson
+        decoder_module.orjson = None
+        try:
+            self.assertEqual(Decoder('auto').get_backend(), 'json')
+            self.assertRaises(ValueError, Decoder, 'orjson')
+        finally:
+            decoder_module.orjson = installed
+
+    @unittest.skipIf(decoder_module.orjson is None, "orjson not installed")
+    def test_orjson_backend_matches_stdlib(self):
+        decoder = Decoder('orjson')
+        self.assertEqual(decoder.get_backend(), 'orjson')
+        self.assertEqual(decoder.decode(json.dumps(page).encode()), page)
+        self.assertRaises(json.JSONDecodeError, decoder.decode, b'not json')
+
+    def test_transactions_use_the_supplied_decoder(self):
+        decoder = Decoder()
+        transactions = Transactions(rate_limiter=RateLimiter(), decoder=decoder)
+        success, result, status = transactions._check_response(200, json.dumps(page).encode())
+        self.assertIs(success, True)
+        self.assertEqual(decoder.get_statistics()['pages'], 1)
+
+
+class PreviewingResponses(unittest.TestCase):
+    def test_short_values_are_unchanged(self):
+        self.assertEqual(preview(b'short'), 'short')
+        self.assertEqual(preview('short'), 'short')
+
+    def test_long_values_are_truncated(self):
+        limit = settings.whale_error_preview_length
+        self.assertEqual(preview('a' * (limit * 10)), 'a' * limit + '...')
+        self.assertEqual(preview(b'a' * (limit * 10)), 'a' * limit + '...')
+        self.assertLess(len(preview({'transactions': [{'id': str(i)} for i in range(10000)]})), limit)
@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+import asyncio
+import logging
+from whalealert.api.ratelimit import RateLimiter, get_rate_limiter
+from whalealert.api.transactions import Transactions
+
+logging.disable(logging.CRITICAL)
+
+
+class TokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unlimited_limiter_never_waits(self):
+        limiter = RateLimiter()
+        waits = [limiter.acquire() for i in range(100)]
+        self.assertEqual(waits, [0.0] * 100)
+        self.assertEqual(self.sleep.call_count, 0)
+        self.assertEqual(limiter.get_statistics()['calls'], 100)
+
+    def test_burst_is_allowed_without_waiting(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=3)
+        waits = [limiter.acquire() for i in range(3)]
+        self.assertEqual(waits, [0.0] * 3)
+
+    def test_waits_queue_behind_each_other_once_bucket_is_empty(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+        waits = [limiter.acquire() for i in range(3)]
+        self.assertEqual(waits, [0.0, 1.0, 2.0])
+        self.assertEqual(self.sleep.mock_calls, [mock.call(1.0), mock.call(2.0)])
+
+    def test_bucket_refills_over_time(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.now += 1.5
+        self.assertEqual(limiter.acquire(), 0.0)
+        self.assertAlmostEqual(limiter.acquire(), 0.5)
+
+    def test_bucket_never_holds_more_than_burst(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=2)
+        self.now += 1000
+        self.assertEqual(limiter.get_statistics()['tokens_available'], 2)
+
+    def test_wait_statistics(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+        for i in range(3):
+            limiter.acquire()
+        statistics = limiter.get_statistics()
+        self.assertEqual(statistics['calls'], 3)
+        self.assertEqual(statistics['throttled_calls'], 2)
+        self.assertEqual(statistics['total_wait_seconds'], 3.0)
+        self.assertEqual(statistics['max_wait_seconds'], 2.0)
+        self.assertEqual(statistics['average_wait_seconds'], 1.0)
+        self.assertEqual(statistics['calls_last_minute'], 3)
+        self.assertEqual(statistics['tokens_available'], 0)
+        self.assertEqual(statistics['requests_per_minute'], 60)
+
+    def test_calls_last_minute_expire(self):
+        limiter = RateLimiter()
+        limiter.acquire()
+        self.now += 61
+        limiter.acquire()
+        self.assertEqual(limiter.get_statistics()['calls_last_minute'], 1)
+
+    def test_reset_statistics(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+        limiter.acquire()
+        limiter.acquire()
+        limiter.reset_statistics()
+        self.assertEqual(limiter.get_statistics()['calls'], 0)
+        self.assertEqual(limiter.get_statistics()['total_wait_seconds'], 0.0)
+
+    def test_bad_burst_raises(self):
+        self.assertRaises(ValueError, RateLimiter, 60, 0)
+
+    def test_async_acquire_waits_on_event_loop(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+        waits = []
+
+        async def fake_sleep(delay):
+            waits.append(delay)
+
+        async def acquire_twice():
+            await limiter.acquire_async()
+            await limiter.acquire_async()
+
+        with mock.patch('asyncio.sleep', fake_sleep):
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(acquire_twice())
+            loop.close()
+        self.assertEqual(waits, [1.0])
+        self.assertEqual(self.sleep.call_count, 0)
+
+
+class SharedLimiter(unittest.TestCase):
+    def test_transactions_use_the_process_wide_limiter_by_default(self):
+        self.assertIs(Transactions()._rate_limiter, get_rate_limiter())
+        self.assertIs(Transactions()._rate_limiter, Transactions()._rate_limiter)
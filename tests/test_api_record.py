@@ -0,0 +1,67 @@
+import unittest
+import pickle
+import whalealert.settings as settings
+from whalealert.api.record import Transaction
+
+flat = {
+    'blockchain': 'bitcoin',
+    'symbol': 'BTC',
+    'id': '662472177',
+    'transaction_type': 'transfer',
+    'hash': '8d5ae34805f70d0a412964dca4dbd3f48bc103700686035a61b293cb91fe750d',
+    'from_address': 'f2103b01cd7957f3a9d9726bbb74c0ccd3f355d3',
+    'from_owner': '',
+    'from_owner_type': 'unknown',
+    'to_address': '3f5ce5fbfe3e9af3971dd833d26ba9b5c936f0be',
+    'to_owner': 'binance',
+    'to_owner_type': 'exchange',
+    'timestamp': 1588874414,
+    'amount': 3486673,
+    'amount_usd': 3508660.2,
+    'transaction_count': 1
+}
+
+
+class UsingTransactionRecords(unittest.TestCase):
+    def setUp(self):
+        self.record = Transaction.from_dict(flat)
+
+    def test_fields_match_database_columns(self):
+        self.assertEqual(Transaction.FIELDS, tuple(settings.database_columns.keys()))
+
+    def test_records_have_no_instance_dictionary(self):
+        self.assertFalse(hasattr(self.record, '__dict__'))
+
+    def test_attribute_and_key_access(self):
+        self.assertEqual(self.record.amount_usd, 3508660.2)
+        self.assertEqual(self.record['to_owner'], 'binance')
+        self.assertRaises(KeyError, self.record.__getitem__, 'from')
+
+    def test_dictionary_conversion(self):
+        self.assertEqual(self.record.to_dict(), flat)
+        self.assertEqual(dict(self.record), flat)
+
+    def test_row_is_in_table_column_order(self):
+        self.assertEqual(self.record.to_row(), [flat[column] for column in sorted(flat.keys())])
+
+    def test_api_format(self):
+        transaction = self.record.to_api_format()
+        self.assertEqual(transaction['from'], {'address': flat['from_address'], 'owner': '', 'owner_type': 'unknown'})
+        self.assertEqual(transaction['to']['owner'], 'binance')
+        self.assertNotIn('from_address', transaction)
+
+    def test_equality(self):
+        self.assertEqual(self.record, Transaction.from_dict(dict(flat)))
+        self.assertNotEqual(self.record, Transaction.from_dict(dict(flat, id='1')))
+
+    def test_records_can_be_pickled(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.record)), self.record)
+
+    def test_missing_and_extra_keys_raise(self):
+        missing = dict(flat)
+        del missing['hash']
+        self.assertRaises(KeyError, Transaction.from_dict, missing)
+        self.assertRaises(ValueError, Transaction.from_dict, dict(flat, bad_key=1))
+
+    def test_wrong_number_of_values_raises(self):
+        self.assertRaises(TypeError, Transaction, 'bitcoin')
@@ -0,0 +1,171 @@
+import unittest
+from unittest import mock
+import json
+import time
+import logging
+from requests import Session
+from requests.exceptions import Timeout
+import whalealert.settings as settings
+from whalealert.api.transactions import Transactions
+from whalealert.api.async_transactions import AsyncTransactions
+from whalealert.api.ratelimit import RateLimiter
+from whalealert.api.retry import RetryPolicy, CircuitBreaker
+from tests.fakes import make_response, FakeAsyncResponse, FakeAsyncSession, no_sleep, run
+
+logging.disable(logging.CRITICAL)
+
+text_empty = json.dumps({"result": "success", "cursor": "2712e8b6-2712e8b6-5eafc647", "count": 0})
+text_limited = json.dumps({"result": "error", "message": "usage limit reached"})
+
+
+class BackingOff(unittest.TestCase):
+    def test_delay_doubles_each_attempt(self):
+        policy = RetryPolicy(max_retries=4, base_delay=1, max_delay=100, jitter=0)
+        self.assertEqual([policy.get_delay(attempt) for attempt in range(1, 5)], [1, 2, 4, 8])
+
+    def test_delay_is_capped(self):
+        policy = RetryPolicy(max_retries=10, base_delay=1, max_delay=5, jitter=0)
+        self.assertEqual(policy.get_delay(8), 5)
+
+    def test_no_delay_once_retries_are_used(self):
+        policy = RetryPolicy(max_retries=2, jitter=0)
+        self.assertIsNone(policy.get_delay(3))
+
+    def test_jitter_stays_within_the_delay(self):
+        policy = RetryPolicy(max_retries=1, base_delay=10, max_delay=100, jitter=0.5)
+        for i in range(50):
+            delay = policy.get_delay(1)
+            self.assertGreaterEqual(delay, 5)
+            self.assertLessEqual(delay, 10)
+
+    def test_retry_after_sets_the_minimum_delay(self):
+        policy = RetryPolicy(max_retries=1, base_delay=1, max_delay=30, jitter=0)
+        self.assertEqual(policy.get_delay(1, retry_after=12), 12)
+
+    def test_retry_after_beyond_maximum_is_not_retried(self):
+        policy = RetryPolicy(max_retries=1, base_delay=1, max_delay=30, jitter=0)
+        self.assertIsNone(policy.get_delay(1, retry_after=31))
+
+    def test_retry_after_header_formats(self):
+        self.assertEqual(RetryPolicy.parse_retry_after('7'), 7)
+        self.assertIsNone(RetryPolicy.parse_retry_after(None))
+        self.assertIsNone(RetryPolicy.parse_retry_after('soon'))
+        self.assertEqual(RetryPolicy.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+    def test_retry_status_codes(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.should_retry_status(429))
+        self.assertTrue(policy.should_retry_status(503))
+        self.assertFalse(policy.should_retry_status(200))
+        self.assertFalse(policy.should_retry_status(401))
+
+    def test_bad_jitter_raises(self):
+        self.assertRaises(ValueError, RetryPolicy, jitter=2)
+
+
+class BreakingCircuit(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.patcher = mock.patch('whalealert.api.retry.time.monotonic', side_effect=lambda: self.now)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_opens_after_threshold_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_call())
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_call())
+        self.assertEqual(breaker.get_statistics()['skipped_calls'], 1)
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.CLOSED)
+
+    def test_half_open_trial_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        self.now += 60
+        self.assertTrue(breaker.allow_call())
+        self.assertEqual(breaker.get_state(), CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_call())
+        breaker.record_success()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for i in range(3):
+            breaker.record_failure()
+        self.now += 60
+        breaker.allow_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_call())
+
+
+class RetryingCalls(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        self.transactions = Transactions(rate_limiter=RateLimiter(),
+                                         retry_policy=RetryPolicy(max_retries=3, jitter=0),
+                                         circuit_breaker=self.breaker)
+        time.sleep = mock.MagicMock()
+
+    def make_request(self):
+        return self.transactions.get_transactions(123456, 234567, '123', None, 500000, 100)
+
+    def test_server_errors_are_retried(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.side_effect = [make_response(503, 'unavailable'), make_response(200, text_empty)]
+        success, transactions, status = self.make_request()
+        self.assertIs(success, True)
+        self.assertEqual(len(Session.get.call_args_list), 2)
+
+    def test_client_errors_are_not_retried(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.return_value = make_response(401, json.dumps({"result": "error", "message": "invalid api_key"}))
+        success, transactions, status = self.make_request()
+        self.assertEqual(len(Session.get.call_args_list), 1)
+        self.assertEqual(status[settings.status_file_option_error_code], 401)
+
+    def test_retry_after_is_honoured(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.side_effect = [make_response(429, text_limited, {'Retry-After': '20'}), make_response(200, text_empty)]
+        self.make_request()
+        time.sleep.assert_called_once_with(20)
+
+    def test_exhausted_rate_limit_reports_the_error(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.return_value = make_response(429, text_limited)
+        success, transactions, status = self.make_request()
+        self.assertIs(success, False)
+        self.assertEqual(len(Session.get.call_args_list), 4)
+        self.assertEqual(status[settings.status_file_option_error_code], 429)
+
+    def test_open_breaker_skips_calls(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.side_effect = Timeout
+        self.make_request()
+        self.make_request()
+        Session.get.reset_mock()
+        success, transactions, status = self.make_request()
+        self.assertIs(success, False)
+        self.assertEqual(len(Session.get.call_args_list), 0)
+        self.assertEqual(status[settings.status_file_option_error_code], 11)
+
+    def test_async_calls_share_the_policy(self):
+        session = FakeAsyncSession([FakeAsyncResponse(502, 'bad gateway'), FakeAsyncResponse(200, text_empty)])
+        transactions = AsyncTransactions(session=session,
+                                         rate_limiter=RateLimiter(),
+                                         retry_policy=RetryPolicy(max_retries=3, jitter=0),
+                                         circuit_breaker=self.breaker)
+        with mock.patch('asyncio.sleep', no_sleep):
+            success, data, status = run(transactions.get_transactions(123456, 234567, '123', None, 500000, 100))
+        self.assertIs(success, True)
+        self.assertEqual(len(session.calls), 2)
@@ -0,0 +1,147 @@
+import unittest
+import json
+import os
+import logging
+import tempfile
+from requests import Session
+import whalealert.settings as settings
+from whalealert.whalealert import WhaleAlert
+from whalealert.api.transactions import Transactions
+from whalealert.api.ratelimit import RateLimiter
+from whalealert.api.standin import StandInServer, synthetic_transactions, load_recorded
+
+logging.disable(logging.CRITICAL)
+
+# Other test modules replace Session.get, keep the real one for calls to the stand-in server
+REAL_SESSION_GET = Session.get
+
+START_TIME = 1588000000
+
+
+def make_transactions(count=250):
+    return synthetic_transactions(count, START_TIME, START_TIME + count - 1)
+
+
+class GeneratingTransactions(unittest.TestCase):
+    def test_transactions_are_ordered_within_the_window(self):
+        transactions = make_transactions()
+        timestamps = [transaction['timestamp'] for transaction in transactions]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(timestamps[0], START_TIME)
+        self.assertEqual(timestamps[-1], START_TIME + 249)
+
+    def test_same_seed_gives_same_transactions(self):
+        self.assertEqual(make_transactions(10), make_transactions(10))
+        self.assertNotEqual(make_transactions(10), synthetic_transactions(10, START_TIME, START_TIME + 9, seed=1))
+
+    def test_recorded_pages_are_loaded(self):
+        transactions = make_transactions(4)
+        pages = [{"result": "success", "count": 2, "transactions": transactions[2:]},
+                 {"result": "success", "count": 2, "transactions": transactions[:2]}]
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'recorded.json')
+            with open(file_name, 'w') as recorded:
+                json.dump(pages, recorded)
+            self.assertEqual(load_recorded(file_name), transactions)
+
+
+class RespondingToRequests(unittest.TestCase):
+    def setUp(self):
+        self.transactions = make_transactions()
+        self.server = StandInServer(self.transactions)
+
+    def request(self, **query):
+        query.setdefault('api_key', 'key')
+        return self.server.respond(settings.whale_transactions_path, {k: str(v) for k, v in query.items()})
+
+    def test_page_starts_after_start_time(self):
+        status_code, body, headers = self.request(start=START_TIME + 9, limit=10)
+        self.assertEqual(status_code, 200)
+        self.assertEqual(body['count'], 10)
+        self.assertEqual(body['transactions'], self.transactions[10:20])
+
+    def test_cursor_continues_from_last_page(self):
+        status_code, first, headers = self.request(start=START_TIME - 1, limit=100)
+        status_code, second, headers = self.request(start=0, cursor=first['cursor'], limit=100)
+        self.assertEqual(second['transactions'], self.transactions[100:200])
+
+    def test_end_time_is_inclusive(self):
+        status_code, body, headers = self.request(start=START_TIME - 1, end=START_TIME + 4)
+        self.assertEqual(body['transactions'], self.transactions[:5])
+
+    def test_empty_page_keeps_cursor_and_has_no_transactions(self):
+        status_code, body, headers = self.request(start=START_TIME + 1000)
+        self.assertEqual(body['count'], 0)
+        self.assertNotIn('transactions', body)
+        status_code, repeat, headers = self.request(start=0, cursor=body['cursor'])
+        self.assertEqual(repeat['cursor'], body['cursor'])
+
+    def test_limit_is_capped_at_page_size(self):
+        server = StandInServer(self.transactions, page_size=20)
+        status_code, body, headers = server.respond(settings.whale_transactions_path,
+                                                    {'api_key': 'key', 'start': '0', 'limit': '100'})
+        self.assertEqual(body['count'], 20)
+
+    def test_min_value_and_currency_filter_transactions(self):
+        status_code, body, headers = self.request(start=0, min_value=1000000, currency='usdt', limit=100)
+        expected = [t for t in self.transactions if t['amount_usd'] >= 1000000 and t['symbol'] == 'usdt']
+        self.assertEqual(body['transactions'], expected[:100])
+
+    def test_bad_requests_are_rejected(self):
+        self.assertEqual(self.request(start=0, cursor='zz')[0], 400)
+        self.assertEqual(self.server.respond(settings.whale_transactions_path, {'start': '0'})[0], 400)
+        self.assertEqual(self.server.respond('/v1/status', {'api_key': 'key'})[0], 404)
+        self.assertEqual(self.server.get_statistics()['rejected'], 3)
+
+    def test_bursts_are_throttled(self):
+        server = StandInServer(self.transactions, burst_every=3, burst_length=2)
+        codes = [server.respond(settings.whale_transactions_path, {'api_key': 'key', 'start': '0'}) for i in range(10)]
+        self.assertEqual([code for code, body, headers in codes], [200, 200, 200, 429, 429] * 2)
+        self.assertEqual(codes[3][2], {'Retry-After': str(settings.standin_retry_after_seconds)})
+        self.assertEqual(server.get_statistics()['throttled'], 4)
+
+    def test_error_rate_fails_requests(self):
+        server = StandInServer(self.transactions, error_rate=1)
+        status_code, body, headers = server.respond(settings.whale_transactions_path, {'api_key': 'key', 'start': '0'})
+        self.assertEqual(status_code, 500)
+        self.assertEqual(body, {'result': 'error', 'message': 'internal server error'})
+
+    def test_bad_options_raise(self):
+        self.assertRaises(ValueError, StandInServer, self.transactions, error_rate=2)
+        self.assertRaises(ValueError, StandInServer, self.transactions, page_size=0)
+
+
+class CallingTheStandInServer(unittest.TestCase):
+    def setUp(self):
+        self.transactions = make_transactions()
+        self.server = StandInServer(self.transactions)
+        self.server.start()
+        self.mocked_get = Session.get
+        Session.get = REAL_SESSION_GET
+
+    def tearDown(self):
+        Session.get = self.mocked_get
+        self.server.stop()
+
+    def test_pages_are_followed_with_cursors(self):
+        transactions = Transactions(rate_limiter=RateLimiter(), base_url=self.server.get_base_url())
+        received = []
+        cursor = None
+        for i in range(4):
+            success, page, status = transactions.get_transactions(START_TIME - 1, None, 'key', cursor, 0, 100)
+            self.assertIs(success, True)
+            received.extend(page)
+            cursor = transactions.get_last_cursor()
+        self.assertEqual([record.id for record in received], [t['id'] for t in self.transactions])
+        self.assertEqual(self.server.get_statistics()['pages'], 4)
+
+    def test_whale_alert_uses_configured_base_url(self):
+        with tempfile.TemporaryDirectory() as directory:
+            whale = WhaleAlert(directory)
+            config = whale.get_configuration()
+            config.set_value(settings.API_section_name, settings.API_option_base_url, self.server.get_base_url())
+            config.write_configuration_file()
+            whale = WhaleAlert(directory)
+            success, transactions, status = whale.get_transactions(START_TIME - 1, api_key='key', min_value=0)
+        self.assertIs(success, True)
+        self.assertEqual(len(transactions), 100)
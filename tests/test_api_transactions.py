@@ -3,11 +3,12 @@ from unittest import mock
 import json
 import time
 import logging
-from requests.models import Response
 from requests import Session
 from requests.exceptions import Timeout, TooManyRedirects
 import whalealert.settings as settings
 from whalealert.api.transactions import Transactions
+from whalealert.api.ratelimit import RateLimiter
+from tests.fakes import make_response
 
 logging.disable(logging.CRITICAL)
 
@@ -152,17 +153,16 @@ text_success_bad_key = {
         "transaction_count": 1
     }]
 }
-text_bad_json = 'not a good json format'
+text_bad_json = b'not a good json format'
 
 
 class WhaleAlertAPI(unittest.TestCase):
     def setUp(self):
-        self.transactions = Transactions()
+        self.rate_limiter = RateLimiter()
+        self.transactions = Transactions(rate_limiter=self.rate_limiter)
 
     def test_correctly_formed_api_call_minimum_parameters(self):
-        r = Response
-        r.status_code = 200
-        r.text = text_empty
+        r = make_response(200, json.dumps(text_empty).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
 
@@ -187,9 +187,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(expected, Session.get.mock_calls)
 
     def test_correctly_formed_api_call_all_parameters(self):
-        r = Response
-        r.status_code = 200
-        r.text = text_empty
+        r = make_response(200, json.dumps(text_empty).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
 
@@ -252,9 +250,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(success, False)
 
     def test_bad_json_response_handled_ok(self):
-        r = Response
-        r.status_code = 200
-        r.text = text_bad_json
+        r = make_response(200, text_bad_json)
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -262,9 +258,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 5)
 
     def test_parsing_error_response(self):
-        r = Response
-        r.status_code = 401
-        r.text = json.dumps(text_error)
+        r = make_response(401, json.dumps(text_error).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -272,9 +266,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 401)
 
     def test_parsing_error_response_bad_key(self):
-        r = Response
-        r.status_code = 401
-        r.text = json.dumps(text_error_bad_key)
+        r = make_response(401, json.dumps(text_error_bad_key).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -282,9 +274,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 7)
 
     def test_parsing_good_response_no_transactions(self):
-        r = Response
-        r.status_code = 200
-        r.text = json.dumps(text_empty)
+        r = make_response(200, json.dumps(text_empty).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -292,9 +282,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 200)
 
     def test_parsing_good_response_no_transactions_bad_key(self):
-        r = Response
-        r.status_code = 200
-        r.text = json.dumps(text_empty_bad_key)
+        r = make_response(200, json.dumps(text_empty_bad_key).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -302,9 +290,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 9)
 
     def test_parsing_good_response_with_transactions_wrong_count(self):
-        r = Response
-        r.status_code = 200
-        r.text = json.dumps(text_success_bad_count)
+        r = make_response(200, json.dumps(text_success_bad_count).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -312,9 +298,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 8)
 
     def test_parsing_good_response_with_transactions(self):
-        r = Response
-        r.status_code = 200
-        r.text = json.dumps(text_success)
+        r = make_response(200, json.dumps(text_success).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -322,12 +306,29 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 200)
         self.assertGreaterEqual(self.transactions.get_last_timestamp(), int(time.time()) - 1)
         self.assertEqual(self.transactions.get_last_cursor(), text_success['cursor'])
-        self.assertEqual(transactions[1], text_success['transactions'][1])
+        expected = {
+            'blockchain': 'ethereum',
+            'symbol': 'USDT',
+            'id': '655553158',
+            'transaction_type': 'transfer',
+            'hash': '19a393cb0fe2cd5975a3741e43f05859877b639b1c93dd19acd4abfa08715530',
+            'from_address': 'df38a19aa5db1f15c6df389d86175285d45fa572',
+            'from_owner': 'stuart',
+            'from_owner_type': 'exchange',
+            'to_address': '80c6e081ae5813b163357774003d3695faa0f53e',
+            'to_owner': 'stuart',
+            'to_owner_type': 'exchange',
+            'timestamp': 1588578065,
+            'amount': 500000,
+            'amount_usd': 509513.7,
+            'transaction_count': 1
+        }
+        self.assertEqual(transactions[1].to_dict(), expected)
+        self.assertEqual(transactions[0]['symbol'], 'USDT')
+        self.assertEqual(transactions[0]['from_owner'], '')
 
     def test_parsing_good_response_with_transactions_bad_key(self):
-        r = Response
-        r.status_code = 200
-        r.text = json.dumps(text_success_bad_key)
+        r = make_response(200, json.dumps(text_success_bad_key).encode())
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         success, transactions, status = self.make_nomral_request()
@@ -335,9 +336,7 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 10)
 
     def test_bad_unknown_json_parse_error_handled(self):
-        r = Response
-        r.status_code = 200
-        r.text = text_bad_json
+        r = make_response(200, text_bad_json)
         Session.get = mock.MagicMock().method()
         Session.get.return_value = (r)
         old_jsonload = json.loads
@@ -348,6 +347,20 @@ class WhaleAlertAPI(unittest.TestCase):
         self.assertEqual(status[settings.status_file_option_error_code], 6)
         json.loads = old_jsonload
 
+    def test_every_attempt_waits_on_the_rate_limiter(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.side_effect = Timeout
+        time.sleep = mock.MagicMock()
+        self.make_nomral_request()
+        self.assertEqual(self.rate_limiter.get_statistics()['calls'], settings.whale_retries_on_failure + 1)
+
+    def test_transport_statistics_errors_are_not_reported_as_call_errors(self):
+        Session.get = mock.MagicMock().method()
+        Session.get.return_value = make_response(200, json.dumps(text_empty).encode())
+        self.transactions._transport_statistics.record = mock.MagicMock(side_effect=KeyError('statistics'))
+        self.assertRaises(KeyError, self.make_nomral_request)
+        self.assertEqual(len(Session.get.mock_calls), 1)
+
     def make_nomral_request(self):
         api_key = '123'
         start_time = 123456
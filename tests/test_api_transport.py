@@ -0,0 +1,111 @@
+import unittest
+from unittest import mock
+import gzip
+import json
+import logging
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from requests import Session
+import whalealert.settings as settings
+from whalealert.api.transactions import Transactions
+from whalealert.api.transport import make_session, TransportStatistics
+from whalealert.api.ratelimit import RateLimiter
+
+logging.disable(logging.CRITICAL)
+
+# Other test modules replace Session.get, keep the real one for calls to the local server
+REAL_SESSION_GET = Session.get
+
+page = json.dumps({"result": "success", "cursor": "abcd", "count": 0, "padding": "x" * 2000}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = page
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MakingSessions(unittest.TestCase):
+    def test_compression_is_requested(self):
+        self.assertEqual(make_session().headers['Accept-Encoding'], 'gzip, deflate')
+
+    def test_pool_size_is_applied(self):
+        session = make_session(pool_size=7)
+        self.assertEqual(session.get_adapter('https://api.whale-alert.io')._pool_maxsize, 7)
+
+    def test_keep_alive_can_be_disabled(self):
+        self.assertEqual(make_session(keep_alive=True).headers['Connection'], 'keep-alive')
+        self.assertEqual(make_session(keep_alive=False).headers['Connection'], 'close')
+
+    def test_bad_pool_size_raises(self):
+        self.assertRaises(ValueError, make_session, pool_size=0)
+
+    def test_mocked_responses_are_not_recorded(self):
+        statistics = TransportStatistics()
+        statistics.record(make_session(), mock.MagicMock(spec=['status_code', 'content']), 0.1)
+        self.assertEqual(statistics.get_statistics()['calls'], 0)
+
+
+class RecordingTransportStatistics(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        url = 'http://127.0.0.1:{}/v1/transactions'.format(self.server.server_address[1])
+        self.url_patch = mock.patch.object(settings, 'whale_get_transactions_url', url)
+        self.url_patch.start()
+        self.mocked_get = Session.get
+        Session.get = REAL_SESSION_GET
+
+    def tearDown(self):
+        Session.get = self.mocked_get
+        self.url_patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_calls(self, transactions, calls):
+        for i in range(calls):
+            success, result, status = transactions.get_transactions(0, None, '123', None, 500000, 100)
+            self.assertIs(success, True)
+        return transactions.get_transport_statistics()
+
+    def test_connection_is_reused_between_calls(self):
+        statistics = self.make_calls(Transactions(rate_limiter=RateLimiter()), 3)
+        self.assertEqual(statistics['calls'], 3)
+        self.assertEqual(statistics['new_connections'], 1)
+        self.assertEqual(statistics['reused_connections'], 2)
+
+    def test_no_keep_alive_opens_a_connection_per_call(self):
+        statistics = self.make_calls(Transactions(rate_limiter=RateLimiter(), keep_alive=False), 2)
+        self.assertEqual(statistics['new_connections'], 2)
+        self.assertEqual(statistics['reused_connections'], 0)
+
+    def test_compressed_and_decoded_bytes_are_counted(self):
+        statistics = self.make_calls(Transactions(rate_limiter=RateLimiter()), 2)
+        self.assertEqual(statistics['compressed_responses'], 2)
+        self.assertEqual(statistics['decoded_bytes'], 2 * len(page))
+        self.assertEqual(statistics['wire_bytes'], 2 * len(gzip.compress(page)))
+        self.assertGreater(statistics['compression_saving'], 0.5)
+
+    def test_timing_is_recorded(self):
+        statistics = self.make_calls(Transactions(rate_limiter=RateLimiter()), 1)
+        self.assertGreater(statistics['total_ttfb_seconds'], 0)
+        self.assertGreaterEqual(statistics['total_seconds'], statistics['total_ttfb_seconds'])
+        self.assertEqual(statistics['average_seconds'], statistics['total_seconds'])
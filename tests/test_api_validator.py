@@ -0,0 +1,113 @@
+import unittest
+import copy
+import logging
+import whalealert.settings as settings
+from whalealert.api.validator import TransactionValidator, ValidationError
+
+logging.disable(logging.CRITICAL)
+
+transaction = {
+    "blockchain": "ethereum",
+    "symbol": "usdt",
+    "id": "655552612",
+    "transaction_type": "transfer",
+    "hash": "4cdfc57c737b4214fbce384e57f50d8b52f80c2eb470654f9fdc2062c534bf42",
+    "from": {
+        "address": "477b8d5ef7c2c42db84deb555419cd817c336b6f",
+        "owner_type": "unknown",
+        "owner": "ignored"
+    },
+    "to": {
+        "address": "b3fe1649862d7889ab002e0224a2db54870eafa9",
+        "owner_type": "exchange",
+        "owner": "binance"
+    },
+    "timestamp": 1588578025,
+    "amount": 500000,
+    "amount_usd": 503430.84,
+    "transaction_count": 1
+}
+
+
+def make_page(transactions, count=None):
+    count = len(transactions) if count is None else count
+    return {"result": "success", "cursor": "abcd", "count": count, "transactions": transactions}
+
+
+class ValidatingTransactions(unittest.TestCase):
+    def setUp(self):
+        self.validator = TransactionValidator()
+
+    def test_transaction_is_flattened_to_database_columns(self):
+        record = self.validator.validate(transaction)
+        self.assertEqual(sorted(record.keys()), sorted(settings.database_columns.keys()))
+        self.assertEqual(record['from_address'], transaction['from']['address'])
+        self.assertEqual(record['to_owner'], 'binance')
+        self.assertEqual(record['to_owner_type'], 'exchange')
+
+    def test_symbol_is_upper_cased(self):
+        self.assertEqual(self.validator.validate(transaction)['symbol'], 'USDT')
+
+    def test_unknown_owner_is_blanked(self):
+        self.assertEqual(self.validator.validate(transaction)['from_owner'], '')
+
+    def test_original_transaction_is_not_modified(self):
+        original = copy.deepcopy(transaction)
+        self.validator.validate(transaction)
+        self.assertEqual(transaction, original)
+
+    def test_missing_owner_for_known_owner_type_fails(self):
+        bad = copy.deepcopy(transaction)
+        del bad['to']['owner']
+        with self.assertRaises(ValidationError) as context:
+            self.validator.validate(bad)
+        self.assertEqual(context.exception.error_code, 10)
+
+    def test_missing_owner_for_unknown_owner_type_is_allowed(self):
+        good = copy.deepcopy(transaction)
+        del good['from']['owner']
+        self.assertEqual(self.validator.validate(good)['from_owner'], '')
+
+    def test_every_required_field_is_checked(self):
+        for key in ['blockchain', 'symbol', 'id', 'transaction_type', 'hash', 'from', 'to', 'timestamp', 'amount',
+                    'amount_usd', 'transaction_count']:
+            bad = copy.deepcopy(transaction)
+            del bad[key]
+            self.assertRaises(ValidationError, self.validator.validate, bad)
+
+    def test_api_format_round_trip(self):
+        expected = copy.deepcopy(transaction)
+        expected['symbol'] = 'USDT'
+        expected['from']['owner'] = ''
+        self.assertEqual(self.validator.validate(transaction).to_api_format(), expected)
+
+
+class ValidatingPages(unittest.TestCase):
+    def setUp(self):
+        self.validator = TransactionValidator()
+
+    def test_page_returns_cursor_and_records(self):
+        cursor, records = self.validator.validate_page(make_page([transaction, transaction]))
+        self.assertEqual(cursor, 'abcd')
+        self.assertEqual(len(records), 2)
+
+    def test_empty_page_needs_no_transactions_key(self):
+        self.assertEqual(self.validator.validate_page({"result": "success", "cursor": "abcd", "count": 0}),
+                         ('abcd', []))
+
+    def test_count_mismatch(self):
+        with self.assertRaises(ValidationError) as context:
+            self.validator.validate_page(make_page([transaction], count=2))
+        self.assertEqual(context.exception.error_code, 8)
+
+    def test_missing_main_keys(self):
+        page = make_page([transaction])
+        del page['cursor']
+        with self.assertRaises(ValidationError) as context:
+            self.validator.validate_page(page)
+        self.assertEqual(context.exception.error_code, 9)
+
+    def test_missing_transactions_key(self):
+        with self.assertRaises(ValidationError) as context:
+            self.validator.validate_page({"result": "success", "cursor": "abcd", "count": 1})
+        self.assertEqual(context.exception.error_code, 9)
@@ -0,0 +1,71 @@
+import unittest
+import os
+import sqlite3
+import logging
+import tempfile
+import threading
+import whalealert.settings as settings
+import whalealert.publisher.connection as connection
+from whalealert.api.record import Transaction
+
+logging.disable(logging.CRITICAL)
+
+
+def make_row(index):
+    values = {column: '' for column in Transaction.FIELDS}
+    values.update(blockchain='bitcoin', id=str(index), timestamp=1588000000 + index, amount=1, amount_usd=1,
+                  transaction_count=1)
+    return Transaction.from_dict(values).to_row()
+
+
+class OpeningConnections(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_location = os.path.join(self.directory.name, settings.database_file_name)
+        self.writer = connection.open_writer(self.file_location)
+        self.writer.create_table('bitcoin', settings.database_columns)
+        self.writer.insert('bitcoin', make_row(0))
+        self.reader = connection.open_reader(self.file_location)
+
+    def tearDown(self):
+        self.reader.con.close()
+        self.writer.con.close()
+        self.directory.cleanup()
+
+    def count_rows(self, database):
+        return database.con.execute("SELECT COUNT(*) FROM bitcoin").fetchone()[0]
+
+    def test_writer_uses_wal_and_tuned_pragmas(self):
+        self.assertIs(self.writer.exists(), True)
+        self.assertEqual(connection.get_journal_mode(self.writer.con), 'wal')
+        self.assertEqual(self.writer.con.execute("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(self.writer.con.execute("PRAGMA cache_size").fetchone()[0], -settings.database_cache_size_kib)
+
+    def test_reader_cannot_write(self):
+        self.assertIs(self.reader.exists(), True)
+        self.assertEqual(self.count_rows(self.reader), 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.reader.con.execute("DELETE FROM bitcoin")
+        self.assertEqual(self.reader.create_table('ethereum', settings.database_columns), [])
+
+    def test_open_query_does_not_block_writes(self):
+        self.reader.con.execute("BEGIN")
+        self.assertEqual(self.count_rows(self.reader), 1)
+        self.writer.con.execute("PRAGMA busy_timeout = 0")
+        self.writer.insert('bitcoin', make_row(1))
+        self.assertEqual(self.count_rows(self.writer), 2)
+        self.assertEqual(self.count_rows(self.reader), 1)
+        self.reader.con.execute("COMMIT")
+        self.assertEqual(self.count_rows(self.reader), 2)
+
+    def test_connections_can_move_between_threads(self):
+        counts = []
+        thread = threading.Thread(target=lambda: counts.append(self.count_rows(self.reader)))
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [1])
+
+    def test_missing_database_is_not_created_for_reading(self):
+        missing = os.path.join(self.directory.name, 'missing.db')
+        self.assertIsNone(connection.open_reader(missing))
+        self.assertIs(os.path.exists(missing), False)
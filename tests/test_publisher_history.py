@@ -0,0 +1,96 @@
+import unittest
+import os
+import logging
+import tempfile
+from dbops.sqhelper import SQHelper
+import whalealert.settings as settings
+from whalealert.publisher.history import CallHistory
+
+logging.disable(logging.CRITICAL)
+NOW = 1588000000.0
+
+
+class SummarisingCalls(unittest.TestCase):
+    def setUp(self):
+        self.history = CallHistory(windows={'5m': 300, '1h': 3600})
+
+    def test_empty_history(self):
+        summary = self.history.get_summary(NOW)
+        self.assertEqual(summary['5m'], {'calls': 0, 'health': 100.0, 'errors': {}, 'rows': 0, 'p50_seconds': None,
+                                         'p99_seconds': None})
+
+    def test_calls_are_counted_in_each_window(self):
+        self.history.record(NOW - 1000, 0.1, 200, 5)
+        self.history.record(NOW - 100, 0.1, 429, 0)
+        self.history.record(NOW - 10, 0.1, 200, 3)
+        summary = self.history.get_summary(NOW)
+        self.assertEqual(summary['5m']['calls'], 2)
+        self.assertEqual(summary['5m']['health'], 50.0)
+        self.assertEqual(summary['5m']['errors'], {429: 1})
+        self.assertEqual(summary['5m']['rows'], 3)
+        self.assertEqual(summary['1h']['calls'], 3)
+        self.assertEqual(summary['1h']['rows'], 8)
+
+    def test_old_calls_expire(self):
+        self.history.record(NOW, 0.1, 1, 0)
+        summary = self.history.get_summary(NOW + 301)
+        self.assertEqual(summary['5m']['calls'], 0)
+        self.assertEqual(summary['5m']['errors'], {})
+        self.assertEqual(summary['1h']['errors'], {1: 1})
+
+    def test_latency_percentiles(self):
+        for index in range(99):
+            self.history.record(NOW, 0.1, 200, 0)
+        self.history.record(NOW, 5.0, 200, 0)
+        self.history.record(NOW, None, 2, 0)
+        summary = self.history.get_summary(NOW)['5m']
+        self.assertAlmostEqual(summary['p50_seconds'], 0.1, delta=0.03)
+        self.assertAlmostEqual(summary['p99_seconds'], 0.1, delta=0.03)
+        self.history.record(NOW, 5.0, 200, 0)
+        self.assertAlmostEqual(self.history.get_summary(NOW)['5m']['p99_seconds'], 5.0, delta=1.3)
+
+    def test_invalid_length(self):
+        self.assertRaises(ValueError, CallHistory, length=0)
+
+
+class PersistingTheRing(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = SQHelper(os.path.join(self.directory.name, settings.database_file_name))
+
+    def tearDown(self):
+        self.database.con.close()
+        self.directory.cleanup()
+
+    def stored_timestamps(self):
+        return sorted(row[0] for row in self.database.con.execute("SELECT timestamp FROM call_history"))
+
+    def test_only_the_newest_calls_are_kept(self):
+        history = CallHistory(self.database, length=5)
+        for index in range(7):
+            history.record(NOW + index, 0.1, 200, 1)
+        self.assertIs(history.persist(), True)
+        self.assertEqual(self.stored_timestamps(), [NOW + index for index in range(2, 7)])
+        self.assertEqual(history.get_summary(NOW + 10)['5m']['calls'], 5)
+
+    def test_history_survives_a_restart(self):
+        history = CallHistory(self.database, length=5)
+        for index in range(4):
+            history.record(NOW + index, 0.1, 200 if index % 2 else 7, 1)
+        history.persist()
+
+        restarted = CallHistory(self.database, length=5)
+        summary = restarted.get_summary(NOW + 10)['5m']
+        self.assertEqual(summary['calls'], 4)
+        self.assertEqual(summary['errors'], {7: 2})
+
+        for index in range(4, 7):
+            restarted.record(NOW + index, 0.1, 200, 1)
+        restarted.persist()
+        self.assertEqual(self.stored_timestamps(), [NOW + index for index in range(2, 7)])
+
+    def test_no_table_is_created_until_calls_are_persisted(self):
+        history = CallHistory(self.database)
+        self.assertIs(history.persist(), True)
+        self.assertEqual(history.get_summary(NOW)['24h']['calls'], 0)
+        self.assertEqual(self.database.get_table_names(), [])
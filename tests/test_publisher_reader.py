@@ -7,7 +7,8 @@ import datetime
 import pandas as pd
 import whalealert.settings as settings
 from whalealert.publisher.writer import Writer
-from whalealert.publisher.reader import Reader
+from whalealert.publisher.reader import Reader, get_timezone, parse_local_time
+import whalealert.publisher.schema as schema
 from whalealert.whalealert import WhaleAlert
 
 logging.disable(logging.CRITICAL)
@@ -132,7 +133,11 @@ expected_pretty_huge_sum = '\x1b[33m{} \x1b[0m\x1b[37m500000000.00 \x1b[31mUSDT
 
 def cleanup_working_directories():
     try:
-        os.remove(os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.database_file_name))
+        database_file = os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.database_file_name)
+        for wal_file in [database_file + '-wal', database_file + '-shm']:
+            if os.path.exists(wal_file):
+                os.remove(wal_file)
+        os.remove(database_file)
         os.remove(os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.status_file_name))
         os.remove(os.path.join(TEST_WORKING_DIR, settings.input_configuation_filename))
         os.removedirs(os.path.join(TEST_WORKING_DIR, settings.data_file_directory))
@@ -180,6 +185,23 @@ def format_output(data, as_dict=False):
             ) + " USD) " + "transferred from " + data['from']['owner'] + ' to ' + data['to']['owner'] + '.\n'
 
 
+class CountingConnection():
+    """ Counts the rows read through each statement executed on a connection """
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows_read = []
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def execute(self, *args):
+        index = len(self.rows_read)
+        self.rows_read.append(0)
+        for row in self.connection.execute(*args):
+            self.rows_read[index] += 1
+            yield row
+
+
 class RequestingStatusByExchange(unittest.TestCase):
     def setUp(self):
         self.whale = WhaleAlert(working_directory=TEST_WORKING_DIR)
@@ -445,6 +467,202 @@ class RequestingStatusByExchange(unittest.TestCase):
         output = self.reader.data_request(request, as_df=True)
         pd.testing.assert_frame_equal(expected_output, output)
 
+    def make_transactions(self, count, symbol, first_timestamp):
+        transactions = []
+        for index in range(count):
+            transaction = dict(test_good_data[0], symbol=symbol, timestamp=first_timestamp + index)
+            transaction['id'] = '{}{}'.format(symbol, index)
+            transactions.append(transaction)
+        return transactions
+
+    def test_limit_applies_after_the_symbol_filter(self):
+        self.add_call_to_database(self.make_transactions(10, 'BTC', 1000) + self.make_transactions(10, 'USDT', 2000))
+        request = dict(settings.request_format)
+        request[settings.request_blockchain] = ['bitcoin']
+        request[settings.request_symbols] = ['BTC']
+        request[settings.request_maximum_results] = 3
+        request[settings.request_from_time] = 0
+        output = self.reader.data_request(request, as_df=True)
+        self.assertEqual(list(output[settings.database_column_timestamp]), [1007, 1008, 1009])
+
+    def test_negative_maximum_results_returns_every_result(self):
+        self.add_call_to_database(self.make_transactions(10, 'BTC', 1000))
+        request = dict(settings.request_format)
+        request[settings.request_blockchain] = ['*']
+        request[settings.request_symbols] = ['*']
+        request[settings.request_maximum_results] = -1
+        request[settings.request_from_time] = 1004
+        output = self.reader.data_request(request, as_df=True)
+        self.assertEqual(list(output[settings.database_column_timestamp]), list(range(1005, 1010)))
+
+    def test_each_table_returns_at_most_maximum_results_rows(self):
+        self.add_call_to_database(test_good_data + self.make_transactions(50, 'BTC', 1000))
+        request = dict(settings.request_format)
+        request[settings.request_blockchain] = ['*']
+        request[settings.request_symbols] = ['*']
+        request[settings.request_maximum_results] = 2
+        request[settings.request_from_time] = 0
+        connection = CountingConnection(self.whale.get_database().con)
+        with mock.patch.object(self.whale.get_database(), 'con', connection):
+            output = self.reader.data_request(request, as_df=True)
+        newest = sorted(transaction['timestamp'] for transaction in test_good_data)[-2:]
+        self.assertEqual(list(output[settings.database_column_timestamp]), newest)
+        self.assertNotEqual(connection.rows_read, [])
+        self.assertLessEqual(max(connection.rows_read), 2)
+
+
+class RequestingFromUnifiedTable(RequestingStatusByExchange):
+    """ The same requests, with the transactions migrated to the unified table """
+    def add_call_to_database(self, data):
+        self.writer.write_transactions(data)
+        schema.migrate_to_unified(self.whale.get_database())
+
+    def test_requests_are_answered_from_the_unified_table(self):
+        self.add_call_to_database(test_good_data)
+        self.assertEqual(self.whale.get_database().get_table_names(), [settings.database_unified_table])
+
+    def test_tables_left_during_a_migration_are_included(self):
+        self.add_call_to_database(test_good_data[:2])
+        database = self.whale.get_database()
+        database.create_table('neo', settings.database_columns)
+        database.insert('neo', flattern_transactions(test_good_data[3:4])[0])
+        request = dict(settings.request_format)
+        request[settings.request_blockchain] = ['*']
+        request[settings.request_symbols] = ['*']
+        request[settings.request_maximum_results] = 5
+        request[settings.request_from_time] = 0
+        output = self.reader.data_request(request, as_dict=True)
+        self.assertEqual(len(output), 3)
+
+
+class FormattingTransactionRecords(unittest.TestCase):
+    def setUp(self):
+        self.whale = WhaleAlert(working_directory=TEST_WORKING_DIR)
+        self.writer = Writer(self.whale.get_status(), self.whale.get_database())
+        self.reader = Reader(self.whale.get_status(), self.whale.get_database())
+
+    def tearDown(self):
+        cleanup_working_directories()
+
+    def test_records_format_the_same_as_dataframes(self):
+        self.writer.write_transactions(test_good_data)
+        records = self.writer.get_last_written_transactions()
+        df = pd.DataFrame([record.to_dict() for record in records])
+        for pretty in [False, True]:
+            for as_dict in [False, True]:
+                self.assertEqual(self.reader.transactions_to_output(records, pretty=pretty, as_dict=as_dict),
+                                 self.reader.dataframe_to_transaction_output(df, pretty=pretty, as_dict=as_dict))
+
+    def test_records_are_not_modified_by_formatting(self):
+        self.writer.write_transactions(test_good_data)
+        records = self.writer.get_last_written_transactions()
+        owners = [record.from_owner for record in records]
+        self.reader.transactions_to_output(records)
+        self.assertEqual([record.from_owner for record in records], owners)
+
+    def test_plain_lines_match_dictionary_output(self):
+        transactions = []
+        for index, (transaction_type, amount_usd) in enumerate([('transfer', 5e5), ('burn', 5e6), ('mint', 5e7)]):
+            transaction = dict(test_good_data[index], transaction_type=transaction_type, amount_usd=amount_usd)
+            transaction['from'] = dict(transaction['from'], owner='')
+            transactions.append(transaction)
+        self.writer.write_transactions(transactions)
+        df = pd.DataFrame([record.to_dict() for record in self.writer.get_last_written_transactions()])
+        lines = self.reader.dataframe_to_transaction_output(df).split('\n')
+        dictionaries = self.reader.dataframe_to_transaction_output(df, as_dict=True)
+        self.assertEqual(lines, [output['timestamp'] + ' ' + output['text'] for output in dictionaries])
+        self.assertEqual(len(self.reader.dataframe_to_transaction_output(df, pretty=True).split('\n')), 3)
+
+    def test_missing_columns_return_empty_result(self):
+        self.writer.write_transactions(test_good_data)
+        df = pd.DataFrame([record.to_dict() for record in self.writer.get_last_written_transactions()])
+        df = df.drop(columns=[settings.database_column_amount_usd])
+        self.assertEqual(self.reader.dataframe_to_transaction_output(df), '')
+        self.assertEqual(self.reader.dataframe_to_transaction_output(df, as_dict=True), [])
+
+    def test_malformed_rows_are_skipped(self):
+        self.writer.write_transactions(test_good_data)
+        df = pd.DataFrame([record.to_dict() for record in self.writer.get_last_written_transactions()])
+        good = df.drop(index=1).reset_index(drop=True)
+        df[settings.database_column_symbol] = df[settings.database_column_symbol].astype(object)
+        df.loc[1, settings.database_column_symbol] = None
+        for pretty in [False, True]:
+            for as_dict in [False, True]:
+                output = self.reader.dataframe_to_transaction_output(df, pretty=pretty, as_dict=as_dict)
+                self.assertEqual(output, self.reader.dataframe_to_transaction_output(good, pretty=pretty,
+                                                                                     as_dict=as_dict))
+                self.assertEqual(len(output if as_dict else output.split('\n')), len(df) - 1)
+
+    def test_no_records_returns_empty_result(self):
+        self.assertEqual(self.reader.transactions_to_output([]), '')
+        self.assertEqual(self.reader.transactions_to_output([], as_dict=True), [])
+
+
+class ConvertingTimestamps(unittest.TestCase):
+    def setUp(self):
+        self.whale = WhaleAlert(working_directory=TEST_WORKING_DIR)
+        self.writer = Writer(self.whale.get_status(), self.whale.get_database())
+        self.reader = Reader(self.whale.get_status(), self.whale.get_database())
+
+    def tearDown(self):
+        cleanup_working_directories()
+
+    def test_column_conversion_matches_single_conversion(self):
+        # Covers both daylight saving transitions of 2020 in Melbourne and New York
+        timestamps = list(range(1585400000, 1586200000, 997)) + list(range(1604000000, 1604400000, 991))
+        for timezone in [None, 'Australia/Melbourne', 'America/New_York']:
+            self.assertEqual(Reader.to_local_times(timestamps, timezone),
+                             [Reader.to_local_time(timestamp, timezone) for timestamp in timestamps])
+
+    def test_timezone_override(self):
+        self.assertEqual(Reader.to_local_time(1588874414, 'UTC'), '05/07/2020 18:00:14')
+        self.assertEqual(Reader.to_local_times([1588874414], 'Asia/Kolkata'), ['05/07/2020 23:30:14'])
+
+    def test_timezones_are_looked_up_once(self):
+        self.assertIs(get_timezone('Europe/London'), get_timezone('Europe/London'))
+        self.assertIs(get_timezone(), get_timezone(None))
+        self.assertRaises(ValueError, get_timezone, 'Not/A_Timezone')
+
+    def test_data_request_timezone_override(self):
+        self.writer.write_transactions(test_good_data[:1])
+        request = dict(settings.request_format)
+        request[settings.request_blockchain] = ['*']
+        request[settings.request_symbols] = ['*']
+        request[settings.request_from_time] = 0
+        request[settings.request_timezone] = 'UTC'
+        output = self.reader.data_request(request, as_dict=True)
+        self.assertEqual(output[0]['timestamp'], Reader.to_local_time(test_good_data[0]['timestamp'], 'UTC'))
+
+    def test_data_request_with_unknown_timezone_returns_empty_result(self):
+        self.writer.write_transactions(test_good_data[:1])
+        request = dict(settings.request_format)
+        request[settings.request_blockchain] = ['*']
+        request[settings.request_symbols] = ['*']
+        request[settings.request_from_time] = 0
+        request[settings.request_timezone] = 'Not/A_Timezone'
+        self.assertEqual(self.reader.data_request(request), '')
+
+
+class ParsingLocalTimes(unittest.TestCase):
+    def test_iso_times_are_local_times(self):
+        local = datetime.datetime(2020, 6, 1, 20, 21, 37)
+        self.assertEqual(parse_local_time('2020-06-01T20:21:37'), int(local.timestamp()))
+        self.assertEqual(parse_local_time('2020-06-01T20:21:37.859798'), int(local.timestamp()))
+        self.assertEqual(parse_local_time('2020-06-01 20:21:37'), int(local.timestamp()))
+
+    def test_other_formats_fall_back_to_dateutil(self):
+        self.assertEqual(parse_local_time('2020-06-01T20:21:37+00:00'), 1591042897)
+        self.assertEqual(parse_local_time('06/01/2020 20:21:37'), parse_local_time('2020-06-01T20:21:37'))
+
+    def test_matches_status_file_round_trip(self):
+        unix_time = int(time.time())
+        self.assertEqual(parse_local_time(datetime.datetime.fromtimestamp(unix_time).isoformat()), unix_time)
+        self.assertEqual(Reader.from_local_time(Reader.to_local_time(unix_time)), unix_time)
+
+    def test_invalid_times_raise(self):
+        self.assertRaises(ValueError, parse_local_time, 'not a time')
+        self.assertRaises(ValueError, parse_local_time, '2020-13-01T20:21:37')
+
 
 class GettingLoggerStatus(unittest.TestCase):
     def setUp(self):
@@ -501,6 +719,29 @@ class GettingLoggerStatus(unittest.TestCase):
         expected_status = {'last_call': last_good_call_minutes, 'health': health, 'status': 'Error'}
         self.assertEqual(expected_status, output)
 
+    def test_status_includes_call_history_windows(self):
+        reader = Reader(self.whale.get_status(), self.whale.get_database(), self.whale.get_configuration(),
+                        self.writer.get_call_history())
+        self.write_bad_status(int(time.time()) - 200)
+        self.write_good_status(int(time.time()) - 100)
+        windows = reader.status_request(as_dict=True)['windows']
+        self.assertEqual(list(windows.keys()), list(settings.call_history_windows.keys()))
+        self.assertEqual(windows['5m']['calls'], 2)
+        self.assertEqual(windows['5m']['errors'], {1: 1})
+        self.assertEqual(reader.status_request().splitlines()[1], "Last 5m: 2 calls, health 50.0%, errors 1: 1")
+
+    def test_status_uses_the_stored_unix_time(self):
+        self.write_good_status(int(time.time()) - 600)
+        self.whale.get_status().set_value(settings.status_file_last_good_call_section_name,
+                                          settings.status_file_option_unix_time, int(time.time()) - 60)
+        self.assertEqual(self.reader.status_request(as_dict=True)['last_call'], 1)
+
+    def test_status_without_unix_time_parses_the_time_string(self):
+        self.write_good_status(int(time.time()) - 600)
+        self.whale.get_status().set_value(settings.status_file_last_good_call_section_name,
+                                          settings.status_file_option_unix_time, 0)
+        self.assertEqual(self.reader.status_request(as_dict=True)['last_call'], 10)
+
     def test_request_status_with_no_working_directory_returns_none(self):
         reader = Reader()
         expected_status = None
@@ -0,0 +1,68 @@
+import unittest
+import threading
+from whalealert.publisher.ring import RingBuffer
+
+
+class ReadingTheRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = RingBuffer(4)
+
+    def test_each_subscriber_reads_every_item_once(self):
+        first = self.ring.subscribe()
+        second = self.ring.subscribe()
+        self.ring.extend([1, 2])
+        self.assertEqual(first.read(), [1, 2])
+        self.ring.extend([3])
+        self.assertEqual(first.read(), [3])
+        self.assertEqual(second.read(), [1, 2, 3])
+        self.assertEqual(first.read(), [])
+        self.assertEqual(second.get_statistics(), {'read': 3, 'overflow': 0})
+
+    def test_new_subscribers_start_after_existing_items(self):
+        self.ring.extend([1, 2])
+        self.assertEqual(self.ring.subscribe().read(), [])
+        self.assertEqual(self.ring.subscribe(from_oldest=True).read(), [1, 2])
+
+    def test_overflow_keeps_the_newest_items(self):
+        subscription = self.ring.subscribe()
+        self.ring.extend([1, 2, 3])
+        self.ring.extend([4, 5, 6])
+        self.assertEqual(subscription.read(), [3, 4, 5, 6])
+        self.assertEqual(subscription.get_statistics(), {'read': 4, 'overflow': 2})
+
+    def test_extending_by_more_than_the_capacity(self):
+        subscription = self.ring.subscribe()
+        self.ring.extend(range(10))
+        self.assertEqual(subscription.read(), [6, 7, 8, 9])
+        self.assertEqual(subscription.get_statistics()['overflow'], 6)
+
+    def test_reading_a_limited_number(self):
+        subscription = self.ring.subscribe()
+        self.ring.extend([1, 2, 3])
+        self.assertEqual(subscription.read(2), [1, 2])
+        self.assertEqual(subscription.read(2), [3])
+
+    def test_concurrent_readers_see_everything(self):
+        ring = RingBuffer(100000)
+        subscriptions = [ring.subscribe() for _ in range(3)]
+        results = [[] for _ in subscriptions]
+        done = threading.Event()
+
+        def consume(subscription, result):
+            while not done.is_set():
+                result.extend(subscription.read())
+            result.extend(subscription.read())
+
+        threads = [threading.Thread(target=consume, args=pair) for pair in zip(subscriptions, results)]
+        for thread in threads:
+            thread.start()
+        for start in range(0, 10000, 100):
+            ring.extend(range(start, start + 100))
+        done.set()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            self.assertEqual(result, list(range(10000)))
+
+    def test_invalid_capacity(self):
+        self.assertRaises(ValueError, RingBuffer, 0)
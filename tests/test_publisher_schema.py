@@ -0,0 +1,112 @@
+import unittest
+from unittest import mock
+import os
+import logging
+import tempfile
+from dbops.sqhelper import SQHelper
+import whalealert.settings as settings
+import whalealert.publisher.schema as schema
+from whalealert.api.record import Transaction
+
+logging.disable(logging.CRITICAL)
+
+
+def make_row(index, blockchain='bitcoin'):
+    values = {column: '' for column in Transaction.FIELDS}
+    values.update(blockchain=blockchain, id=str(index), timestamp=1588000000 + index, amount=1, amount_usd=1,
+                  transaction_count=1)
+    return Transaction.from_dict(values).to_row()
+
+
+class UpgradingDatabases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = SQHelper(os.path.join(self.directory.name, settings.database_file_name))
+        self.database.create_table('bitcoin', settings.database_columns)
+        for index in [1, 2, 2, 3]:
+            self.database.insert('bitcoin', make_row(index))
+
+    def tearDown(self):
+        self.database.con.close()
+        self.directory.cleanup()
+
+    def query_plan(self, statement):
+        return ' '.join(str(row) for row in self.database.con.execute("EXPLAIN QUERY PLAN " + statement))
+
+    def test_old_database_is_indexed_and_versioned(self):
+        self.assertEqual(schema.get_version(self.database.con), 0)
+        self.assertIs(schema.upgrade(self.database), True)
+        self.assertEqual(schema.get_version(self.database.con), settings.database_schema_version)
+        self.assertIn('bitcoin_timestamp', self.query_plan("SELECT * FROM bitcoin WHERE timestamp BETWEEN 1 AND 2"))
+        self.assertIn('bitcoin_timestamp', self.query_plan("SELECT * FROM bitcoin ORDER BY timestamp DESC LIMIT 1"))
+        self.assertIn('bitcoin_unique_id', self.query_plan("SELECT id FROM bitcoin WHERE id IN ('1')"))
+
+    def test_duplicates_are_removed(self):
+        schema.upgrade(self.database)
+        self.assertEqual(list(self.database.table_to_df('bitcoin')['id']), ['1', '2', '3'])
+
+    def test_upgrade_runs_once(self):
+        schema.upgrade(self.database)
+        with mock.patch.object(schema, 'add_missing_indexes') as add_missing_indexes:
+            self.assertIs(schema.upgrade(self.database), True)
+        add_missing_indexes.assert_not_called()
+
+    def test_failed_upgrade_is_retried(self):
+        self.database.con.execute("CREATE TABLE broken(value TEXT)")
+        self.assertIs(schema.upgrade(self.database), False)
+        self.assertEqual(schema.get_version(self.database.con), 0)
+        self.assertEqual(schema.add_missing_indexes(self.database, ['bitcoin']), [])
+
+
+class MigratingToTheUnifiedTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = SQHelper(os.path.join(self.directory.name, settings.database_file_name))
+        for blockchain in ['bitcoin', 'ethereum']:
+            self.database.create_table(blockchain, settings.database_columns)
+            for index in range(5):
+                self.database.insert(blockchain, make_row(index, blockchain))
+
+    def tearDown(self):
+        self.database.con.close()
+        self.directory.cleanup()
+
+    def test_rows_are_moved_and_old_tables_dropped(self):
+        self.assertEqual(schema.migrate_to_unified(self.database, chunk_rows=2), 10)
+        self.assertEqual(self.database.get_table_names(), [settings.database_unified_table])
+        self.assertIs(schema.is_unified(self.database), True)
+        df = self.database.table_to_df(settings.database_unified_table)
+        expected = [(blockchain, str(index)) for blockchain in ['bitcoin', 'ethereum'] for index in range(5)]
+        self.assertEqual(sorted(zip(df['blockchain'], df['id'])), sorted(expected))
+
+    def test_interrupted_migration_can_be_finished(self):
+        with mock.patch.object(schema, 'get_blockchain_tables', return_value=['bitcoin']):
+            schema.migrate_to_unified(self.database)
+        self.assertEqual(schema.get_blockchain_tables(self.database), ['ethereum'])
+        self.assertEqual(schema.get_transaction_tables(self.database), ['ethereum', settings.database_unified_table])
+        self.assertEqual(schema.migrate_to_unified(self.database), 5)
+        self.assertEqual(len(self.database.table_to_df(settings.database_unified_table)), 10)
+
+    def test_rows_already_in_the_unified_table_are_not_counted(self):
+        schema.create_unified_table(self.database)
+        self.database.insert(settings.database_unified_table, make_row(0, 'bitcoin'))
+        self.assertEqual(schema.migrate_to_unified(self.database, chunk_rows=2), 9)
+        self.assertEqual(self.database.get_table_names(), [settings.database_unified_table])
+        self.assertEqual(len(self.database.table_to_df(settings.database_unified_table)), 10)
+
+    def test_tables_are_checked_and_dropped_in_one_transaction(self):
+        statements = []
+        self.database.con.set_trace_callback(statements.append)
+        schema.migrate_to_unified(self.database)
+        self.database.con.set_trace_callback(None)
+        for table in ['bitcoin', 'ethereum']:
+            drop = statements.index("DROP TABLE {}".format(table))
+            begin = max(index for index in range(drop) if statements[index] == "BEGIN IMMEDIATE")
+            self.assertIn("FROM {} ORDER BY rowid".format(table), statements[begin + 1])
+            self.assertEqual(statements[begin + 2], "DROP TABLE {}".format(table))
+
+    def test_cross_chain_queries_use_the_composite_indexes(self):
+        schema.migrate_to_unified(self.database)
+        plan = ' '.join(str(row) for row in self.database.con.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM transactions WHERE symbol IN ('BTC') AND timestamp BETWEEN 1 AND 2"))
+        self.assertIn('transactions_symbol_timestamp', plan)
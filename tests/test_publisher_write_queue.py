@@ -0,0 +1,128 @@
+import unittest
+from unittest import mock
+import logging
+import threading
+from whalealert.publisher.write_queue import WriteQueue
+
+logging.disable(logging.CRITICAL)
+
+
+class Handler():
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.called = threading.Event()
+        self.error = None
+
+    def __call__(self, items):
+        self.called.set()
+        self.release.wait(5)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        self.batches.append(list(items))
+
+
+class WritingBehind(unittest.TestCase):
+    def setUp(self):
+        self.handler = Handler()
+        self.queue = WriteQueue(self.handler, maximum_depth=4, batch_size=2, batch_seconds=0.05)
+
+    def tearDown(self):
+        self.handler.release.set()
+        self.queue.stop(5)
+
+    def test_writes_on_calling_thread_when_not_started(self):
+        self.assertEqual(self.queue.put('a'), 0.0)
+        self.assertEqual(self.handler.batches, [['a']])
+        self.assertIs(self.queue.flush(), True)
+
+    def test_full_batches_are_written_together(self):
+        self.queue.start()
+        self.handler.release.clear()
+        for item in ['a', 'b', 'c']:
+            self.queue.put(item)
+        self.handler.called.wait(5)
+        self.handler.release.set()
+        self.assertIs(self.queue.flush(5), True)
+        self.assertEqual([item for batch in self.handler.batches for item in batch], ['a', 'b', 'c'])
+        self.assertLessEqual(max(len(batch) for batch in self.handler.batches), 2)
+
+    def test_partial_batch_is_written_once_old_enough(self):
+        self.queue.start()
+        self.queue.put('a')
+        self.assertIs(self.handler.called.wait(5), True)
+        self.assertIs(self.queue.flush(5), True)
+        self.assertEqual(self.handler.batches, [['a']])
+        self.assertEqual(self.queue.get_statistics()['flushes'], 1)
+        self.assertGreaterEqual(self.queue.get_statistics()['maximum_wait_seconds'], 0.04)
+
+    def test_put_blocks_while_full(self):
+        self.queue.start()
+        self.handler.release.clear()
+        self.queue.put('first')
+        self.handler.called.wait(5)
+        for item in range(4):
+            self.queue.put(item)
+        self.assertEqual(self.queue.get_depth(), 4)
+
+        timer = threading.Timer(0.1, self.handler.release.set)
+        timer.start()
+        self.assertGreaterEqual(self.queue.put('last'), 0.05)
+        timer.join()
+        statistics = self.queue.get_statistics()
+        self.assertEqual(statistics['blocked_puts'], 1)
+        self.assertEqual(statistics['maximum_depth'], 4)
+
+    def test_put_writes_on_calling_thread_if_the_thread_dies_while_full(self):
+        self.queue.start()
+        self.handler.release.clear()
+        self.queue.put('first')
+        self.handler.called.wait(5)
+        for item in range(4):
+            self.queue.put(item)
+
+        self.handler.error = SystemExit()
+        timer = threading.Timer(0.1, self.handler.release.set)
+        timer.start()
+        with mock.patch('threading.excepthook'):
+            self.queue.put('last')
+        timer.join()
+        self.assertIs(self.queue.is_running(), False)
+        self.assertEqual(self.handler.batches, [[0, 1, 2, 3, 'last']])
+        self.assertEqual(self.queue.get_depth(), 0)
+        self.assertIs(self.queue.flush(), True)
+
+    def test_stop_drains_the_queue(self):
+        self.queue = WriteQueue(self.handler, maximum_depth=10, batch_size=10, batch_seconds=60)
+        self.queue.start()
+        for item in range(5):
+            self.queue.put(item)
+        self.assertIs(self.queue.stop(5), True)
+        self.assertIs(self.queue.is_running(), False)
+        self.assertEqual(self.handler.batches, [[0, 1, 2, 3, 4]])
+        statistics = self.queue.get_statistics()
+        self.assertEqual(statistics['items_queued'], 5)
+        self.assertEqual(statistics['items_written'], 5)
+        self.assertEqual(statistics['depth'], 0)
+
+    def test_flush_writes_a_partial_batch_now(self):
+        self.queue = WriteQueue(self.handler, maximum_depth=10, batch_size=10, batch_seconds=60)
+        self.queue.start()
+        self.queue.put('a')
+        self.assertIs(self.queue.flush(5), True)
+        self.assertEqual(self.handler.batches, [['a']])
+
+    def test_handler_errors_do_not_stop_the_thread(self):
+        self.queue = WriteQueue(lambda items: 1 / 0, batch_size=1)
+        self.queue.start()
+        self.queue.put('a')
+        self.assertIs(self.queue.flush(5), True)
+        self.assertIs(self.queue.is_running(), True)
+        self.assertEqual(self.queue.get_statistics()['flushes'], 1)
+
+    def test_invalid_sizes(self):
+        self.assertRaises(ValueError, WriteQueue, self.handler, maximum_depth=0)
+        self.assertRaises(ValueError, WriteQueue, self.handler, batch_size=0)
+        self.assertRaises(ValueError, WriteQueue, self.handler, batch_seconds=-1)
@@ -3,8 +3,12 @@ from unittest import mock
 import time
 import logging
 import os
+import sqlite3
 import whalealert.settings as settings
 from whalealert.publisher.writer import Writer
+from whalealert.publisher.reader import Reader
+from whalealert.api.record import Transaction
+import whalealert.publisher.schema as schema
 from whalealert.whalealert import WhaleAlert
 
 logging.disable(logging.CRITICAL)
@@ -177,9 +181,22 @@ test_good_data = [{
 }]
 
 
+def flattern_transaction(transaction):
+    flat = dict(transaction)
+    for party in ['from', 'to']:
+        for key in ['address', 'owner', 'owner_type']:
+            flat[party + '_' + key] = transaction[party][key]
+        del flat[party]
+    return flat
+
+
 def cleanup_working_directories():
     try:
-        os.remove(os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.database_file_name))
+        database_file = os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.database_file_name)
+        for wal_file in [database_file + '-wal', database_file + '-shm']:
+            if os.path.exists(wal_file):
+                os.remove(wal_file)
+        os.remove(database_file)
         os.remove(os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.status_file_name))
         os.remove(os.path.join(TEST_WORKING_DIR, settings.input_configuation_filename))
         os.removedirs(os.path.join(TEST_WORKING_DIR, settings.data_file_directory))
@@ -373,6 +390,81 @@ class WrintingLastCallStats(unittest.TestCase):
                                   settings.status_file_option_error_message), failed_call['error_message'])
         self.assertEqual(success, True)
 
+    def test_call_times_are_also_written_as_unix_time(self):
+        self.writer.write_status(successful_call_with_trans)
+        self.writer.write_status(failed_call)
+        self.reload_status()
+        unix_time = Reader.from_local_time(successful_call_with_trans['timestamp'])
+        self.assertEqual(
+            self.get_status_value(settings.status_file_last_good_call_section_name,
+                                  settings.status_file_option_unix_time), unix_time)
+        self.assertEqual(
+            self.get_status_value(settings.status_file_last_failed_secion_name, settings.status_file_option_unix_time),
+            unix_time)
+
+    def test_unreadable_call_time_is_written_as_zero(self):
+        self.assertIs(self.writer.write_status(dict(successful_call_with_trans, timestamp='not a time')), True)
+        self.reload_status()
+        self.assertEqual(
+            self.get_status_value(settings.status_file_last_good_call_section_name,
+                                  settings.status_file_option_unix_time), 0)
+
+
+class CoalescingStatusWrites(unittest.TestCase):
+    def setUp(self):
+        self.whale = WhaleAlert(working_directory=TEST_WORKING_DIR)
+        self.status = self.whale.get_status()
+        self.status_file = os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.status_file_name)
+        self.writer = Writer(self.status, self.whale.get_database(), self.status_file, persist_seconds=60)
+
+    def tearDown(self):
+        cleanup_working_directories()
+
+    def get_successful_calls(self):
+        return self.status.get_value(settings.status_file_all_time_section_name,
+                                     settings.status_file_option_successful_calls)
+
+    def test_status_file_is_written_at_most_once_per_interval(self):
+        with mock.patch.object(self.status, 'write_configuration_file',
+                               wraps=self.status.write_configuration_file) as write_file:
+            for _ in range(5):
+                self.assertIs(self.writer.write_status(successful_call_with_trans), True)
+            self.assertEqual(write_file.call_count, 1)
+            self.assertEqual(self.get_successful_calls(), 1)
+
+            self.assertIs(self.writer.flush_status(), True)
+            self.assertIs(self.writer.flush_status(), True)
+            self.assertEqual(write_file.call_count, 2)
+        self.status.set_configuration_file(self.status_file)
+        self.assertEqual(self.get_successful_calls(), 5)
+
+    def test_status_file_is_replaced_atomically(self):
+        inode = os.stat(self.status_file).st_ino
+        self.writer.write_status(failed_call)
+        self.assertNotEqual(os.stat(self.status_file).st_ino, inode)
+        self.assertIs(os.path.exists(self.status_file + settings.status_file_temporary_suffix), False)
+
+    def test_starting_a_session_resets_session_counts(self):
+        self.writer.write_status(failed_call)
+        self.assertIs(self.writer.start_session(), True)
+        self.status.set_configuration_file(self.status_file)
+        section = settings.status_file_current_session_section_name
+        self.assertEqual(self.status.get_value(section, settings.status_file_option_failed_calls), 0)
+        self.assertEqual(self.status.get_value(section, settings.status_file_option_health), 100.0)
+        self.assertEqual(
+            self.status.get_value(settings.status_file_all_time_section_name, settings.status_file_option_failed_calls),
+            1)
+
+    def test_status_can_be_written_to_the_database(self):
+        database = self.whale.get_database()
+        writer = Writer(self.status, database, self.status_file, status_to_database=True)
+        writer.write_status(successful_call_with_trans)
+        writer.write_status(failed_call)
+        rows = database.con.execute("SELECT session_successful_calls, session_failed_calls, "
+                                    "last_failed_call_error_message FROM status").fetchall()
+        self.assertEqual(rows, [(1, 1, failed_call['error_message'])])
+        self.assertEqual(schema.get_blockchain_tables(database), [])
+
 
 class HandlingErrors(unittest.TestCase):
     def setUp(self):
@@ -475,11 +567,11 @@ class WritingData(unittest.TestCase):
         success = self.writer.write_transactions(transactions)
         database = self.writer.get_database()
         df = database.table_to_df('bitcoin')
-        self.assertEqual(len(df), 3)
+        self.assertEqual(len(df), 1)
 
         # There are two ethereum transaction in the good data
         df = database.table_to_df('ethereum')
-        self.assertEqual(len(df), 6)
+        self.assertEqual(len(df), 2)
 
         self.assertEqual(success, True)
 
@@ -487,3 +579,153 @@ class WritingData(unittest.TestCase):
         transactions = 'A string'
         success = self.writer.write_transactions(transactions)
         self.assertEqual(success, False)
+
+    def test_writing_transaction_records(self):
+        records = [Transaction.from_dict(flattern_transaction(transaction)) for transaction in test_good_data]
+        success = self.writer.write_transactions(records)
+        database = self.writer.get_database()
+        self.assertEqual(success, True)
+        self.assertEqual(database.get_last_time_entry('bitcoin'), records[0].to_dict())
+
+    def test_last_written_transactions_are_records(self):
+        self.writer.write_transactions(test_good_data)
+        records = self.writer.get_last_written_transactions()
+        self.assertEqual(len(records), len(test_good_data))
+        self.assertTrue(all(type(record) is Transaction for record in records))
+        self.assertEqual(self.writer.get_last_written_transactions(), [])
+
+    def test_subscribers_read_new_transactions_independently(self):
+        subscription = self.writer.subscribe()
+        self.writer.write_transactions(test_good_data[:2])
+        self.assertEqual(len(self.writer.get_last_written_transactions()), 2)
+        self.writer.write_transactions(test_good_data[2:])
+        self.assertEqual(len(self.writer.get_last_written_transactions(subscription)), len(test_good_data))
+        self.assertEqual(len(self.writer.get_last_written_transactions()), len(test_good_data) - 2)
+
+    def test_the_newest_transactions_are_kept_when_unread(self):
+        with mock.patch.object(settings, 'maximum_stored_latest_transaction', 2):
+            writer = Writer(self.whale.get_status(), self.whale.get_database())
+        writer.write_transactions(test_good_data)
+        self.assertEqual([record.id for record in writer.get_last_written_transactions()],
+                         [transaction['id'] for transaction in test_good_data[-2:]])
+        self.assertEqual(writer.get_statistics()['unread_overflow'], len(test_good_data) - 2)
+
+    def test_last_written_dataframe_has_a_column_per_field(self):
+        self.writer.write_transactions(test_good_data)
+        df = self.writer.get_last_written()
+        self.assertEqual(list(df.columns), list(Transaction.FIELDS))
+        self.assertEqual(len(df), len(test_good_data))
+
+    def test_a_failed_insert_writes_nothing_from_the_page(self):
+        records = [Transaction.from_dict(flattern_transaction(transaction)) for transaction in test_good_data]
+        bad = records[-1].to_dict()
+        bad['blockchain'] = 'not a table'
+        success = self.writer.write_transactions(records[:-1] + [bad])
+        database = self.writer.get_database()
+        self.assertIs(success, False)
+        self.assertEqual(len(database.table_to_df('bitcoin')), 0)
+        self.assertEqual(len(database.table_to_df('ethereum')), 0)
+        self.assertEqual(self.writer.get_last_written_transactions(), [])
+        self.assertEqual(self.writer.get_statistics()['failed_pages'], 1)
+
+    def test_write_statistics(self):
+        self.writer.write_transactions(test_good_data)
+        self.writer.write_transactions(test_good_data)
+        statistics = self.writer.get_statistics()
+        self.assertEqual(statistics['pages'], 2)
+        self.assertEqual(statistics['rows'], 2 * len(test_good_data))
+        self.assertGreater(statistics['rows_per_second'], 0)
+        self.writer.reset_statistics()
+        self.assertEqual(self.writer.get_statistics()['rows'], 0)
+
+    def test_tables_are_only_created_once(self):
+        database = self.writer.get_database()
+        database.create_table = mock.MagicMock(side_effect=database.create_table)
+        self.writer.write_transactions(test_good_data)
+        self.writer.write_transactions(test_good_data)
+        self.assertEqual(len(database.create_table.mock_calls), 4)
+        statistics = self.writer.get_statistics()
+        self.assertEqual(statistics['tables_created'], 4)
+        self.assertEqual(statistics['table_checks_skipped'], 2 * len(test_good_data) - 4)
+
+    def test_existing_tables_are_not_created_again(self):
+        self.writer.write_transactions(test_good_data)
+        writer = Writer(self.whale.get_status(), self.whale.get_database())
+        writer.write_transactions(test_good_data)
+        self.assertEqual(writer.get_statistics()['tables_created'], 0)
+        self.assertEqual(len(self.whale.get_database().table_to_df('bitcoin')), 1)
+
+    def test_failed_indexes_are_tried_once_per_write(self):
+        database = self.writer.get_database()
+        database.create_table = mock.MagicMock(side_effect=database.create_table)
+        with mock.patch.object(schema, 'add_indexes', return_value=False) as add_indexes:
+            self.assertIs(self.writer.write_transactions(test_good_data), True)
+            self.assertIs(self.writer.write_transactions(test_good_data), True)
+        self.assertEqual(len(database.create_table.mock_calls), 8)
+        self.assertEqual(len(add_indexes.mock_calls), 8)
+        self.assertEqual(self.writer.get_statistics()['tables_created'], 4)
+
+    def test_rewriting_a_window_reports_duplicates(self):
+        self.writer.write_transactions(test_good_data[:3])
+        self.writer.get_last_written_transactions()
+        success = self.writer.write_transactions(test_good_data)
+        self.assertIs(success, True)
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 2, 'duplicate': 3})
+        self.assertEqual([record.id for record in self.writer.get_last_written_transactions()],
+                         [transaction['id'] for transaction in test_good_data[3:]])
+        statistics = self.writer.get_statistics()
+        self.assertEqual(statistics['new_rows'], len(test_good_data))
+        self.assertEqual(statistics['duplicate_rows'], 3)
+
+    def test_repeats_within_a_page_are_written_once(self):
+        self.writer.write_transactions(test_good_data + test_good_data)
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 5, 'duplicate': 5})
+        self.assertEqual(len(self.writer.get_database().table_to_df('ethereum')), 2)
+
+    def test_pages_larger_than_the_sqlite_variable_limit(self):
+        self.whale.get_database().con.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        records = []
+        for index in range(1500):
+            record = flattern_transaction(test_good_data[0])
+            record['id'] = str(index)
+            records.append(record)
+        self.assertIs(self.writer.write_transactions(records[:1000]), True)
+        self.assertIs(self.writer.write_transactions(records), True)
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 500, 'duplicate': 1000})
+        self.assertEqual(len(self.whale.get_database().table_to_df('bitcoin')), 1500)
+
+    def test_existing_duplicates_are_removed_when_the_index_is_added(self):
+        database = self.whale.get_database()
+        record = Transaction.from_dict(flattern_transaction(test_good_data[0]))
+        database.create_table('bitcoin', settings.database_columns)
+        database.insert('bitcoin', record.to_row())
+        database.insert('bitcoin', record.to_row())
+        success = self.writer.write_transactions(test_good_data)
+        self.assertIs(success, True)
+        self.assertEqual(len(database.table_to_df('bitcoin')), 1)
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 4, 'duplicate': 1})
+
+    def test_writing_to_the_unified_table(self):
+        database = self.whale.get_database()
+        schema.create_unified_table(database)
+        self.writer.write_transactions(test_good_data)
+        self.writer.write_transactions(test_good_data)
+        self.assertEqual(database.get_table_names(), [settings.database_unified_table])
+        self.assertEqual(len(database.table_to_df(settings.database_unified_table)), len(test_good_data))
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 0, 'duplicate': len(test_good_data)})
+
+    def test_same_id_on_different_blockchains_is_kept_in_the_unified_table(self):
+        schema.create_unified_table(self.whale.get_database())
+        records = [Transaction.from_dict(flattern_transaction(transaction)) for transaction in test_good_data[:2]]
+        other = records[0].to_dict()
+        other['blockchain'] = 'litecoin'
+        self.writer.write_transactions(records + [other])
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 3, 'duplicate': 0})
+
+    def test_writer_follows_a_migration_by_another_process(self):
+        self.writer.write_transactions(test_good_data[:2])
+        schema.migrate_to_unified(self.whale.get_database())
+        success = self.writer.write_transactions(test_good_data)
+        self.assertIs(success, True)
+        self.assertEqual(self.writer.get_last_write_counts(), {'new': 3, 'duplicate': 2})
+        self.assertEqual(self.whale.get_database().get_table_names(), [settings.database_unified_table])
@@ -7,8 +7,10 @@ from requests.exceptions import ConnectionError, Timeout, TooManyRedirects
 import whalealert.settings as settings
 from whalealert.whalealert import WhaleAlert
 from whalealert.api.transactions import Transactions
+from whalealert.api.validator import TransactionValidator
 import json
 import datetime
+import asyncio
 
 TEST_WORKING_DIR = os.path.join('tests', 'test_working_directory')
 TEST_WORKING_DIR_BAD_PERMISSIONS = "/root/test"
@@ -52,6 +54,9 @@ good_transactions = [{
     'transaction_count': 1,
 }]
 
+flat_transactions = [TransactionValidator().validate(transaction) for transaction in good_transactions]
+api_transactions = [transaction.to_api_format() for transaction in flat_transactions]
+
 bad_transactions = [{
     'blockchain': 'bitcoin',
     'symbol': 'btc',
@@ -78,7 +83,11 @@ bad_transactions = [{
 
 def cleanup_working_directories():
     try:
-        os.remove(os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.database_file_name))
+        database_file = os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.database_file_name)
+        for wal_file in [database_file + '-wal', database_file + '-shm']:
+            if os.path.exists(wal_file):
+                os.remove(wal_file)
+        os.remove(database_file)
         os.remove(os.path.join(TEST_WORKING_DIR, settings.data_file_directory, settings.status_file_name))
         os.remove(os.path.join(TEST_WORKING_DIR, settings.input_configuation_filename))
         os.removedirs(os.path.join(TEST_WORKING_DIR, settings.data_file_directory))
@@ -120,6 +129,38 @@ class WhaleAlertInit(unittest.TestCase):
         self.assertEqual(database_exists, status)
         self.assertEqual(status_exists, status)
 
+    def test_unified_table_option_migrates_the_database(self):
+        self.database.create_table('bitcoin', settings.database_columns)
+        self.config.set_value(settings.API_section_name, settings.API_option_unified_table, True)
+        self.config.write_configuration_file()
+        whale = WhaleAlert(working_directory=TEST_WORKING_DIR)
+        self.assertEqual(whale.get_database().get_table_names(), [settings.database_unified_table])
+        self.assertEqual(whale.migrate_to_unified_table(), 0)
+
+    def test_read_only_opens_no_write_connection(self):
+        self.whale.transactions.get_transactions = mock.MagicMock(
+            return_value=(True, good_transactions, dict(good_status, error_code=200, error_message='')))
+        self.whale.fetch_and_store_data(0)
+        with mock.patch('whalealert.publisher.connection.open_writer') as open_writer, \
+                mock.patch('whalealert.publisher.schema.upgrade') as upgrade:
+            whale = WhaleAlert(working_directory=TEST_WORKING_DIR, read_only=True)
+            output = whale.data_request(as_dict=True)
+            window = whale.status_request(as_dict=True)['windows']['5m']
+        open_writer.assert_not_called()
+        upgrade.assert_not_called()
+        self.assertIs(whale.get_database(), None)
+        self.assertEqual(len(output), 1)
+        self.assertEqual(window['calls'], 1)
+
+    def test_read_only_creates_a_missing_database(self):
+        cleanup_working_directories()
+        whale = WhaleAlert(working_directory=TEST_WORKING_DIR, read_only=True)
+        self.check_directories_are(TEST_WORKING_DIR, True)
+        self.assertIsNot(whale.get_database(), None)
+
+    def test_database_uses_wal_journaling(self):
+        self.assertEqual(self.database.con.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
     def test_status_database_config_are_none_with_no_working_directory(self):
         whale = WhaleAlert()
         config = whale.get_configuration()
@@ -230,6 +271,14 @@ class WhaleAlertAPICall(unittest.TestCase):
         whale.get_transactions(0, api_key='asdf')
         self.assertEqual(whale.transactions.get_transactions.mock_calls, expected)
 
+    def test_transactions_are_returned_in_api_format(self):
+        whale = WhaleAlert()
+        whale.transactions.get_transactions = mock.MagicMock().method()
+        whale.transactions.get_transactions.return_value = (True, flat_transactions, good_status)
+        success, transactions, status = whale.get_transactions(0, api_key='asdf')
+        expected = dict(good_transactions[0], symbol='BTC')
+        self.assertEqual(transactions, [expected])
+
 
 class FetchAndStoreData(unittest.TestCase):
     def setUp(self):
@@ -290,6 +339,16 @@ class FetchAndStoreData(unittest.TestCase):
         self.assertEqual(failed_calls, 0)
         self.assertIs(success, True)
 
+    def test_calls_are_timed_in_the_call_history(self):
+        self.whale.transactions.get_transactions = mock.MagicMock().method()
+        status = dict(good_status, error_code=200, error_message='')
+        self.whale.transactions.get_transactions.return_value = (True, good_transactions, status)
+        self.whale.fetch_and_store_data(0)
+        window = self.whale.status_request(as_dict=True)['windows']['5m']
+        self.assertEqual(window['calls'], 1)
+        self.assertIsNotNone(window['p50_seconds'])
+        self.assertEqual(self.whale.get_database().con.execute("SELECT COUNT(*) FROM call_history").fetchone()[0], 1)
+
     def test_a_successful_call_with_failed_keys_causes_no_write_ands_a_failed_status(self):
         self.whale.transactions.get_transactions = mock.MagicMock().method()
         self.whale.transactions.get_transactions.return_value = (True, bad_transactions, good_status)
@@ -333,6 +392,229 @@ class FetchAndStoreData(unittest.TestCase):
         self.assertIs(success, False)
 
 
+class IteratingTransactionPages(unittest.TestCase):
+    def setUp(self):
+        self.whale = WhaleAlert(TEST_WORKING_DIR)
+        self.config = self.whale.get_configuration()
+        self.config.set_value(settings.API_section_name, settings.API_option_private_key, 'zxcv')
+        self.whale.transactions.get_last_cursor = mock.MagicMock().method()
+        self.whale.transactions.get_last_cursor.side_effect = ['cursor_1', 'cursor_2', 'cursor_3']
+        self.whale.transactions.get_transactions = mock.MagicMock().method()
+
+    def tearDown(self):
+        cleanup_working_directories()
+
+    def test_cursor_is_followed_until_a_short_page(self):
+        full_page = (True, flat_transactions * 2, good_status)
+        short_page = (True, flat_transactions, good_status)
+        self.whale.transactions.get_transactions.side_effect = [full_page, full_page, short_page]
+        pages = list(self.whale.iter_transactions(10, end_time=20, limit=2))
+        expected = [
+            mock.call(10, 20, 'zxcv', None, 500000, 2),
+            mock.call(10, 20, 'zxcv', 'cursor_1', 500000, 2),
+            mock.call(10, 20, 'zxcv', 'cursor_2', 500000, 2)
+        ]
+        full_api_page = (True, api_transactions * 2, good_status)
+        short_api_page = (True, api_transactions, good_status)
+        self.assertEqual(pages, [full_api_page, full_api_page, short_api_page])
+        self.assertEqual(self.whale.transactions.get_transactions.mock_calls, expected)
+
+    def test_iteration_stops_after_a_failed_call(self):
+        full_page = (True, flat_transactions, good_status)
+        failed_page = (False, None, bad_status)
+        self.whale.transactions.get_transactions.side_effect = [full_page, failed_page, full_page]
+        pages = list(self.whale.iter_transactions(10, limit=1))
+        self.assertEqual(pages, [(True, api_transactions, good_status), failed_page])
+        self.assertEqual(len(self.whale.transactions.get_transactions.mock_calls), 2)
+
+    def test_bad_start_time_raises_before_iterating(self):
+        self.assertRaises(ValueError, self.whale.iter_transactions, 'not_an_int')
+        self.assertEqual(len(self.whale.transactions.get_transactions.mock_calls), 0)
+
+
+class RunningTheDaemon(unittest.TestCase):
+    def setUp(self):
+        config = WhaleAlert(TEST_WORKING_DIR).get_configuration()
+        config.set_value(settings.API_section_name, settings.API_option_write_batch_seconds, 60.0)
+        config.write_configuration_file()
+        self.whale = WhaleAlert(TEST_WORKING_DIR)
+        self.whale.backfill = mock.MagicMock()
+        self.whale.transactions.get_last_cursor = mock.MagicMock(return_value='cursor')
+        self.whale.transactions.get_transactions = mock.MagicMock()
+
+    def tearDown(self):
+        cleanup_working_directories()
+
+    def run_daemon(self, transaction_pages, print_output=False):
+        status = dict(good_status, error_code=200, error_message='')
+        self.whale.transactions.get_transactions.side_effect = [(True, transactions, dict(status))
+                                                                for transactions in transaction_pages]
+        with mock.patch('time.sleep', side_effect=[None] * (len(transaction_pages) - 1) + [KeyboardInterrupt]):
+            self.assertRaises(KeyboardInterrupt, self.whale.start_daemon, force=True, print_output=print_output)
+
+    def get_call_counts(self):
+        status = self.whale.get_status()
+        return [
+            status.get_value(settings.status_file_current_session_section_name, option)
+            for option in [settings.status_file_option_successful_calls, settings.status_file_option_failed_calls]
+        ]
+
+    def test_queued_pages_are_written_when_the_daemon_stops(self):
+        self.run_daemon([good_transactions] * 2)
+        self.assertEqual(len(self.whale.get_database().table_to_df('bitcoin')), 1)
+        self.assertEqual(self.get_call_counts(), [2, 0])
+        statistics = self.whale.get_write_queue_statistics()
+        self.assertEqual(statistics['items_written'], 2)
+        self.assertEqual(statistics['flushes'], 1)
+        self.assertEqual(statistics['depth'], 0)
+
+    def test_printed_transactions_are_still_returned_as_new(self):
+        with mock.patch('builtins.print') as printed:
+            self.run_daemon([good_transactions], print_output=True)
+        self.assertEqual(len(printed.mock_calls), 1)
+        self.assertEqual(len(self.whale.get_new_transaction(as_df=True)), 1)
+
+    def test_a_bad_page_in_a_batch_does_not_lose_the_others(self):
+        self.run_daemon([good_transactions, bad_transactions])
+        self.assertEqual(len(self.whale.get_database().table_to_df('bitcoin')), 1)
+        self.assertEqual(self.get_call_counts(), [1, 1])
+        error_code = self.whale.get_status().get_value(settings.status_file_last_failed_secion_name,
+                                                       settings.status_file_option_error_code)
+        self.assertEqual(error_code, 20)
+
+
+class AsyncFetchAndStoreData(unittest.TestCase):
+    def setUp(self):
+        self.whale = WhaleAlert(TEST_WORKING_DIR)
+        self.config = self.whale.get_configuration()
+        self.database = self.whale.get_database()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        cleanup_working_directories()
+
+    def mock_async_call(self, return_value):
+        calls = []
+
+        async def get_transactions(*args):
+            calls.append(mock.call(*args))
+            return return_value
+
+        self.whale.async_transactions.get_transactions = get_transactions
+        return calls
+
+    def test_async_get_transactions_uses_configuration_values(self):
+        calls = self.mock_async_call((False, {}, {}))
+        self.config.set_value(settings.API_section_name, settings.API_option_private_key, '1234')
+        self.config.set_value(settings.API_section_name, settings.API_option_minimum_value, 10)
+        self.loop.run_until_complete(self.whale.get_transactions_async(0))
+        self.assertEqual(calls, [mock.call(0, None, '1234', None, 10, 100)])
+
+    def test_async_get_transactions_raises_exception_if_start_time_is_not_int(self):
+        whale = WhaleAlert()
+        self.assertRaises(ValueError, self.loop.run_until_complete, whale.get_transactions_async('0', api_key='1'))
+
+    def test_async_fetch_writes_the_database(self):
+        self.mock_async_call((True, good_transactions, dict(good_status)))
+        success = self.loop.run_until_complete(self.whale.fetch_and_store_data_async(0))
+        df = self.database.table_to_df('bitcoin')
+        self.assertEqual(len(df), 1)
+        self.assertIs(success, True)
+
+    def test_many_async_fetches_can_run_concurrently(self):
+        calls = self.mock_async_call((True, good_transactions, dict(good_status)))
+
+        async def fetch_windows():
+            fetches = [self.whale.fetch_and_store_data_async(start, end_time=start + 60) for start in range(0, 300, 60)]
+            return await asyncio.gather(*fetches)
+
+        results = self.loop.run_until_complete(fetch_windows())
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(len(calls), 5)
+
+    def test_async_fetch_with_no_working_directory_returns_false(self):
+        whale = WhaleAlert()
+        success = self.loop.run_until_complete(whale.fetch_and_store_data_async(0))
+        self.assertIs(success, False)
+
+    def test_async_context_manager_closes_the_session(self):
+        closed = []
+
+        async def close():
+            closed.append(True)
+
+        self.whale.async_transactions.close = close
+
+        async def use_whale():
+            async with self.whale as whale:
+                return whale
+
+        self.assertIs(self.loop.run_until_complete(use_whale()), self.whale)
+        self.assertEqual(closed, [True])
+
+
+class BackfillingHistory(unittest.TestCase):
+    def setUp(self):
+        self.whale = WhaleAlert(TEST_WORKING_DIR)
+        self.config = self.whale.get_configuration()
+        self.status = self.whale.get_status()
+        self.database = self.whale.get_database()
+
+    def tearDown(self):
+        cleanup_working_directories()
+
+    def mock_backfill(self, result):
+        patcher = mock.patch('whalealert.whalealert.Backfill')
+        backfill_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        async def fetch(*args):
+            return result
+
+        backfill_class.return_value.fetch = fetch
+        return backfill_class
+
+    def test_successful_backfill_is_stored(self):
+        self.mock_backfill((True, good_transactions, dict(good_status)))
+        success = self.whale.backfill(0, end_time=3600)
+        self.assertIs(success, True)
+        self.assertEqual(len(self.database.table_to_df('bitcoin')), 1)
+
+    def test_failed_backfill_stores_nothing(self):
+        self.mock_backfill((False, good_transactions, dict(bad_status)))
+        success = self.whale.backfill(0, end_time=3600)
+        failed_calls = self.status.get_value(settings.status_file_current_session_section_name,
+                                             settings.status_file_option_failed_calls)
+        self.assertIs(success, False)
+        self.assertEqual(self.database.table_to_df('bitcoin'), None)
+        self.assertEqual(failed_calls, 1)
+
+    def test_configuration_values_are_used_for_shards(self):
+        self.config.set_value(settings.API_section_name, settings.API_option_backfill_shards, 12)
+        self.config.set_value(settings.API_section_name, settings.API_option_backfill_concurrency, 5)
+        self.config.set_value(settings.API_section_name, settings.API_option_backfill_currencies, 'btc, eth')
+        backfill_class = self.mock_backfill((True, [], dict(good_status)))
+        success = self.whale.backfill(0, end_time=3600)
+        self.assertIs(success, True)
+        expected = mock.call(shards=12,
+                             concurrency=5,
+                             currencies=['btc', 'eth'],
+                             circuit_breaker=self.whale.get_circuit_breaker(),
+                             base_url=settings.API_option_base_url_default)
+        self.assertEqual(backfill_class.mock_calls[0], expected)
+
+    def test_daemon_restart_backfills_every_currency(self):
+        self.config.set_value(settings.API_section_name, settings.API_option_backfill_currencies, 'btc, eth')
+        backfill_class = self.mock_backfill((True, good_transactions, dict(good_status)))
+        self.whale.transactions.get_last_cursor = mock.MagicMock(return_value='cursor')
+        self.whale.transactions.get_transactions = mock.MagicMock(return_value=(True, [], dict(good_status)))
+        with mock.patch('time.sleep', side_effect=KeyboardInterrupt):
+            self.assertRaises(KeyboardInterrupt, self.whale.start_daemon, force=True)
+        self.assertEqual(backfill_class.call_args[1]['currencies'], [])
+        self.assertEqual(len(self.database.table_to_df('bitcoin')), 1)
+
+
 class WritingCustomStatus(unittest.TestCase):
     def setUp(self):
         self.whale = WhaleAlert(TEST_WORKING_DIR)
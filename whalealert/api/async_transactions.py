@@ -0,0 +1,172 @@
+"""
+Asyncio API wrapper for getting transactions from Whale Alert API
+"""
+
+import logging
+import asyncio
+import aiohttp
+import whalealert.settings as settings
+from whalealert.api.transactions import Transactions
+from whalealert.api.retry import RetryPolicy
+
+log = logging.getLogger(__name__)
+
+
+class AsyncTransactions(Transactions):
+    """
+    Asyncio API wrapper for getting transactions from Whale Alert API
+
+    Responses are validated exactly as for Transactions, returning the same status codes. Retries wait with
+    asyncio.sleep, so many calls can be in flight on the one event loop.
+
+    The underlying aiohttp session is created on the first call and should be closed with close() once the
+    object is no longer needed. An aiohttp session can only be used on the event loop it was created on, so a new
+    session is created when calls are made from a different loop (for example a second asyncio.run). A created
+    session is also closed when its event loop shuts down its asynchronous generators, as asyncio.run does.
+
+    A session can instead be supplied, allowing several objects (each following their own cursor) to share one
+    connection pool. A supplied session is never replaced or closed here, and pool_size and keep_alive only apply to
+    a session created here. No requests session is made, so get_transport_statistics returns None.
+    """
+    def __init__(self,
+                 session=None,
+                 rate_limiter=None,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 decoder=None,
+                 pool_size=settings.API_option_connection_pool_size_default,
+                 keep_alive=settings.API_option_keep_alive_default,
+                 base_url=None):
+        super().__init__(rate_limiter=rate_limiter,
+                         retry_policy=retry_policy,
+                         circuit_breaker=circuit_breaker,
+                         decoder=decoder,
+                         pool_size=pool_size,
+                         keep_alive=keep_alive,
+                         base_url=base_url)
+        self.__session = session
+        self.__owns_session = session is None
+        self.__session_loop = None
+        self.__session_closer = None
+        log.debug("AsyncTransactions object created")
+
+    def _make_session(self, pool_size, keep_alive):
+        # Calls go through an aiohttp session instead, see __get_session
+        return None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def close(self):
+        """ Close the underlying aiohttp session, if one has been opened on the running event loop. """
+        if self.__session is None or not self.__owns_session:
+            return
+        if self.__session_loop is asyncio.get_event_loop():
+            await self.__session_closer.aclose()
+        self.__session = None
+        self.__session_loop = None
+        self.__session_closer = None
+
+    async def get_transactions(self, start_time, end_time, api_key, cursor, min_value, limit, currency=None):
+        """ Make an API call to Whale Alert to get the latest transactions.
+
+        See Transactions.get_transactions for the API limitations.
+
+        Parameters:
+        start_time (int): Unix timestamp from which to start listing transactions. (exclusive)
+        end_time (int): Unix timestamp from where to stop listing transactions (inclusive). Use None to get to current time.
+        api_key (str): The API key to use for the transaction.
+        cursor (str): The pagnation cursor from a previous transaction. Use None to ignore this parameter.
+        min_value (int): The minimum value of transaction to return.
+        limit (int): The maximum number of transactions to return (maximum = 100)
+        currency (str): Only return transactions for this currency code. Use None to return all currencies.
+
+        Returns:
+        success (bool) : If true, then a successful call was made (Return code of 200). Return false otherwise.
+        transactions (list or None):
+        - success = True: A list containing a Transaction record for each transaction.
+        - success = False: None
+        status (dict): A dictionary containing the timestamp, error_code and error_message for the transaction.
+        """
+        parameters = self._form_request(start_time, end_time, api_key, cursor, min_value, limit, currency)
+        log.debug("Attempting async API call at '{}' with parameters '{}'".format(self._url, parameters))
+
+        success, response, status = await self.__attempt_call(parameters)
+        if success is not True:
+            return success, None, status
+
+        status_code, content = response
+        success, transactions, status = self._check_response(status_code, content)
+        return success, transactions, status
+
+    async def __attempt_call(self, parameters):
+        if not self._circuit_breaker.allow_call():
+            return False, None, self._make_circuit_open_status()
+        attempt = 1
+        while True:
+            response, retry_after = None, None
+            try:
+                await self._rate_limiter.acquire_async()
+                session = await self.__get_session()
+                async with session.get(self._url, params=parameters) as reply:
+                    content = await reply.read()
+                    response = (reply.status, content)
+                    headers = getattr(reply, 'headers', None)
+                    retry_after = RetryPolicy.parse_retry_after(headers.get('Retry-After') if headers else None)
+            except asyncio.TimeoutError as e_r:
+                error_code, exception = 2, e_r
+            except aiohttp.ClientConnectionError as e_r:
+                error_code, exception = 1, e_r
+            except aiohttp.TooManyRedirects as e_r:
+                error_code, exception = 3, e_r
+            except RuntimeError as e_r:
+                # A closed event loop or session is a local fault: retrying cannot help, and it says nothing about
+                # the health of the API, so the circuit breaker is left alone.
+                log.error("Async API call could not be made: {}".format(e_r))
+                return False, None, self._make_exception_status(4, e_r)
+            except Exception as e_r:
+                error_code, exception = 4, e_r
+
+            if response is not None:
+                self._record_call_return()
+            if response is not None and not self._retry_policy.should_retry_status(response[0]):
+                self._circuit_breaker.record_success()
+                return True, response, None
+
+            delay = self._evalulate_attempt(attempt, retry_after)
+            if delay is None:
+                self._circuit_breaker.record_failure()
+                if response is not None:
+                    return True, response, None
+                return False, None, self._make_exception_status(error_code, exception)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def __get_session(self):
+        loop = asyncio.get_event_loop()
+        if self.__owns_session and self.__session is not None and (self.__session_loop is not loop
+                                                                   or self.__session.closed):
+            log.debug("Event loop changed or session closed, replacing the aiohttp session")
+            self.__session = None
+        if self.__session is None:
+            timeout = aiohttp.ClientTimeout(total=settings.whale_call_timeout_seconds)
+            connector = aiohttp.TCPConnector(limit=self._pool_size, force_close=not self._keep_alive)
+            self.__session = aiohttp.ClientSession(timeout=timeout,
+                                                   connector=connector,
+                                                   headers={'Accept-Encoding': settings.whale_accept_encoding})
+            self.__session_loop = loop
+            self.__session_closer = _close_at_shutdown(self.__session)
+            await self.__session_closer.__anext__()
+        return self.__session
+
+
+async def _close_at_shutdown(session):
+    """ Hold a session open until closed, or until the event loop finalises its asynchronous generators. """
+    try:
+        yield
+    finally:
+        if not session.closed:
+            await session.close()
@@ -0,0 +1,140 @@
+"""
+Concurrent, sharded historical backfill using the Whale Alert API
+"""
+
+import logging
+import asyncio
+import datetime
+import aiohttp
+import whalealert.settings as settings
+from whalealert.api.async_transactions import AsyncTransactions
+from whalealert.api.retry import CircuitBreaker
+
+log = logging.getLogger(__name__)
+
+
+class Backfill():
+    """
+    Fetch a historical time window as a number of concurrently requested shards.
+
+    The window is split into equal sub-windows, and optionally by currency. Each shard follows its own pagnation
+    cursor, with no more than 'concurrency' API calls in flight at once. Transactions from all shards are merged,
+    deduplicated and ordered by timestamp.
+
+    Calls also wait on the rate limiter, which is shared by the whole process unless one is supplied. All shards
+    share one circuit breaker, so once the API is known to be down the remaining shards fail without calling it.
+    """
+    def __init__(self,
+                 shards=settings.API_option_backfill_shards_default,
+                 concurrency=settings.API_option_backfill_concurrency_default,
+                 currencies=None,
+                 rate_limiter=None,
+                 circuit_breaker=None,
+                 base_url=None):
+        if shards < 1:
+            raise ValueError("Backfill requires at least one shard")
+        if concurrency < 1:
+            raise ValueError("Backfill concurrency must be at least one")
+        self.__shards = shards
+        self.__concurrency = concurrency
+        self.__currencies = currencies if currencies else [None]
+        self.__rate_limiter = rate_limiter
+        self.__circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.__base_url = base_url
+
+    def split_window(self, start_time, end_time):
+        """ Split a time window into contiguous, non-overlapping sub-windows.
+
+        Parameters:
+        start_time (int): Unix timestamp from which to start the window (exclusive)
+        end_time (int): Unix timestamp at which to end the window (inclusive)
+
+        Returns:
+        A list of (start_time, end_time) tuples, covering the whole window.
+        """
+        span = end_time - start_time
+        if span <= 0:
+            return []
+        shards = min(self.__shards, span)
+        edges = [start_time + (span * i) // shards for i in range(shards)] + [end_time]
+        return [(edges[i], edges[i + 1]) for i in range(shards)]
+
+    async def fetch(self, start_time, end_time, api_key, min_value, limit=100):
+        """ Fetch every transaction in a time window, using concurrent shards.
+
+        Parameters:
+        start_time (int): Unix timestamp from which to start listing transactions. (exclusive)
+        end_time (int): Unix timestamp from where to stop listing transactions (inclusive).
+        api_key (str): The API key to use for the transaction.
+        min_value (int): The minimum value of transaction to return.
+        limit (int): The maximum number of transactions to request per page (maximum = 100)
+
+        Returns:
+        success (bool): True if every shard was fetched completely, False otherwise.
+        transactions (list): The merged and deduplicated transactions from all shards, ordered by timestamp.
+        status (dict): A status for the whole backfill. On failure, the status of the first failed call.
+        """
+        semaphore = asyncio.Semaphore(self.__concurrency)
+        timeout = aiohttp.ClientTimeout(total=settings.whale_call_timeout_seconds)
+        shards = [(window, currency) for window in self.split_window(start_time, end_time)
+                  for currency in self.__currencies]
+        log.info("Starting backfill from {} to {} with {} shards".format(start_time, end_time, len(shards)))
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            fetches = [
+                self.__fetch_shard(session, semaphore, window, currency, api_key, min_value, limit)
+                for window, currency in shards
+            ]
+            results = await asyncio.gather(*fetches)
+
+        failed = [status for success, pages, status in results if success is not True]
+        transactions = self.merge([page for success, pages, status in results for page in pages])
+        if len(failed) > 0:
+            log.warning("{} of {} backfill shards failed".format(len(failed), len(shards)))
+            return False, transactions, failed[0]
+
+        log.info("Backfill returned {} transactions".format(len(transactions)))
+        return True, transactions, self.__make_status(len(transactions))
+
+    def merge(self, pages):
+        """ Merge pages of transactions, removing duplicates and ordering by timestamp.
+
+        Parameters:
+        pages (list): A list of transaction lists, as returned by get_transactions.
+
+        Returns:
+        A single list of unique transactions, ordered by timestamp.
+        """
+        unique = dict()
+        for page in pages:
+            for transaction in page:
+                key = (transaction[settings.whale_transaction_blockchain], transaction[settings.whale_transaction_id])
+                unique.setdefault(key, transaction)
+        return sorted(unique.values(), key=lambda transaction: transaction[settings.whale_transaction_timestamp])
+
+    async def __fetch_shard(self, session, semaphore, window, currency, api_key, min_value, limit):
+        transactions = AsyncTransactions(session=session,
+                                         rate_limiter=self.__rate_limiter,
+                                         circuit_breaker=self.__circuit_breaker,
+                                         base_url=self.__base_url)
+        start_time, end_time = window
+        cursor = None
+        pages = []
+        while True:
+            async with semaphore:
+                success, page, status = await transactions.get_transactions(start_time, end_time, api_key, cursor,
+                                                                            min_value, limit, currency)
+            if success is not True:
+                return False, pages, status
+            pages.append(page)
+            if len(page) < limit:
+                return True, pages, status
+            cursor = transactions.get_last_cursor()
+
+    def __make_status(self, transaction_count):
+        status = dict()
+        status[settings.status_file_option_timeStamp] = str(datetime.datetime.now().isoformat())
+        status[settings.status_file_option_error_code] = 200
+        status[settings.status_file_option_error_message] = ''
+        status[settings.status_file_option_transaction_count] = transaction_count
+        return status
@@ -0,0 +1,140 @@
+"""
+Pluggable JSON decoding of Whale Alert API responses
+"""
+
+import logging
+import threading
+import time
+import json
+import reprlib
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _decode_json(content):
+    return json.loads(content)
+
+
+def _decode_orjson(content):
+    return orjson.loads(content)
+
+
+BACKENDS = {'json': _decode_json, 'orjson': _decode_orjson}
+
+_preview_repr = reprlib.Repr()
+_preview_repr.maxstring = settings.whale_error_preview_length
+_preview_repr.maxother = settings.whale_error_preview_length
+_preview_repr.maxlevel = 3
+
+
+def preview(value):
+    """ Shorten a response (bytes, str or decoded JSON) for including in an error message """
+    if isinstance(value, (bytes, bytearray)):
+        value = bytes(value[:settings.whale_error_preview_length + 1]).decode('utf-8', errors='replace')
+    if isinstance(value, str):
+        if len(value) > settings.whale_error_preview_length:
+            return value[:settings.whale_error_preview_length] + '...'
+        return value
+    return _preview_repr.repr(value)
+
+
+class Decoder():
+    """
+    Thread safe JSON decoder with decode time statistics
+
+    Responses are parsed directly from the received bytes. The 'json' backend uses the standard library. The
+    'orjson' backend is faster on large pages, but requires the orjson package. The 'auto' backend uses orjson
+    when it is installed, and the standard library otherwise.
+
+    Both backends raise json.JSONDecodeError for malformed responses.
+    """
+    def __init__(self, backend='json'):
+        self.__lock = threading.Lock()
+        self.configure(backend)
+        self.reset_statistics()
+
+    def configure(self, backend):
+        """ Set the decoding backend.
+
+        Parameters:
+        backend (str): One of 'json', 'orjson' or 'auto'.
+        """
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'json'
+        if backend not in BACKENDS:
+            raise ValueError("Unknown JSON decoder '{}', expected one of {}".format(backend, sorted(BACKENDS)))
+        if backend == 'orjson' and orjson is None:
+            raise ValueError("JSON decoder 'orjson' requested, but the orjson package is not installed")
+        with self.__lock:
+            self.__backend = backend
+            self.__decode = BACKENDS[backend]
+        log.debug("JSON decoder using the '{}' backend".format(backend))
+
+    def get_backend(self):
+        """ Get the name of the backend in use """
+        return self.__backend
+
+    def decode(self, content):
+        """ Parse a JSON document.
+
+        Parameters:
+        content (bytes or str): The response body.
+
+        Returns:
+        The decoded JSON object.
+        """
+        start = time.perf_counter()
+        try:
+            return self.__decode(content)
+        finally:
+            self.__record(len(content), time.perf_counter() - start)
+
+    def get_statistics(self):
+        """ Get the decoding statistics.
+
+        Returns:
+        A dictionary containing:
+        - backend: The backend in use.
+        - pages: The number of responses decoded.
+        - total_bytes: The sum of all response sizes.
+        - max_bytes: The largest single response.
+        - average_bytes: The average response size.
+        - total_decode_seconds: The time spent decoding.
+        - average_decode_seconds: The average time spent decoding each response.
+        """
+        with self.__lock:
+            statistics = dict(self.__statistics)
+            statistics['backend'] = self.__backend
+        if statistics['pages'] > 0:
+            statistics['average_bytes'] = statistics['total_bytes'] / statistics['pages']
+            statistics['average_decode_seconds'] = statistics['total_decode_seconds'] / statistics['pages']
+        else:
+            statistics['average_bytes'] = 0.0
+            statistics['average_decode_seconds'] = 0.0
+        return statistics
+
+    def reset_statistics(self):
+        """ Clear all recorded statistics """
+        with self.__lock:
+            self.__statistics = {'pages': 0, 'total_bytes': 0, 'max_bytes': 0, 'total_decode_seconds': 0.0}
+
+    def __record(self, size, elapsed):
+        with self.__lock:
+            self.__statistics['pages'] += 1
+            self.__statistics['total_bytes'] += size
+            self.__statistics['max_bytes'] = max(self.__statistics['max_bytes'], size)
+            self.__statistics['total_decode_seconds'] += elapsed
+
+
+_decoder = Decoder()
+
+
+def get_decoder():
+    """ Get the decoder shared by every Transactions object in this process """
+    return _decoder
@@ -0,0 +1,145 @@
+"""
+Process wide token bucket rate limiter for Whale Alert API calls
+"""
+
+import logging
+import threading
+import asyncio
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter():
+    """
+    Thread safe token bucket rate limiter
+
+    Each call takes a token from the bucket, which refills at requests_per_minute and holds at most burst tokens.
+    When the bucket is empty, the call reserves the next token and waits until it is available, so waiting
+    callers are served in the order they arrived.
+
+    A limiter with requests_per_minute set to None (or 0) never waits, but still records call statistics.
+    """
+    def __init__(self, requests_per_minute=None, burst=1):
+        self.__lock = threading.Lock()
+        self.__recent_calls = deque()
+        self.configure(requests_per_minute, burst)
+        self.reset_statistics()
+
+    def configure(self, requests_per_minute, burst=1):
+        """ Set the allowed call rate.
+
+        Parameters:
+        requests_per_minute (int): The sustained number of calls allowed per minute. None or 0 disables limiting.
+        burst (int): The maximum number of calls which can be made back to back without waiting.
+        """
+        if burst < 1:
+            raise ValueError("Rate limiter burst must be at least one")
+        with self.__lock:
+            if requests_per_minute:
+                self.__rate = requests_per_minute / 60.0
+            else:
+                self.__rate = None
+            self.__requests_per_minute = requests_per_minute
+            self.__burst = burst
+            self.__tokens = float(burst)
+            self.__updated = time.monotonic()
+        log.debug("Rate limiter configured for {} requests per minute, burst {}".format(requests_per_minute, burst))
+
+    def acquire(self):
+        """ Take a token, blocking the calling thread until one is available.
+
+        Returns:
+        wait (float): The number of seconds waited.
+        """
+        wait = self.__reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        """ Take a token, waiting on the event loop until one is available.
+
+        Returns:
+        wait (float): The number of seconds waited.
+        """
+        wait = self.__reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def get_statistics(self):
+        """ Get the limiter's wait time statistics.
+
+        Returns:
+        A dictionary containing:
+        - requests_per_minute: The configured rate, None if unlimited.
+        - burst: The configured burst size.
+        - tokens_available: The number of calls which can currently be made without waiting.
+        - calls: The number of calls made through the limiter.
+        - calls_last_minute: The number of calls made in the last 60 seconds.
+        - throttled_calls: The number of calls which had to wait.
+        - total_wait_seconds: The sum of all waits.
+        - max_wait_seconds: The longest single wait.
+        - average_wait_seconds: The average wait per call.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__trim_recent_calls(now)
+            if self.__rate is None:
+                tokens = float(self.__burst)
+            else:
+                tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+            statistics = dict(self.__statistics)
+            statistics['requests_per_minute'] = self.__requests_per_minute
+            statistics['burst'] = self.__burst
+            statistics['tokens_available'] = round(max(tokens, 0.0), 3)
+            statistics['calls_last_minute'] = len(self.__recent_calls)
+        if statistics['calls'] > 0:
+            statistics['average_wait_seconds'] = statistics['total_wait_seconds'] / statistics['calls']
+        else:
+            statistics['average_wait_seconds'] = 0.0
+        return statistics
+
+    def reset_statistics(self):
+        """ Clear all recorded statistics """
+        with self.__lock:
+            self.__statistics = {'calls': 0, 'throttled_calls': 0, 'total_wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            self.__recent_calls.clear()
+
+    def __reserve(self):
+        with self.__lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self.__rate is not None:
+                self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                self.__tokens = self.__tokens - 1
+                if self.__tokens < 0:
+                    wait = -self.__tokens / self.__rate
+            self.__record(now, wait)
+        if wait > 0:
+            log.debug("Rate limit reached, waiting {:.2f} seconds".format(wait))
+        return wait
+
+    def __record(self, now, wait):
+        self.__statistics['calls'] += 1
+        if wait > 0:
+            self.__statistics['throttled_calls'] += 1
+            self.__statistics['total_wait_seconds'] += wait
+            self.__statistics['max_wait_seconds'] = max(self.__statistics['max_wait_seconds'], wait)
+        self.__recent_calls.append(now + wait)
+        self.__trim_recent_calls(now)
+
+    def __trim_recent_calls(self, now):
+        while len(self.__recent_calls) > 0 and self.__recent_calls[0] < now - 60:
+            self.__recent_calls.popleft()
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    """ Get the rate limiter shared by every Transactions object in this process """
+    return _rate_limiter
@@ -0,0 +1,108 @@
+"""
+Compact record type for a single Whale Alert transaction
+"""
+
+import whalealert.settings as settings
+
+
+class Transaction():
+    """
+    A single transaction, flattened into the database columns
+
+    Records use __slots__, so no per-record dictionary is allocated. Fields are read as attributes
+    (transaction.amount_usd) or by column name (transaction['amount_usd']), and dict(transaction) gives a flat
+    dictionary. Use to_api_format() to get the nested format documented by Whale Alert.
+    """
+
+    FIELDS = tuple(settings.database_columns.keys())
+    ROW_ORDER = tuple(sorted(FIELDS))
+
+    __slots__ = FIELDS
+
+    def __init__(self, *values):
+        """
+        Parameters:
+        values: One value for each column, in the order of Transaction.FIELDS.
+        """
+        if len(values) != len(self.FIELDS):
+            raise TypeError("Transaction takes {} values, {} given".format(len(self.FIELDS), len(values)))
+        for field, value in zip(self.FIELDS, values):
+            setattr(self, field, value)
+
+    @staticmethod
+    def from_dict(transaction):
+        """ Create a record from a flat dictionary with exactly the database columns as keys.
+
+        Raises:
+        KeyError: A column is missing.
+        ValueError: The dictionary has keys which aren't database columns.
+        """
+        if len(transaction) != len(Transaction.FIELDS):
+            unexpected = set(transaction) - set(Transaction.FIELDS)
+            if len(unexpected) > 0:
+                raise ValueError("Unexpected transaction keys {}".format(sorted(unexpected)))
+        return Transaction(*[transaction[field] for field in Transaction.FIELDS])
+
+    def keys(self):
+        return self.FIELDS
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def __eq__(self, other):
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
+
+    def __repr__(self):
+        return "Transaction({})".format(', '.join('{}={!r}'.format(field, getattr(self, field))
+                                                  for field in self.FIELDS))
+
+    def to_tuple(self):
+        """ Get the values in the order of Transaction.FIELDS """
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def to_row(self):
+        """ Get the values in the (alphabetical) column order of the database tables """
+        return [getattr(self, field) for field in self.ROW_ORDER]
+
+    def to_dict(self):
+        """ Get a flat dictionary keyed by the database column names """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def to_api_format(self):
+        """ Get a dictionary in the nested format returned by the Whale Alert API """
+        transaction = {
+            settings.whale_transaction_blockchain: self.blockchain,
+            settings.whale_transaction_symbol: self.symbol,
+            settings.whale_transaction_id: self.id,
+            settings.whale_transaction_transaction_type: self.transaction_type,
+            settings.whale_transaction_hash: self.hash,
+            settings.whale_transaction_from: {
+                settings.whale_transaction_address: self.from_address,
+                settings.whale_transaction_owner_type: self.from_owner_type,
+                settings.whale_transaction_owner: self.from_owner
+            },
+            settings.whale_transaction_to: {
+                settings.whale_transaction_address: self.to_address,
+                settings.whale_transaction_owner_type: self.to_owner_type,
+                settings.whale_transaction_owner: self.to_owner
+            },
+            settings.whale_transaction_timestamp: self.timestamp,
+            settings.whale_transaction_amount: self.amount,
+            settings.whale_transaction_amount_usd: self.amount_usd,
+            settings.whale_transaction_transaction_count: self.transaction_count
+        }
+        return transaction
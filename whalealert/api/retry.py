@@ -0,0 +1,167 @@
+"""
+Retry and circuit breaker policies for Whale Alert API calls
+"""
+
+import logging
+import random
+import threading
+import time
+import datetime
+from email.utils import parsedate_to_datetime
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+
+class RetryPolicy():
+    """
+    Exponential backoff with jitter for failed API calls
+
+    Calls are retried after an exception, or when a response has one of the retry status codes (by default 429 and
+    5xx gateway errors). A Retry-After value sent with the response is honoured. If the server asks for a longer
+    wait than max_delay, the call is not retried.
+    """
+    def __init__(self,
+                 max_retries=settings.whale_retries_on_failure,
+                 base_delay=settings.whale_retry_base_delay_seconds,
+                 max_delay=settings.whale_retry_max_delay_seconds,
+                 jitter=settings.whale_retry_jitter,
+                 retry_status_codes=settings.whale_retry_status_codes):
+        """
+        Parameters:
+        max_retries (int): The number of retries after the first attempt.
+        base_delay (float): The wait before the first retry. The wait doubles for each further retry.
+        max_delay (float): The longest wait allowed between attempts.
+        jitter (float): The fraction (0 to 1) of each wait which is randomised.
+        retry_status_codes (list): HTTP status codes which are retried.
+        """
+        if jitter < 0 or jitter > 1:
+            raise ValueError("Retry jitter must be between 0 and 1")
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_status_codes = frozenset(retry_status_codes)
+
+    def should_retry_status(self, status_code):
+        """ Check if a response with the given HTTP status code should be retried """
+        return status_code in self.retry_status_codes
+
+    def get_delay(self, attempt, retry_after=None):
+        """ Get the wait before retrying a failed attempt.
+
+        Parameters:
+        attempt (int): The number of the attempt which failed, starting at 1.
+        retry_after (float): The wait requested by the server, None if not given.
+
+        Returns:
+        delay (float or None): Seconds to wait before the next attempt, None if the call shouldn't be retried.
+        """
+        if attempt > self.max_retries:
+            return None
+        if retry_after is not None and retry_after > self.max_delay:
+            log.warning("Server requested a retry after {} seconds, longer than the maximum of {}".format(
+                retry_after, self.max_delay))
+            return None
+        delay = min(self.max_delay, self.base_delay * (2**(attempt - 1)))
+        delay = delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value):
+        """ Convert a Retry-After header value (seconds, or a HTTP date) into seconds.
+
+        Returns:
+        seconds (float or None): The requested wait, None if the value is missing or can't be read.
+        """
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+        try:
+            retry_time = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            log.warning("Cannot parse Retry-After header '{}'".format(value))
+            return None
+        if retry_time is None:
+            return None
+        if retry_time.tzinfo is None:
+            retry_time = retry_time.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, (retry_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class CircuitBreaker():
+    """
+    Skip API calls while the API is known to be down
+
+    The breaker opens after failure_threshold consecutive failed calls. While open, calls are refused until
+    reset_timeout seconds have passed, after which a single trial call is allowed (half open). A successful trial
+    closes the breaker, a failed one opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 failure_threshold=settings.whale_circuit_breaker_failure_threshold,
+                 reset_timeout=settings.whale_circuit_breaker_reset_seconds):
+        if failure_threshold < 1:
+            raise ValueError("Circuit breaker failure threshold must be at least one")
+        self.__lock = threading.Lock()
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__state = CircuitBreaker.CLOSED
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__skipped_calls = 0
+
+    def allow_call(self):
+        """ Check if a call should be made.
+
+        Returns:
+        True: The call should go ahead.
+        False: The breaker is open, the call should be skipped.
+        """
+        with self.__lock:
+            if self.__state == CircuitBreaker.CLOSED:
+                return True
+            if self.__state == CircuitBreaker.OPEN and time.monotonic() - self.__opened_at >= self.__reset_timeout:
+                log.info("Circuit breaker half open, allowing a trial API call")
+                self.__state = CircuitBreaker.HALF_OPEN
+                return True
+            self.__skipped_calls += 1
+            return False
+
+    def record_success(self):
+        """ Record a call which reached the API """
+        with self.__lock:
+            if self.__state != CircuitBreaker.CLOSED:
+                log.info("Circuit breaker closed, API calls resumed")
+            self.__state = CircuitBreaker.CLOSED
+            self.__failures = 0
+
+    def record_failure(self):
+        """ Record a call which failed after all retries """
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == CircuitBreaker.HALF_OPEN or self.__failures >= self.__failure_threshold:
+                if self.__state != CircuitBreaker.OPEN:
+                    log.warning("Circuit breaker opened after {} failed calls, skipping calls for {} seconds".format(
+                        self.__failures, self.__reset_timeout))
+                self.__state = CircuitBreaker.OPEN
+                self.__opened_at = time.monotonic()
+
+    def get_state(self):
+        """ Get the breaker state, one of 'closed', 'open' or 'half_open' """
+        with self.__lock:
+            return self.__state
+
+    def get_statistics(self):
+        """ Get the breaker state, consecutive failure count and number of skipped calls as a dictionary """
+        with self.__lock:
+            return {'state': self.__state, 'consecutive_failures': self.__failures, 'skipped_calls': self.__skipped_calls}
@@ -0,0 +1,355 @@
+"""
+Local stand-in for the Whale Alert transactions API, for load and soak testing without the real service
+
+Usage: python -m whalealert.api.standin --port 8080 --transactions 10000 --latency 0.05 --error_rate 0.01
+
+Point WhaleAlert at the server by setting base_url in the API section of the configuration file to the printed
+address (for example base_url = http://127.0.0.1:8080).
+"""
+
+import sys
+import gzip
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import socketserver
+from bisect import bisect_right
+from urllib.parse import urlsplit, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+BLOCKCHAINS = [('bitcoin', 'btc'), ('ethereum', 'eth'), ('ethereum', 'usdt'), ('tron', 'usdt'), ('ripple', 'xrp')]
+OWNERS = [('exchange', 'binance'), ('exchange', 'coinbase'), ('exchange', 'bitfinex'), ('unknown', '')]
+
+
+def synthetic_transactions(count, start_time=None, end_time=None, seed=settings.standin_synthetic_seed):
+    """ Generate transactions in the Whale Alert API format, spread evenly over a time window.
+
+    Parameters:
+    count (int): The number of transactions to generate.
+    start_time (int): Unix timestamp of the first transaction. Default, one hour before end_time.
+    end_time (int): Unix timestamp of the last transaction. Default, now.
+    seed (int): Seed for the random values, the same seed always gives the same transactions.
+
+    Returns:
+    A list of transaction dictionaries, ordered by timestamp.
+    """
+    end_time = int(time.time()) if end_time is None else end_time
+    start_time = end_time - 3600 if start_time is None else start_time
+    generator = random.Random(seed)
+    span = max(end_time - start_time, 0)
+    transactions = []
+    for index in range(count):
+        blockchain, symbol = generator.choice(BLOCKCHAINS)
+        amount_usd = round(500000 * (1 + generator.paretovariate(1.5)), 2)
+        transactions.append({
+            "blockchain": blockchain,
+            "symbol": symbol,
+            "id": str(index + 1),
+            "transaction_type": "transfer",
+            "hash": "{:064x}".format(generator.getrandbits(256)),
+            "from": _make_party(generator),
+            "to": _make_party(generator),
+            "timestamp": start_time + (span * index) // max(count - 1, 1),
+            "amount": round(amount_usd / generator.uniform(0.5, 2), 8),
+            "amount_usd": amount_usd,
+            "transaction_count": 1
+        })
+    return transactions
+
+
+def _make_party(generator):
+    owner_type, owner = generator.choice(OWNERS)
+    party = {"address": "{:040x}".format(generator.getrandbits(160)), "owner_type": owner_type}
+    if owner_type != 'unknown':
+        party["owner"] = owner
+    return party
+
+
+def load_recorded(file_name):
+    """ Load transactions recorded from the real API.
+
+    Parameters:
+    file_name (str): A JSON file holding a response page, a list of response pages or a list of transactions.
+
+    Returns:
+    A list of transaction dictionaries, ordered by timestamp.
+    """
+    with open(file_name, 'r') as recorded:
+        content = json.load(recorded)
+    pages = content if isinstance(content, list) else [content]
+    transactions = []
+    for page in pages:
+        if settings.whale_success_transactions in page:
+            transactions.extend(page[settings.whale_success_transactions])
+        else:
+            transactions.append(page)
+    return sorted(transactions, key=lambda transaction: transaction[settings.whale_transaction_timestamp])
+
+
+class StandInServer():
+    """
+    A local HTTP server which answers transactions requests like the Whale Alert API
+
+    Requests are filtered by start (exclusive), end (inclusive), min_value and currency and paged by limit, which is
+    capped at page_size. Every success response carries a cursor, and a request with a cursor continues after the
+    last transaction returned with it, ignoring start. Bodies are gzip compressed when the client accepts it.
+
+    Failures can be injected: latency delays every response, error_rate is the chance of a 500 error response, and
+    after every burst_every requests the next burst_length are refused with 429 and a Retry-After header.
+
+    The server runs on a background thread between start() and stop(), or as a context manager.
+    """
+    def __init__(self,
+                 transactions=None,
+                 host='127.0.0.1',
+                 port=0,
+                 latency=0.0,
+                 error_rate=0.0,
+                 burst_every=0,
+                 burst_length=1,
+                 page_size=settings.standin_maximum_page_size,
+                 seed=settings.standin_synthetic_seed):
+        if not 0 <= error_rate <= 1:
+            raise ValueError("Error rate must be between 0 and 1")
+        if page_size < 1:
+            raise ValueError("Page size must be at least one")
+        self.__transactions = list(transactions) if transactions is not None else synthetic_transactions(1000)
+        self.__transactions.sort(key=lambda transaction: transaction[settings.whale_transaction_timestamp])
+        self.__timestamps = [transaction[settings.whale_transaction_timestamp] for transaction in self.__transactions]
+        self.__address = (host, port)
+        self.__latency = latency
+        self.__error_rate = error_rate
+        self.__burst_every = burst_every
+        self.__burst_length = burst_length
+        self.__page_size = page_size
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__thread = None
+        self.reset_statistics()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+
+    def start(self):
+        """ Start serving requests on a background thread """
+        if self.__server is not None:
+            return
+        self.__server = _Server(self.__address, _Handler)
+        self.__server.standin = self
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        log.info("Stand-in API server listening at {}".format(self.get_base_url()))
+
+    def stop(self):
+        """ Stop serving requests and close the listening socket """
+        if self.__server is None:
+            return
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+        self.__server = None
+        self.__thread = None
+
+    def get_base_url(self):
+        """ Get the address to use as the API base_url
+
+        Returns:
+        base_url (str): The server address, or None if the server is not running.
+        """
+        if self.__server is None:
+            return None
+        host, port = self.__server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def get_statistics(self):
+        """ Get counts of the requests served.
+
+        Returns:
+        A dictionary containing:
+        - requests: The number of requests received.
+        - pages: Success responses sent.
+        - transactions: Transactions sent in success responses.
+        - errors: Error responses sent because of the error rate.
+        - throttled: 429 responses sent because of a burst.
+        - rejected: Error responses sent for bad requests (unknown path, missing parameters or a bad cursor).
+        """
+        with self.__lock:
+            return dict(self.__statistics)
+
+    def reset_statistics(self):
+        """ Clear the request counts """
+        with self.__lock:
+            self.__statistics = {
+                'requests': 0,
+                'pages': 0,
+                'transactions': 0,
+                'errors': 0,
+                'throttled': 0,
+                'rejected': 0
+            }
+
+    def respond(self, path, query):
+        """ Form the response to a request.
+
+        Parameters:
+        path (str): The requested path.
+        query (dict): The query parameters, each mapped to its last value.
+
+        Returns:
+        status_code (int): The HTTP status code.
+        body (dict): The JSON response body.
+        headers (dict): Any extra response headers.
+        """
+        with self.__lock:
+            self.__statistics['requests'] += 1
+            request_number = self.__statistics['requests']
+            failed = self.__error_rate > 0 and self.__random.random() < self.__error_rate
+        if self.__latency > 0:
+            time.sleep(self.__latency)
+
+        cycle = self.__burst_every + self.__burst_length
+        if self.__burst_every > 0 and (request_number - 1) % cycle >= self.__burst_every:
+            self.__count('throttled')
+            return 429, self.__error("rate limit exceeded"), {'Retry-After': str(settings.standin_retry_after_seconds)}
+        if failed:
+            self.__count('errors')
+            return 500, self.__error("internal server error"), {}
+        if path.rstrip('/') != settings.whale_transactions_path:
+            self.__count('rejected')
+            return 404, self.__error("not found"), {}
+
+        try:
+            return 200, self.__make_page(query), {}
+        except (KeyError, ValueError) as e_r:
+            self.__count('rejected')
+            return 400, self.__error("invalid request: {}".format(e_r)), {}
+
+    def __make_page(self, query):
+        if not query.get('api_key'):
+            raise KeyError('api_key')
+        limit = min(int(query.get('limit', self.__page_size)), self.__page_size)
+        min_value = float(query.get('min_value', 0))
+        currency = query.get('currency')
+        end_time = int(query['end']) if 'end' in query else None
+
+        if 'cursor' in query:
+            position = int(query['cursor'], 16)
+            if not 0 <= position <= len(self.__transactions):
+                raise ValueError('cursor')
+        else:
+            position = bisect_right(self.__timestamps, int(query['start']))
+
+        page = []
+        while position < len(self.__transactions) and len(page) < limit:
+            transaction = self.__transactions[position]
+            if end_time is not None and transaction[settings.whale_transaction_timestamp] > end_time:
+                break
+            position += 1
+            if transaction[settings.whale_transaction_amount_usd] < min_value:
+                continue
+            if currency is not None and transaction[settings.whale_transaction_symbol] != currency:
+                continue
+            page.append(transaction)
+
+        with self.__lock:
+            self.__statistics['pages'] += 1
+            self.__statistics['transactions'] += len(page)
+        body = {
+            settings.whale_success_result: 'success',
+            settings.whale_success_cursor: '{:x}'.format(position),
+            settings.whale_success_count: len(page)
+        }
+        if len(page) > 0:
+            body[settings.whale_success_transactions] = page
+        return body
+
+    def __count(self, statistic):
+        with self.__lock:
+            self.__statistics[statistic] += 1
+
+    def __error(self, message):
+        return {settings.whale_success_result: 'error', settings.whale_error_message: message}
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        status_code, body, headers = self.server.standin.respond(url.path, query)
+
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content)
+            self.send_header('Content-Encoding', 'gzip')
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        log.debug("Stand-in request from {}: {}".format(self.address_string(), format % args))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Whale Alert transactions API")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on. (default = 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on. (default = 8080)")
+    parser.add_argument('--transactions',
+                        type=int,
+                        default=1000,
+                        help="Number of synthetic transactions, spread over the last hour. (default = 1000)")
+    parser.add_argument('--recorded', default=None, help="Serve transactions recorded from the API in this JSON file.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="Fraction of requests answered with a 500.")
+    parser.add_argument('--burst_every', type=int, default=0, help="Refuse requests with 429 every this many requests.")
+    parser.add_argument('--burst_length', type=int, default=1, help="Number of requests refused in each burst.")
+    parser.add_argument('--page_size',
+                        type=int,
+                        default=settings.standin_maximum_page_size,
+                        help="Maximum transactions per page.")
+    args = parser.parse_args(arguments)
+
+    if args.recorded is not None:
+        transactions = load_recorded(args.recorded)
+    else:
+        transactions = synthetic_transactions(args.transactions)
+    server = StandInServer(transactions,
+                           host=args.host,
+                           port=args.port,
+                           latency=args.latency,
+                           error_rate=args.error_rate,
+                           burst_every=args.burst_every,
+                           burst_length=args.burst_length,
+                           page_size=args.page_size)
+    server.start()
+    print("Serving {} transactions at {}".format(len(transactions), server.get_base_url()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        print(server.get_statistics())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,9 +6,13 @@ import logging
 import json
 import time
 import datetime
-from requests import Session
 from requests.exceptions import Timeout, TooManyRedirects
 import whalealert.settings as settings
+from whalealert.api.ratelimit import get_rate_limiter
+from whalealert.api.retry import RetryPolicy, CircuitBreaker
+from whalealert.api.decoder import get_decoder, preview
+from whalealert.api.validator import TransactionValidator, ValidationError
+from whalealert.api.transport import make_session, transactions_url, TransportStatistics
 
 log = logging.getLogger(__name__)
 
@@ -16,9 +20,41 @@ log = logging.getLogger(__name__)
 class Transactions():
     """
     API wrapper for getting transactions from Whale Alert API
+
+    Every call attempt first takes a token from the rate limiter. By default this is the limiter shared by all
+    Transactions objects in the process.
+
+    Exceptions and retryable status codes (429 and 5xx) are retried according to the retry policy. Calls which fail
+    after all retries trip the circuit breaker, and while it is open calls are skipped with error code 11.
+
+    Calls share a pooled, keep-alive session which asks for gzip or deflate compressed responses. Connection reuse,
+    compression and timing for each call are available from get_transport_statistics().
+
+    Calls go to the Whale Alert API unless another base_url, such as a local stand-in server, is given.
+
+    Responses are decoded from the received bytes by the decoder, by default the one shared by the process.
+    Transactions are returned as flat Transaction records (see whalealert.api.record).
     """
-    def __init__(self):
-        self.__session = Session()
+
+    _validator = TransactionValidator()
+
+    def __init__(self,
+                 rate_limiter=None,
+                 retry_policy=None,
+                 circuit_breaker=None,
+                 decoder=None,
+                 pool_size=settings.API_option_connection_pool_size_default,
+                 keep_alive=settings.API_option_keep_alive_default,
+                 base_url=None):
+        self.__session = self._make_session(pool_size, keep_alive)
+        self._transport_statistics = TransportStatistics() if self.__session is not None else None
+        self._url = transactions_url(base_url)
+        self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        self._rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+        self._decoder = decoder if decoder is not None else get_decoder()
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self._circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
         self.__last_timestamp = int(time.time())
         self.__last_cursor = None
         self.__call_return_time = int(time.time())
@@ -40,7 +76,7 @@ class Transactions():
         """
         return self.__last_cursor
 
-    def get_transactions(self, start_time, end_time, api_key, cursor, min_value, limit):
+    def get_transactions(self, start_time, end_time, api_key, cursor, min_value, limit, currency=None):
         """ Make an API call to Whale Alert to get the latest transactions.
 
         The free API has the following limitions:
@@ -55,165 +91,153 @@ class Transactions():
         cursor (str): The pagnation cursor from a previous transaction. Use None to ignore this parameter.
         min_value (int): The minimum value of transaction to return.
         limit (int): The maximum number of transactions to return (maximum = 100)
+        currency (str): Only return transactions for this currency code. Use None to return all currencies.
 
         Returns:
         success (bool) : If true, then a successful call was made (Return code of 200). Return false otherwise.
         transactions (list or None):
-        - success = True: A list containing a dictionary for each transaction.
+        - success = True: A list containing a Transaction record for each transaction.
         - success = False: None
         status (dict): A dictionary containing the timestamp, error_code and error_message for the transaction.
         """
-        parameters = self.__form_request(start_time, end_time, api_key, cursor, min_value, limit)
-        log.debug("Attempting API call at '{}' with parameters '{}'".format(settings.whale_get_transactions_url,
-                                                                            parameters))
+        parameters = self._form_request(start_time, end_time, api_key, cursor, min_value, limit, currency)
+        log.debug("Attempting API call at '{}' with parameters '{}'".format(self._url, parameters))
 
         success, response, status = self.__attempt_call(parameters)
         if success is not True:
             return success, None, status
 
-        success, transactions, status = self.__check_response(response)
+        success, transactions, status = self._check_response(response.status_code, response.content)
         return success, transactions, status
 
     def __attempt_call(self, parameters):
-        retries = settings.whale_retries_on_failure
+        if not self._circuit_breaker.allow_call():
+            return False, None, self._make_circuit_open_status()
         attempt = 1
-        while retries >= 0:
+        while True:
+            response, retry_after = None, None
             try:
-                response = self.__session.get(settings.whale_get_transactions_url,
+                self._rate_limiter.acquire()
+                call_start = time.perf_counter()
+                response = self.__session.get(self._url,
                                               params=parameters,
                                               timeout=settings.whale_call_timeout_seconds)
-                self.__call_return_time = int(time.time())
-                retries = -1
-            except ConnectionError:
-                retries, attempt, done = self.__evalulate_attempt(retries, attempt)
-                if not done:
-                    continue
-                status = self.__make_custom_status(1, "Internal error: Connection exception when conduction API call",
-                                                   0)
-                return False, None, status
-            except Timeout:
-                retries, attempt, done = self.__evalulate_attempt(retries, attempt)
-                if not done:
-                    continue
-                status = self.__make_custom_status(2, "Internal error: Timeout exception when conduction API call", 0)
-                return False, None, status
-            except TooManyRedirects:
-                retries, attempt, done = self.__evalulate_attempt(retries, attempt)
-                if not done:
-                    continue
-                status = self.__make_custom_status(
-                    3, "Internal error: TooManyRedirect exception when conduction API call", 0)
-                return False, None, status
+                elapsed = time.perf_counter() - call_start
+            except ConnectionError as e_r:
+                error_code, exception = 1, e_r
+            except Timeout as e_r:
+                error_code, exception = 2, e_r
+            except TooManyRedirects as e_r:
+                error_code, exception = 3, e_r
             except Exception as e_r:
-                retries, attempt, done = self.__evalulate_attempt(retries, attempt)
-                if not done:
-                    continue
-                status = self.__make_custom_status(4,
-                                                   "Internal error: Exception {} when conduction API call".format(e_r),
-                                                   0)
-                return False, None, status
-        return True, response, None
-
-    def __evalulate_attempt(self, retries, attempt):
-        if retries >= 1:
-            retries = retries - 1
-            time.sleep(2 * attempt)
-            log.warning("Exception occurred on API call attempt {} of {}".format(attempt,
-                                                                                 settings.whale_retries_on_failure))
-            attempt = attempt + 1
-            done = False
+                error_code, exception = 4, e_r
+
+            if response is not None:
+                self._record_call_return()
+                self._transport_statistics.record(self.__session, response, elapsed)
+                if not self._retry_policy.should_retry_status(response.status_code):
+                    self._circuit_breaker.record_success()
+                    return True, response, None
+                headers = getattr(response, 'headers', None)
+                retry_after = RetryPolicy.parse_retry_after(headers.get('Retry-After') if headers else None)
+
+            delay = self._evalulate_attempt(attempt, retry_after)
+            if delay is None:
+                self._circuit_breaker.record_failure()
+                if response is not None:
+                    return True, response, None
+                return False, None, self._make_exception_status(error_code, exception)
+            time.sleep(delay)
+            attempt += 1
+
+    def _make_session(self, pool_size, keep_alive):
+        """ Make the requests session used for calls. Subclasses which make calls another way return None. """
+        return make_session(pool_size, keep_alive)
+
+    def get_transport_statistics(self):
+        """ Get connection reuse, compression and timing statistics for calls made by this object
+
+        See TransportStatistics.get_statistics for the returned keys.
+
+        Returns:
+        statistics (dict): The statistics, or None if no requests session is used (see _make_session).
+        """
+        if self._transport_statistics is None:
+            return None
+        return self._transport_statistics.get_statistics()
+
+    def get_circuit_breaker(self):
+        """ Get the circuit breaker guarding this object's API calls """
+        return self._circuit_breaker
+
+    def _evalulate_attempt(self, attempt, retry_after=None):
+        """ Decide if a failed call should be retried.
+
+        Parameters:
+        attempt (int): The number of the attempt which failed, starting at 1.
+        retry_after (float): The wait requested by the server with the response, None if not given.
+
+        Returns:
+        delay (float or None): Seconds to wait before the next attempt, None if the call shouldn't be retried.
+        """
+        delay = self._retry_policy.get_delay(attempt, retry_after)
+        if delay is not None:
+            log.warning("API call attempt {} of {} failed, retrying in {:.1f} seconds".format(
+                attempt, self._retry_policy.max_retries + 1, delay))
+        return delay
+
+    def _make_circuit_open_status(self):
+        return self._make_custom_status(
+            11, "Internal error: API call skipped, circuit breaker open after repeated failed calls", 0)
+
+    def _record_call_return(self):
+        self.__call_return_time = int(time.time())
+
+    def _make_exception_status(self, error_code, exception):
+        if error_code == 1:
+            message = "Internal error: Connection exception when conduction API call"
+        elif error_code == 2:
+            message = "Internal error: Timeout exception when conduction API call"
+        elif error_code == 3:
+            message = "Internal error: TooManyRedirect exception when conduction API call"
         else:
-            done = True
-        return retries, attempt, done
+            message = "Internal error: Exception {} when conduction API call".format(exception)
+        return self._make_custom_status(error_code, message, 0)
 
-    def __check_response(self, response):
+    def _check_response(self, status_code, content):
         try:
-            json_fields = json.loads(response.text)
+            json_fields = self._decoder.decode(content)
         except json.decoder.JSONDecodeError:
-            status = self.__make_custom_status(5, "Internal error: Error parsing JSON object from received response", 0)
+            status = self._make_custom_status(5, "Internal error: Error parsing JSON object from received response", 0)
             return False, None, status
         except Exception as e:
-            status = self.__make_custom_status(
+            status = self._make_custom_status(
                 6,
                 "Internal error: Exception {} when parsing JSON object from received response. Response =  {}".format(
-                    e, response.text), 0)
+                    e, preview(content)), 0)
             return False, None, status
 
-        if response.status_code != 200:
-            status = self.__parse_error_response(json_fields, response.status_code)
+        if status_code != 200:
+            status = self.__parse_error_response(json_fields, status_code)
             return False, None, status
 
         success, transactions, status = self.__parse_good_response(json_fields)
         return success, transactions, status
 
     def __parse_good_response(self, json_fields):
-        good_keys, count, status = self.__check_main_keys(json_fields)
-        if good_keys is False:
-            return False, None, status
-
-        if count == 0:
-            log.info("Successful API call returned {} transactions".format(count))
-            return True, [], self.__make_custom_status(200, '', 0)
+        try:
+            cursor, transactions = self._validator.validate_page(json_fields)
+        except ValidationError as e_r:
+            return False, None, self._make_custom_status(e_r.error_code, str(e_r), 0)
 
-        good_keys, transactions, status = self.__check_transactions_keys(json_fields)
-        if good_keys is False:
-            return False, None, status
+        if len(transactions) == 0:
+            log.info("Successful API call returned {} transactions".format(0))
+            return True, [], self._make_custom_status(200, '', 0)
 
-        self.__last_cursor = json_fields[settings.whale_success_cursor]
+        self.__last_cursor = cursor
         self.__last_timestamp = self.__call_return_time
         log.info("Successful API call returned {} transactions".format(len(transactions)))
-        return True, transactions, self.__make_custom_status(200, '', count)
-
-    def __check_transactions_keys(self, json_fields):
-        for transaction in json_fields[settings.whale_success_transactions]:
-            try:
-                dummy = transaction[settings.whale_transaction_blockchain]
-                dummy = transaction[settings.whale_transaction_symbol]
-                dummy = transaction[settings.whale_transaction_id]
-                dummy = transaction[settings.whale_transaction_transaction_type]
-                dummy = transaction[settings.whale_transaction_hash]
-                dummy = transaction[settings.whale_transaction_from][settings.whale_transaction_address]
-                dummy = transaction[settings.whale_transaction_to][settings.whale_transaction_address]
-                dummy = transaction[settings.whale_transaction_timestamp]
-                dummy = transaction[settings.whale_transaction_amount]
-                dummy = transaction[settings.whale_transaction_amount_usd]
-                dummy = transaction[settings.whale_transaction_transaction_count]
-
-                owner_type = transaction[settings.whale_transaction_from][settings.whale_transaction_owner_type]
-                transaction[settings.whale_transaction_symbol] = transaction[settings.whale_transaction_symbol].upper()
-                if owner_type != 'unknown':
-                    dummy = transaction[settings.whale_transaction_from][settings.whale_transaction_owner]
-                else:
-                    transaction[settings.whale_transaction_from][settings.whale_transaction_owner] = ''
-
-                owner_type = transaction[settings.whale_transaction_to][settings.whale_transaction_owner_type]
-                if owner_type != 'unknown':
-                    dummy = transaction[settings.whale_transaction_to][settings.whale_transaction_owner]
-                else:
-                    transaction[settings.whale_transaction_to][settings.whale_transaction_owner] = ''
-            except KeyError:
-                return False, None, self.__make_custom_status(
-                    10, 'Internal error: Error with transactions JSON keys, bad transaction = {}'.format(transaction),
-                    0)
-        return True, json_fields[settings.whale_success_transactions], None
-
-    def __check_main_keys(self, json_fields):
-        try:
-            dummy = json_fields[settings.whale_success_result]
-            dummy = json_fields[settings.whale_success_cursor]
-            count = json_fields[settings.whale_success_count]
-            if count > 0:
-                transactions = json_fields[settings.whale_success_transactions]
-                if len(transactions) != count:
-                    status = self.__make_custom_status(
-                        8, "Internal error: Transaction count doesn't match reported count. Response = {}".format(
-                            json_fields), 0)
-                    return False, 0, status
-        except KeyError:
-            status = self.__make_custom_status(
-                9, "Internal error: Problem parsing main keys. Response = {}".format(json_fields), 0)
-            return False, 0, status
-        return True, count, None
+        return True, transactions, self._make_custom_status(200, '', len(transactions))
 
     def __parse_error_response(self, json_response, code):
         try:
@@ -221,10 +245,10 @@ class Transactions():
         except Exception as e_r:
             code = 7
             message = "Internal error: Cannot read message from error response. Response = {}, Exception = {}".format(
-                json_response, e_r)
-        return self.__make_custom_status(code, message, 0)
+                preview(json_response), e_r)
+        return self._make_custom_status(code, message, 0)
 
-    def __make_custom_status(self, errNo, message, transaction_count):
+    def _make_custom_status(self, errNo, message, transaction_count):
         custom_status = dict()
         custom_status[settings.status_file_option_timeStamp] = str(datetime.datetime.now().isoformat())
         custom_status[settings.status_file_option_error_code] = errNo
@@ -234,7 +258,7 @@ class Transactions():
             log.error(message)
         return custom_status
 
-    def __form_request(self, start_time, end_time, api_key, cursor, min_value, limit):
+    def _form_request(self, start_time, end_time, api_key, cursor, min_value, limit, currency=None):
         call_parameters = {}
 
         # Required for every call
@@ -249,4 +273,7 @@ class Transactions():
         if cursor is not None:
             call_parameters['cursor'] = cursor
 
+        if currency is not None:
+            call_parameters['currency'] = currency
+
         return call_parameters
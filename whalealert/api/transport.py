@@ -0,0 +1,151 @@
+"""
+HTTP connection pool set up and transport statistics for Whale Alert API calls
+"""
+
+import logging
+import threading
+from urllib.parse import urlsplit
+from requests import Session
+from requests.adapters import HTTPAdapter
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+
+def transactions_url(base_url=None):
+    """ Get the transactions endpoint for an API base address.
+
+    Parameters:
+    base_url (str): The API address, for example a local stand-in server. None uses settings.whale_get_transactions_url.
+
+    Returns:
+    url (str): The address of the transactions endpoint.
+    """
+    if base_url is None:
+        return settings.whale_get_transactions_url
+    return base_url.rstrip('/') + settings.whale_transactions_path
+
+
+def make_session(pool_size=settings.API_option_connection_pool_size_default,
+                 keep_alive=settings.API_option_keep_alive_default):
+    """ Create a requests session with a tuned connection pool.
+
+    Parameters:
+    pool_size (int): The maximum number of connections kept open to each host.
+    keep_alive (bool): Keep connections open between calls. If False, a new connection is made for every call.
+
+    Returns:
+    session (Session): A session which requests gzip or deflate compressed responses.
+    """
+    if pool_size < 1:
+        raise ValueError("Connection pool size must be at least one")
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = settings.whale_accept_encoding
+    session.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+    return session
+
+
+class TransportStatistics():
+    """
+    Thread safe counters describing what happened on the wire for each API call
+
+    Connection reuse is found from the number of connections the pool has opened, wire bytes from the position of
+    the raw (undecoded) response stream and time to first byte from the response's elapsed time.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__pool_connections = dict()
+        self.reset_statistics()
+
+    def record(self, session, response, total_seconds):
+        """ Record the transport details of a completed call.
+
+        Parameters:
+        session (Session): The session used for the call.
+        response (Response): The received response, after its content has been read.
+        total_seconds (float): The time taken for the whole call, including reading the content.
+        """
+        raw = getattr(response, 'raw', None)
+        if raw is None or not hasattr(raw, 'tell'):
+            return
+        new_connection = self.__opened_new_connection(session, response)
+        wire_bytes = raw.tell()
+        decoded_bytes = len(response.content)
+        encoding = response.headers.get('Content-Encoding', '')
+        ttfb = response.elapsed.total_seconds()
+
+        with self.__lock:
+            self.__statistics['calls'] += 1
+            if new_connection is True:
+                self.__statistics['new_connections'] += 1
+            elif new_connection is False:
+                self.__statistics['reused_connections'] += 1
+            if encoding in ('gzip', 'deflate'):
+                self.__statistics['compressed_responses'] += 1
+            self.__statistics['wire_bytes'] += wire_bytes
+            self.__statistics['decoded_bytes'] += decoded_bytes
+            self.__statistics['total_ttfb_seconds'] += ttfb
+            self.__statistics['total_seconds'] += total_seconds
+
+    def get_statistics(self):
+        """ Get the transport statistics.
+
+        Returns:
+        A dictionary containing:
+        - calls: The number of responses recorded.
+        - new_connections: Calls which had to open a new connection.
+        - reused_connections: Calls made on a connection kept open from an earlier call.
+        - compressed_responses: Responses sent with gzip or deflate encoding.
+        - wire_bytes: Response body bytes received, before decompression.
+        - decoded_bytes: Response body bytes after decompression.
+        - compression_saving: The fraction of bytes saved by compression.
+        - total_ttfb_seconds / average_ttfb_seconds: Time from sending a request to receiving the response headers.
+        - total_seconds / average_seconds: Time for the whole call, including reading the body.
+        """
+        with self.__lock:
+            statistics = dict(self.__statistics)
+        calls = statistics['calls']
+        statistics['average_ttfb_seconds'] = statistics['total_ttfb_seconds'] / calls if calls > 0 else 0.0
+        statistics['average_seconds'] = statistics['total_seconds'] / calls if calls > 0 else 0.0
+        if statistics['decoded_bytes'] > 0:
+            statistics['compression_saving'] = round(1 - statistics['wire_bytes'] / statistics['decoded_bytes'], 4)
+        else:
+            statistics['compression_saving'] = 0.0
+        return statistics
+
+    def reset_statistics(self):
+        """ Clear all recorded statistics """
+        with self.__lock:
+            self.__statistics = {
+                'calls': 0,
+                'new_connections': 0,
+                'reused_connections': 0,
+                'compressed_responses': 0,
+                'wire_bytes': 0,
+                'decoded_bytes': 0,
+                'total_ttfb_seconds': 0.0,
+                'total_seconds': 0.0
+            }
+
+    def __opened_new_connection(self, session, response):
+        # A connection closed after the previous response is silently reopened by the pool without counting it, so
+        # the Connection header of the previous exchange is tracked along with the pool's count.
+        # Pools are looked up from the existing keys, creating one here would evict the pool requests is using.
+        parts = urlsplit(response.url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        try:
+            pools = session.get_adapter(response.url).poolmanager.pools
+            opened = sum(pools[key].num_connections for key in pools.keys()
+                         if key.key_host == parts.hostname and key.key_port == port)
+        except Exception as e_r:
+            log.debug("Cannot read connection pool for {}. Exception {}".format(response.url, e_r))
+            return None
+        closing = 'close' in (response.headers.get('Connection', '').lower(),
+                              response.request.headers.get('Connection', '').lower())
+        with self.__lock:
+            previous, closed = self.__pool_connections.get(parts.netloc, (0, True))
+            self.__pool_connections[parts.netloc] = (opened, closing)
+        return closed or opened != previous
@@ -0,0 +1,96 @@
+"""
+Schema driven validation of Whale Alert API responses
+"""
+
+import logging
+from operator import itemgetter
+import whalealert.settings as settings
+from whalealert.api.decoder import preview
+from whalealert.api.record import Transaction
+
+log = logging.getLogger(__name__)
+
+
+class ValidationError(ValueError):
+    """ A response which doesn't match the expected schema, carrying the status error code to report """
+    def __init__(self, error_code, message):
+        super().__init__(message)
+        self.error_code = error_code
+
+
+class TransactionValidator():
+    """
+    Validate, normalise and flatten transactions in a single pass
+
+    The schema is compiled once from the field names in settings. Each transaction is checked for every required
+    field, the symbol is upper-cased, the owner of 'unknown' parties is blanked, and the 'from' and 'to' parties are
+    flattened into the database columns. The result is one Transaction record per transaction.
+    """
+    def __init__(self):
+        self.__get_scalars = itemgetter(settings.whale_transaction_blockchain, settings.whale_transaction_symbol,
+                                        settings.whale_transaction_id, settings.whale_transaction_transaction_type,
+                                        settings.whale_transaction_hash, settings.whale_transaction_timestamp,
+                                        settings.whale_transaction_amount, settings.whale_transaction_amount_usd,
+                                        settings.whale_transaction_transaction_count)
+        self.__get_parties = itemgetter(settings.whale_transaction_from, settings.whale_transaction_to)
+        self.__get_party = itemgetter(settings.whale_transaction_address, settings.whale_transaction_owner_type)
+        self.__get_owner = itemgetter(settings.whale_transaction_owner)
+        self.__get_main_keys = itemgetter(settings.whale_success_result, settings.whale_success_cursor,
+                                          settings.whale_success_count)
+        self.__get_transactions = itemgetter(settings.whale_success_transactions)
+
+    def validate_page(self, json_fields):
+        """ Validate a decoded successful response, and flatten its transactions.
+
+        Parameters:
+        json_fields (dict): The decoded response.
+
+        Returns:
+        cursor (str): The pagnation cursor of the response.
+        transactions (list): A Transaction record for each transaction.
+
+        Raises:
+        ValidationError: The response doesn't match the schema. error_code is 8 for a count mismatch, 9 for missing
+        main keys and 10 for a bad transaction.
+        """
+        try:
+            result, cursor, count = self.__get_main_keys(json_fields)
+            if count == 0:
+                return cursor, []
+            transactions = self.__get_transactions(json_fields)
+        except (KeyError, TypeError):
+            raise ValidationError(
+                9, "Internal error: Problem parsing main keys. Response = {}".format(preview(json_fields)))
+        if len(transactions) != count:
+            raise ValidationError(
+                8, "Internal error: Transaction count doesn't match reported count. Response = {}".format(
+                    preview(json_fields)))
+        return cursor, [self.validate(transaction) for transaction in transactions]
+
+    def validate(self, transaction):
+        """ Validate and flatten a single transaction.
+
+        Parameters:
+        transaction (dict): A transaction as received from the API.
+
+        Returns:
+        A Transaction record.
+
+        Raises:
+        ValidationError: A required field is missing (error_code 10).
+        """
+        try:
+            blockchain, symbol, transaction_id, transaction_type, transaction_hash, timestamp, amount, amount_usd, \
+                transaction_count = self.__get_scalars(transaction)
+            from_party, to_party = self.__get_parties(transaction)
+            from_address, from_type = self.__get_party(from_party)
+            from_owner = '' if from_type == 'unknown' else self.__get_owner(from_party)
+            to_address, to_type = self.__get_party(to_party)
+            to_owner = '' if to_type == 'unknown' else self.__get_owner(to_party)
+            return Transaction(blockchain, symbol.upper(), transaction_id, transaction_type, transaction_hash,
+                               from_address, from_owner, from_type, to_address, to_owner, to_type, timestamp, amount,
+                               amount_usd, transaction_count)
+        except (KeyError, TypeError, AttributeError):
+            raise ValidationError(
+                10, 'Internal error: Error with transactions JSON keys, bad transaction = {}'.format(
+                    preview(transaction)))
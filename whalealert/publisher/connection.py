@@ -0,0 +1,86 @@
+"""
+Database connections: the tuned read-write connection used by the writer and read-only connections used for queries.
+
+The database is kept in write-ahead log (WAL) mode, so readers see the last committed transactions without blocking the
+writer, and a commit never makes a running query fail with "database is locked".
+"""
+
+import logging
+import os
+import sqlite3
+from urllib.request import pathname2url
+from dbops.sqhelper import SQHelper
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+
+def open_writer(file_location):
+    """ Open the database for writing, switching it to WAL journaling.
+
+    Parameters:
+    file_location (str): Path to the database file, created if it doesn't exist.
+
+    Returns:
+    database (SQHelper): The database, check database.exists() for success.
+    """
+    database = SQHelper(file_location)
+    if database.con is None:
+        return database
+    database.con.close()
+    database.con = _connect(file_location, read_only=False)
+    return database
+
+
+def open_reader(file_location):
+    """ Open an existing database for reading only.
+
+    Queries on the returned connection can't take the write lock, so they never stall ingestion by another connection
+    or process. The database should already be in WAL mode, see open_writer.
+
+    Parameters:
+    file_location (str): Path to the database file.
+
+    Returns:
+    database (SQHelper): The database, check database.exists() for success.
+    None: The database file doesn't exist.
+    """
+    if not os.path.exists(file_location):
+        log.error("Cannot open database {} for reading, it doesn't exist".format(file_location))
+        return None
+    database = SQHelper(file_location)
+    if database.con is None:
+        return database
+    database.con.close()
+    database.con = _connect(file_location, read_only=True)
+    return database
+
+
+def get_journal_mode(connection):
+    """ Get the journal mode of the database, e.g. 'wal' """
+    return connection.execute("PRAGMA journal_mode").fetchone()[0]
+
+
+def _connect(file_location, read_only):
+    # Connections are never used by two threads at the same time, but may be handed from one thread to another
+    try:
+        if read_only:
+            connection = sqlite3.connect("file:{}?mode=ro".format(pathname2url(file_location)),
+                                         uri=True,
+                                         timeout=settings.database_busy_timeout_seconds,
+                                         check_same_thread=False)
+        else:
+            connection = sqlite3.connect(file_location,
+                                         timeout=settings.database_busy_timeout_seconds,
+                                         check_same_thread=False)
+            mode = connection.execute("PRAGMA journal_mode = {}".format(settings.database_journal_mode)).fetchone()[0]
+            if mode.upper() != settings.database_journal_mode:
+                log.warning("Database {} is using journal mode {}, not {}".format(file_location, mode,
+                                                                                  settings.database_journal_mode))
+            connection.execute("PRAGMA synchronous = {}".format(settings.database_synchronous))
+        connection.execute("PRAGMA cache_size = {:d}".format(-settings.database_cache_size_kib))
+        connection.execute("PRAGMA mmap_size = {:d}".format(settings.database_mmap_size_bytes))
+    except sqlite3.Error as e_r:
+        log.error("Cannot connect to database {}, raised exception {}.".format(file_location, e_r))
+        return None
+    return connection
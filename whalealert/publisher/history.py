@@ -0,0 +1,190 @@
+"""
+Persistent history of API calls, with rolling health, error and latency aggregates over several time windows
+"""
+
+import bisect
+import logging
+import sqlite3
+import threading
+from collections import deque, Counter
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, 1 ms to 100 s in steps of about 26 %
+LATENCY_BUCKETS = [0.001 * 10**(index / 10) for index in range(51)]
+
+
+class RollingWindow():
+    """
+    Aggregates of the calls made in the last `seconds` seconds
+
+    Calls are added in time order and expire from the front, so each call is added and removed once and the
+    aggregates are never recalculated from scratch. Latency percentiles come from a fixed size histogram.
+    """
+    def __init__(self, seconds, maximum_calls):
+        self.seconds = seconds
+        self.__maximum_calls = maximum_calls
+        self.__calls = deque()
+        self.__successful = 0
+        self.__rows = 0
+        self.__errors = Counter()
+        self.__histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.__timed = 0
+
+    def add(self, call):
+        self.__calls.append(call)
+        self.__count(call, 1)
+        if len(self.__calls) > self.__maximum_calls:
+            self.__count(self.__calls.popleft(), -1)
+
+    def expire(self, now):
+        while len(self.__calls) > 0 and self.__calls[0][0] <= now - self.seconds:
+            self.__count(self.__calls.popleft(), -1)
+
+    def get_summary(self):
+        calls = len(self.__calls)
+        return {
+            'calls': calls,
+            'health': round(100 * self.__successful / calls, 1) if calls > 0 else 100.0,
+            'errors': {code: count for code, count in sorted(self.__errors.items()) if count > 0},
+            'rows': self.__rows,
+            'p50_seconds': self.__percentile(0.5),
+            'p99_seconds': self.__percentile(0.99)
+        }
+
+    def __count(self, call, step):
+        timestamp, latency, error_code, rows = call
+        if error_code == 200:
+            self.__successful += step
+        else:
+            self.__errors[error_code] += step
+        self.__rows += step * rows
+        if latency is not None:
+            self.__histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += step
+            self.__timed += step
+
+    def __percentile(self, fraction):
+        if self.__timed == 0:
+            return None
+        target = fraction * self.__timed
+        seen = 0
+        for index, count in enumerate(self.__histogram):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS[min(index, len(LATENCY_BUCKETS) - 1)]
+        return LATENCY_BUCKETS[-1]
+
+
+class CallHistory():
+    """
+    Fixed size history of API calls, stored as a ring in the database call history table
+
+    Each call records its timestamp, latency, error code and the number of rows returned. The newest `length` calls
+    are kept, new calls overwrite the oldest slot. Calls are held in memory until persist() is called.
+
+    Thread safe, calls may be recorded on one thread while summaries are read on another.
+    """
+    def __init__(self, database=None, length=settings.call_history_length, windows=settings.call_history_windows):
+        """
+        Parameters:
+        database (SQHelper): The database holding the call history table. None keeps the history in memory only.
+        length (int): The number of calls kept.
+        windows (dict): Names and lengths in seconds of the windows to summarise, e.g. {'5m': 300}.
+        """
+        if length < 1:
+            raise ValueError("Call history length must be at least one")
+        self.__database = database
+        self.__length = length
+        self.__windows = {name: RollingWindow(seconds, length) for name, seconds in windows.items()}
+        self.__pending = deque(maxlen=length)
+        self.__next_slot = 0
+        self.__loaded = database is None
+        self.__lock = threading.Lock()
+
+    def record(self, timestamp, latency, error_code, rows):
+        """ Add a call to the history.
+
+        Parameters:
+        timestamp (float): Unix time the call finished.
+        latency (float): Duration of the call in seconds, None if unknown.
+        error_code (int): The status error code, 200 for success.
+        rows (int): The number of transactions returned.
+        """
+        call = (timestamp, latency, error_code, rows)
+        with self.__lock:
+            self.__load()
+            for window in self.__windows.values():
+                window.add(call)
+            self.__pending.append((self.__next_slot, call))
+            self.__next_slot = (self.__next_slot + 1) % self.__length
+
+    def get_summary(self, now):
+        """ Summarise the calls made in each window, ending at now.
+
+        Returns:
+        A dictionary with a key for each window name, containing:
+        - calls: The number of calls made.
+        - health: The percentage of calls which were successful.
+        - errors: The number of failed calls for each error code.
+        - rows: The number of transactions returned.
+        - p50_seconds / p99_seconds: Median and 99th percentile call latency, None if no calls were timed.
+        """
+        with self.__lock:
+            self.__load()
+            summary = dict()
+            for name, window in self.__windows.items():
+                window.expire(now)
+                summary[name] = window.get_summary()
+            return summary
+
+    def persist(self):
+        """ Write calls recorded since the last persist to the call history table.
+
+        Returns:
+        True: The history table is up to date.
+        False: An error occured, written to logs. The calls are written with the next persist.
+        """
+        with self.__lock:
+            if self.__database is None or len(self.__pending) == 0:
+                return True
+            rows = [(slot, ) + call for slot, call in self.__pending]
+            connection = self.__database.con
+            try:
+                with connection:
+                    self.__create_table(connection)
+                    connection.executemany("INSERT OR REPLACE INTO {}(slot, {}) VALUES (?, ?, ?, ?, ?)".format(
+                        settings.database_call_history_table, ', '.join(settings.database_call_history_columns)), rows)
+            except sqlite3.Error as e_r:
+                log.error("Failed to write the call history. Exception {}".format(e_r))
+                return False
+            self.__pending.clear()
+            return True
+
+    def __load(self):
+        if self.__loaded:
+            return
+        self.__loaded = True
+        connection = self.__database.con
+        try:
+            exists = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                        (settings.database_call_history_table, )).fetchone()
+            if exists is None:
+                return
+            rows = connection.execute("SELECT slot, {} FROM {} ORDER BY {}".format(
+                ', '.join(settings.database_call_history_columns), settings.database_call_history_table,
+                settings.database_call_history_columns[0])).fetchall()
+        except sqlite3.Error as e_r:
+            log.error("Failed to read the call history. Exception {}".format(e_r))
+            return
+        rows = [row for row in rows if row[0] < self.__length][-self.__length:]
+        for row in rows:
+            for window in self.__windows.values():
+                window.add(tuple(row[1:]))
+        if len(rows) > 0:
+            self.__next_slot = (rows[-1][0] + 1) % self.__length
+        log.debug("Loaded {} calls from the call history".format(len(rows)))
+
+    def __create_table(self, connection):
+        connection.execute("CREATE TABLE IF NOT EXISTS {}(slot INTEGER PRIMARY KEY, {})".format(
+            settings.database_call_history_table, ', '.join(settings.database_call_history_columns)))
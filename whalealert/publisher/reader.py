@@ -1,22 +1,75 @@
 import logging
+import re
 import time
 import datetime
+import heapq
+import sqlite3
+import threading
+from itertools import islice
+from operator import attrgetter, itemgetter
 import pandas as pd
 from colorama import Fore
 from colorama import Style
 import whalealert.settings as settings
+import whalealert.publisher.schema as schema
 from dateutil import tz, parser
 
 log = logging.getLogger(__name__)
 UNDERLINE = '\033[4m'
+_timezones = dict()
+_timezones_lock = threading.Lock()
+# Local ISO 8601 times, as written by datetime.now().isoformat(). Times with a UTC offset are left to dateutil.
+_ISO_8601 = re.compile(r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.\d{1,6})?$')
+RENDERED_COLUMNS = [
+    settings.database_column_timestamp, settings.database_column_amount, settings.database_column_amount_usd,
+    settings.database_column_symbol, settings.database_column_transaction_type, settings.database_column_from_owner,
+    settings.database_column_to_owner
+]
+
+
+def get_timezone(name=None):
+    """ Get a timezone object, looking each name up only once per process.
+
+    Parameters:
+    name (str): An IANA timezone name such as 'Australia/Melbourne'. None gives the local timezone.
+
+    Returns:
+    A dateutil timezone.
+
+    Raises:
+    ValueError: The name is not a known timezone.
+    """
+    with _timezones_lock:
+        if name not in _timezones:
+            # gettz() reads the local zone file, which pandas converts far faster than a tzlocal() object
+            zone = tz.gettz(name) if name is not None else (tz.gettz() or tz.tzlocal())
+            if zone is None:
+                raise ValueError("Unknown timezone {}".format(name))
+            _timezones[name] = zone
+        return _timezones[name]
+
+
+def parse_local_time(text):
+    """ Convert a local time string, such as a status file timestamp, to a unix timestamp.
+
+    Plain ISO 8601 times are converted directly, anything else (e.g. times with a UTC offset) is parsed by dateutil.
+
+    Raises:
+    ValueError: The string isn't a recognisable time.
+    """
+    match = _ISO_8601.match(text)
+    if match is None:
+        return int(parser.parse(text).timestamp())
+    return int(datetime.datetime(*[int(part) for part in match.groups()]).timestamp())
 
 
 class Reader():
     """ Reading Whale Alert API status and database results"""
-    def __init__(self, status=None, database=None, config=None):
+    def __init__(self, status=None, database=None, config=None, history=None):
         self.__status = status
         self.__database = database
         self.__config = config
+        self.__history = history
         if status is not None:
             log.debug("Pulisher started with initial status {}".format(status.get_expectations()))
 
@@ -29,56 +82,75 @@ class Reader():
         return self.__database
 
     def status_request(self, as_dict=False):
+        """ Get the logger status: minutes since the last successful call and the current session health.
+
+        If a call history is available, health, error codes and p50/p99 call latency are also given for each window
+        in settings.call_history_windows.
+
+        Returns:
+        A status string, or a dictionary if as_dict is True. None if the status is not available.
+        """
         if self.__status is None or self.__config is None:
             return None
 
-        if not self.__contains_valid_status():
+        last_call = self.__read_last_good_call()
+        if last_call is None:
             return None
 
-        minutes = self.__calculate_minutes_since_last_good_call()
+        now = time.time()
+        minutes = int(round((int(now) - last_call) / 60, 0))
         health = self.__status.get_value(settings.status_file_current_session_section_name,
                                          settings.status_file_option_health)
         if as_dict:
             status = dict()
-            if self.__logger_status_ok():
+            if self.__logger_status_ok(last_call, now):
                 status['status'] = "Ok"
             else:
                 status['status'] = "Error"
             status['health'] = health
             status['last_call'] = minutes
+            if self.__history is not None:
+                status['windows'] = self.__history.get_summary(now)
             return status
         else:
-            return "Last successful call {} minutes ago, health {}%".format(minutes, health)
+            output = "Last successful call {} minutes ago, health {}%".format(minutes, health)
+            if self.__history is not None:
+                for name, window in self.__history.get_summary(now).items():
+                    output += "\n" + self.__make_window_string(name, window)
+            return output
 
-    def __contains_valid_status(self):
+    def __make_window_string(self, name, window):
+        output = "Last {}: {} calls, health {}%".format(name, window['calls'], window['health'])
+        if window['p50_seconds'] is not None:
+            output += ", latency p50 {:.3f}s p99 {:.3f}s".format(window['p50_seconds'], window['p99_seconds'])
+        if len(window['errors']) > 0:
+            output += ", errors " + ", ".join("{}: {}".format(code, count) for code, count in window['errors'].items())
+        return output
+
+    def __read_last_good_call(self):
+        # The writer stores the last call as a unix timestamp, status files written by earlier versions only hold
+        # the time string
         try:
             self.__config.get_value(settings.API_section_name, settings.API_option_interval)
             self.__status.get_value(settings.status_file_current_session_section_name,
                                     settings.status_file_option_health)
-            Reader.from_local_time(
+            unix_time = self.__status.get_value(settings.status_file_last_good_call_section_name,
+                                                settings.status_file_option_unix_time)
+            if unix_time:
+                return int(unix_time)
+            return Reader.from_local_time(
                 self.__status.get_value(settings.status_file_last_good_call_section_name,
                                         settings.status_file_option_timeStamp))
-            return True
         except Exception as e:
             log.error("Cannot request status, badly formed status file. Exception {}".format(e))
-        return False
+        return None
 
-    def __logger_status_ok(self):
+    def __logger_status_ok(self, last_call, now):
         call_inteval = self.__config.get_value(settings.API_section_name, settings.API_option_interval)
-        last_call = Reader.from_local_time(
-            self.__status.get_value(settings.status_file_last_good_call_section_name,
-                                    settings.status_file_option_timeStamp))
-        if (int(time.time()) - last_call) > (call_inteval * 5):
+        if (int(now) - last_call) > (call_inteval * 5):
             return False
         return True
 
-    def __calculate_minutes_since_last_good_call(self):
-        lastCall = Reader.from_local_time(
-            self.__status.get_value(settings.status_file_last_good_call_section_name,
-                                    settings.status_file_option_timeStamp))
-        currentTime = int(time.time())
-        return int(round((currentTime - lastCall) / 60, 0))
-
     def data_request(self, request, pretty=False, as_df=False, as_dict=False):
 
         if self.get_database() is None:
@@ -88,53 +160,109 @@ class Reader():
         if self.__check_data_request_keys(request) is False:
             return self.__return_empty_result(pretty, as_df, as_dict)
 
-        entries = self.__filter_request_by_blockchain(request)
-
-        if len(entries) == 0:
-            return self.__return_empty_result(pretty, as_df, as_dict)
-
-        entries = self.__filter_request_by_symbols(request, entries)
+        entries = self.__query_request(request)
 
         if len(entries) == 0:
             return self.__return_empty_result(pretty, as_df, as_dict)
 
-        return self.dataframe_to_transaction_output(entries, request, pretty, as_dict=as_dict, as_df=as_df)
+        return self.__make_output(entries, pretty, as_dict, as_df, request.get(settings.request_timezone))
 
-    def __filter_request_by_symbols(self, request, entries):
-        symbols = request[settings.request_symbols]
-        if symbols == ['*']:
-            filter_by_symbol = entries
-        else:
-            filter_by_symbol = entries[entries[settings.database_column_symbol].isin(request[settings.request_symbols])]
-        return filter_by_symbol
-
-    def __filter_request_by_blockchain(self, request):
-        all_entries = pd.DataFrame()
+    def __query_request(self, request):
+        # Each table returns its newest matching rows, newest first, with the time bound, filters and limit applied by
+        # SQLite. A lazy heap merge of the tables then keeps the newest maximum_results overall, so no more than
+        # maximum_results rows per table are ever read however many the time window holds.
+        cursors = []
+        blockchain_tables = schema.get_blockchain_tables(self.__database)
         if request[settings.request_blockchain] == ['*']:
-            blockchains = self.__database.get_table_names()
+            blockchains = blockchain_tables
         else:
             blockchains = request[settings.request_blockchain]
 
+        if schema.is_unified(self.__database):
+            cursors.append(self.__query_table(settings.database_unified_table, request, filter_blockchain=True))
+            # Any tables left are still being moved by a migration
+            blockchains = [blockchain for blockchain in blockchains if blockchain in blockchain_tables]
+
         for blockchain in blockchains:
-            new_entries = self.__database.get_row_range(blockchain, 'timestamp',
-                                                        request[settings.request_from_time] + 1, int(time.time()))
-            if new_entries is None:
+            if blockchain not in blockchain_tables:
                 log.warning("Data request for blockchain {} which isn't in database".format(blockchain))
                 continue
-            all_entries = all_entries.append(new_entries)
-        return all_entries
+            cursors.append(self.__query_table(blockchain, request))
+
+        columns = sorted(settings.database_columns)
+        newest_first = heapq.merge(*[cursor for cursor in cursors if cursor is not None],
+                                   key=itemgetter(columns.index(settings.database_column_timestamp)),
+                                   reverse=True)
+        if request[settings.request_maximum_results] >= 0:
+            newest_first = islice(newest_first, request[settings.request_maximum_results])
+        rows = list(newest_first)
+        if len(rows) == 0:
+            return pd.DataFrame()
+        rows.reverse()
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def __query_table(self, table, request, filter_blockchain=False):
+        conditions = ["{} BETWEEN ? AND ?".format(settings.database_column_timestamp)]
+        parameters = [request[settings.request_from_time] + 1, int(time.time())]
+        filters = [(settings.database_column_symbol, request[settings.request_symbols])]
+        if filter_blockchain:
+            filters.insert(0, (settings.database_column_blockchain, request[settings.request_blockchain]))
+        for column, values in filters:
+            if values != ['*']:
+                conditions.append("{} IN ({})".format(column, ','.join('?' * len(values))))
+                parameters.extend(values)
+        # A negative limit is no limit to SQLite, the same as a negative maximum_results
+        parameters.append(request[settings.request_maximum_results])
+        # Columns are listed (in the alphabetical order tables are created with), so every table's rows line up
+        statement = "SELECT {} FROM {} WHERE {} ORDER BY {} DESC LIMIT ?".format(
+            ', '.join(sorted(settings.database_columns)), table, ' AND '.join(conditions),
+            settings.database_column_timestamp)
+        try:
+            return self.__database.con.execute(statement, parameters)
+        except sqlite3.Error as e_r:
+            log.error("Cannot query transactions from table {}. Exception {}".format(table, e_r))
+            return None
 
-    def dataframe_to_transaction_output(self, df, request=None, pretty=False, as_dict=False, as_df=False):
+    def dataframe_to_transaction_output(self,
+                                        df,
+                                        request=None,
+                                        pretty=False,
+                                        as_dict=False,
+                                        as_df=False,
+                                        timezone=None):
 
         sorted_by_time = df.sort_values('timestamp', ascending=True)
 
         if request is not None and request[settings.request_maximum_results] >= 0:
             sorted_by_time = sorted_by_time.tail(request[settings.request_maximum_results])
 
+        if timezone is None and request is not None:
+            timezone = request.get(settings.request_timezone)
+        return self.__make_output(sorted_by_time, pretty, as_dict, as_df, timezone)
+
+    def __make_output(self, df, pretty, as_dict, as_df, timezone):
         if as_df:
-            sorted_by_time.reset_index(drop=True, inplace=True)
-            return sorted_by_time
-        return self.__make_result_string(sorted_by_time, pretty, as_dict)
+            return df.reset_index(drop=True)
+        return self.__make_result_string(df, pretty, as_dict, timezone)
+
+    def transactions_to_output(self, transactions, pretty=False, as_dict=False, timezone=None):
+        """ Turn Transaction records into transaction strings (or dictionaries), ordered by time
+
+        Parameters:
+        transactions (list): Transaction records, as returned by api.get_transactions
+        pretty (bool): Use ascii colour codes to format the output.
+        as_dict (Bool): Retun as a {timestamp: '', 'text' ''} dictionary. Pretty output is also applied
+        timezone (str): Show times in this IANA timezone instead of local time.
+
+        Returns:
+        Formatted output depending on the passed parameters.
+        """
+        if len(transactions) == 0:
+            return self.__return_empty_result(pretty, False, as_dict)
+        sorted_by_time = sorted(transactions, key=attrgetter(settings.database_column_timestamp))
+        columns = {column: [getattr(transaction, column) for transaction in sorted_by_time]
+                   for column in RENDERED_COLUMNS}
+        return self.__make_result_string(columns, pretty, as_dict, timezone)
 
     def __return_empty_result(self, pretty, as_df, as_dict):
         if as_df:
@@ -144,79 +272,106 @@ class Reader():
         else:
             return ''
 
-    def __make_result_string(self, results, pretty, as_dict):
+    def __make_result_string(self, results, pretty, as_dict, timezone):
+        # Each part of the output is formatted a column at a time and the rows are joined once at the end
+        try:
+            results = {column: Reader.__to_list(results[column]) for column in RENDERED_COLUMNS}
+        except Exception as e:
+            log.error("Invalid column names found in database. Exception {}".format(e))
+            return self.__return_empty_result(pretty, False, as_dict)
+        try:
+            times, amounts, transfers = self.__make_parts(results, pretty, timezone)
+        except Exception:
+            # At least one row can't be formatted, format them one at a time so only the bad rows are skipped
+            times, amounts, transfers = self.__make_parts_by_row(results, pretty, timezone)
+
+        log.debug("Successful data request returned {} results".format(len(times)))
+        if as_dict:
+            return [{
+                'timestamp': time_string[:-1],
+                'text': amount + transfer[:-1]
+            } for time_string, amount, transfer in zip(times, amounts, transfers)]
+        else:
+            return ''.join(map(''.join, zip(times, amounts, transfers)))[:-1]
+
+    def __make_parts(self, results, pretty, timezone):
+        return (self.__make_time_strings(results, pretty, timezone), self.__make_amount_strings(results, pretty),
+                self.__make_transfer_strings(results, pretty))
 
-        output = ''
-        output_list = []
-        for index, result in results.iterrows():
+    def __make_parts_by_row(self, results, pretty, timezone):
+        times, amounts, transfers = [], [], []
+        for index in range(len(results[settings.database_column_timestamp])):
+            row = {column: values[index:index + 1] for column, values in results.items()}
             try:
-                if result[settings.database_column_to_owner] == '':
-                    result[settings.database_column_to_owner] = 'unknown'
-                if result[settings.database_column_from_owner] == '':
-                    result[settings.database_column_from_owner] = 'unknown'
-                if as_dict:
-                    output_dict = dict()
-                    output_dict['timestamp'] = self.__make_time_string(result, pretty)[:-1]
-                    output_dict['text'] = self.__make_amount_string(result, pretty) + self.__make_transfer_string(
-                        result, pretty)[:-1]
-                    output_list.append(output_dict)
-                else:
-                    output = output + self.__make_time_string(result, pretty) + self.__make_amount_string(
-                        result, pretty) + self.__make_transfer_string(result, pretty)
+                time_string, amount, transfer = self.__make_parts(row, pretty, timezone)
             except Exception as e:
                 log.error("Invalid column names found in database. Exception {}".format(e))
+                continue
+            times.extend(time_string)
+            amounts.extend(amount)
+            transfers.extend(transfer)
+        return times, amounts, transfers
 
-        log.debug("Successful data request returned {} results".format(len(results)))
-        if as_dict:
-            return output_list
-        else:
-            return output[:-1]
+    def __to_list(values):
+        return values.tolist() if isinstance(values, pd.Series) else values
 
-    def __make_time_string(self, result, pretty):
+    def __make_time_strings(self, results, pretty, timezone):
+        times = Reader.to_local_times(results[settings.database_column_timestamp], timezone)
         if pretty:
-            return Fore.YELLOW + Reader.to_local_time(
-                result[settings.database_column_timestamp]) + " " + Style.RESET_ALL
+            return [Fore.YELLOW + time_string + " " + Style.RESET_ALL for time_string in times]
         else:
-            return Reader.to_local_time(result[settings.database_column_timestamp]) + " "
+            return [time_string + " " for time_string in times]
 
-    def __make_amount_string(self, result, pretty):
+    def __make_amount_strings(self, results, pretty):
+        amounts = map("{:.2f}".format, results[settings.database_column_amount])
+        currencies = map(Reader.format_currency, results[settings.database_column_amount_usd])
         if pretty:
-            output = Fore.WHITE + str("{:.2f}".format(
-                result[settings.database_column_amount])) + " " + Fore.RED + result[settings.database_column_symbol]
-            if result[settings.database_column_amount_usd] < 1000000:
-                output = output + Fore.CYAN + " (" + Reader.format_currency(
-                    result[settings.database_column_amount_usd]) + " USD) "
-            elif result[settings.database_column_amount_usd] < 20000000:
-                output = output + Fore.CYAN + Style.BRIGHT + " (" + Reader.format_currency(
-                    result[settings.database_column_amount_usd]) + " USD) "
-            else:
-                output = output + ' ' + Fore.CYAN + Style.BRIGHT + UNDERLINE + "(" + Reader.format_currency(
-                    result[settings.database_column_amount_usd]) + " USD)"
-            return output + Style.RESET_ALL + ' '
+            return [
+                Fore.WHITE + amount + " " + Fore.RED + symbol + Reader.__pretty_usd_prefix(amount_usd) + currency +
+                Reader.__pretty_usd_suffix(amount_usd) + Style.RESET_ALL + ' '
+                for amount, symbol, amount_usd, currency in zip(amounts, results[settings.database_column_symbol],
+                                                                results[settings.database_column_amount_usd],
+                                                                currencies)
+            ]
         else:
-            return str("{:.2f}".format(result[settings.database_column_amount])) + " " + result[
-                settings.database_column_symbol] + " (" + Reader.format_currency(
-                    result[settings.database_column_amount_usd]) + " USD) "
+            return [
+                amount + " " + symbol + " (" + currency + " USD) "
+                for amount, symbol, currency in zip(amounts, results[settings.database_column_symbol], currencies)
+            ]
+
+    def __pretty_usd_prefix(amount_usd):
+        if amount_usd < 1000000:
+            return Fore.CYAN + " ("
+        elif amount_usd < 20000000:
+            return Fore.CYAN + Style.BRIGHT + " ("
+        else:
+            return ' ' + Fore.CYAN + Style.BRIGHT + UNDERLINE + "("
 
-    def __make_transfer_string(self, result, pretty):
-        if pretty:
-            if result[settings.database_column_transaction_type] == 'transfer':
-                output = 'transferred from ' + Fore.BLUE + result[settings.database_column_from_owner]  \
-                        + Style.RESET_ALL + ' to ' + Fore.BLUE + result[settings.database_column_to_owner] \
-                         + Style.RESET_ALL + '.\n'
-            elif result[settings.database_column_transaction_type] == 'burn':
-                output = Fore.RED + 'burned' + Style.RESET_ALL + ' at ' +  \
-                        Fore.BLUE + result[settings.database_column_from_owner] + Style.RESET_ALL + '.\n'
-            else:
-                output = result[settings.database_column_transaction_type] + ' from ' +  \
-                        Fore.BLUE + result[settings.database_column_from_owner]  \
-                        + Style.RESET_ALL + ' to ' + Fore.BLUE + result[settings.database_column_to_owner] \
-                        + Style.RESET_ALL + '.\n'
+    def __pretty_usd_suffix(amount_usd):
+        return " USD) " if amount_usd < 20000000 else " USD)"
 
-            return output
+    def __make_transfer_strings(self, results, pretty):
+        from_owners = [owner or 'unknown' for owner in results[settings.database_column_from_owner]]
+        to_owners = [owner or 'unknown' for owner in results[settings.database_column_to_owner]]
+        if pretty:
+            return [
+                Reader.__make_pretty_transfer_string(transaction_type, from_owner, to_owner)
+                for transaction_type, from_owner, to_owner in zip(
+                    results[settings.database_column_transaction_type], from_owners, to_owners)
+            ]
+        else:
+            return ["transferred from " + from_owner + ' to ' + to_owner + '.\n'
+                    for from_owner, to_owner in zip(from_owners, to_owners)]
+
+    def __make_pretty_transfer_string(transaction_type, from_owner, to_owner):
+        if transaction_type == 'transfer':
+            return 'transferred from ' + Fore.BLUE + from_owner + Style.RESET_ALL + ' to ' + Fore.BLUE + to_owner \
+                + Style.RESET_ALL + '.\n'
+        elif transaction_type == 'burn':
+            return Fore.RED + 'burned' + Style.RESET_ALL + ' at ' + Fore.BLUE + from_owner + Style.RESET_ALL + '.\n'
         else:
-            return "transferred from " + result[settings.database_column_from_owner] + \
-                    ' to ' + result[settings.database_column_to_owner] + '.' + '\n'
+            return transaction_type + ' from ' + Fore.BLUE + from_owner + Style.RESET_ALL + ' to ' + Fore.BLUE \
+                + to_owner + Style.RESET_ALL + '.\n'
 
     def __check_data_request_keys(self, request):
         try:
@@ -229,14 +384,30 @@ class Reader():
         except KeyError:
             log.error("Invalid keys supplied in data request {}".format(request))
             return False
+        try:
+            get_timezone(request.get(settings.request_timezone))
+        except ValueError as e:
+            log.error("Invalid data request. Exception {}".format(e))
+            return False
         return True
 
     def format_currency(value):
         return str(f'{value:,.2f}'.replace('$-', '-$'))
 
-    def to_local_time(unix_timestamp):
-        return datetime.datetime.fromtimestamp(unix_timestamp).astimezone(tz.tzlocal()).strftime(
+    def to_local_time(unix_timestamp, timezone=None):
+        return datetime.datetime.fromtimestamp(unix_timestamp, get_timezone(timezone)).strftime(
             settings.request_time_format)
 
+    def to_local_times(unix_timestamps, timezone=None):
+        """ Format many unix timestamps as local (or timezone) times, the same as to_local_time.
+
+        The UTC offsets are applied to the whole column at once, leaving a single strftime call per timestamp.
+        """
+        if len(unix_timestamps) == 0:
+            return []
+        utc = pd.DatetimeIndex(pd.to_datetime(unix_timestamps, unit='s', utc=True))
+        local_seconds = utc.tz_convert(get_timezone(timezone)).tz_localize(None).asi8 // 10**9
+        return [time.strftime(settings.request_time_format, time.gmtime(seconds)) for seconds in local_seconds.tolist()]
+
     def from_local_time(iso8601):
-        return int((parser.parse(iso8601).astimezone(tz.tzlocal()).strftime('%s')))
+        return parse_local_time(iso8601)
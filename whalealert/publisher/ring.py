@@ -0,0 +1,109 @@
+"""
+Bounded ring buffer with independent read cursors, for handing newly written transactions to several consumers
+"""
+
+import threading
+
+
+class RingBuffer():
+    """
+    Thread safe, fixed capacity ring buffer read through subscriptions
+
+    Every item appended gets the next sequence number. Once the buffer is full, new items overwrite the oldest ones.
+    Each subscription has its own read cursor, so any number of consumers see every item, each exactly once, without
+    affecting one another. A consumer which falls more than capacity items behind skips the overwritten items, which
+    are counted in its overflow count.
+
+    Typical Usage:
+
+    ring = RingBuffer(1000)
+    subscription = ring.subscribe()
+    ring.extend(transactions)
+    new_transactions = subscription.read()
+    """
+    def __init__(self, capacity):
+        """
+        Parameters:
+        capacity (int): The number of items kept.
+        """
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least one")
+        self.__capacity = capacity
+        self.__items = [None] * capacity
+        self.__next = 0
+        self.__lock = threading.Lock()
+
+    def get_capacity(self):
+        """ Get the number of items kept """
+        return self.__capacity
+
+    def extend(self, items):
+        """ Append items, overwriting the oldest items once the buffer is full """
+        items = list(items)
+        with self.__lock:
+            first = self.__next + max(len(items) - self.__capacity, 0)
+            for sequence in range(first, self.__next + len(items)):
+                self.__items[sequence % self.__capacity] = items[sequence - self.__next]
+            self.__next += len(items)
+
+    def subscribe(self, from_oldest=False):
+        """ Start a new read cursor.
+
+        Parameters:
+        from_oldest (bool): Start from the oldest item held. By default only items appended after this call are read.
+
+        Returns:
+        subscription (Subscription): The read cursor.
+        """
+        with self.__lock:
+            position = self.__get_oldest() if from_oldest else self.__next
+        return Subscription(self, position)
+
+    def _read_from(self, position, maximum):
+        # Returns the items from sequence number position onwards, the next position and the number of items missed
+        with self.__lock:
+            oldest = self.__get_oldest()
+            missed = max(oldest - position, 0)
+            start = max(position, oldest)
+            end = self.__next if maximum is None else min(self.__next, start + maximum)
+            items = [self.__items[sequence % self.__capacity] for sequence in range(start, end)]
+            return items, end, missed
+
+    def __get_oldest(self):
+        return max(self.__next - self.__capacity, 0)
+
+
+class Subscription():
+    """ A read cursor on a RingBuffer, see RingBuffer.subscribe """
+    def __init__(self, ring, position):
+        self.__ring = ring
+        self.__position = position
+        self.__lock = threading.Lock()
+        self.__read = 0
+        self.__overflow = 0
+
+    def read(self, maximum=None):
+        """ Get the items appended since the last read, oldest first.
+
+        Parameters:
+        maximum (int): The most items to return, None returns all of them.
+
+        Returns:
+        A list of items.
+        """
+        with self.__lock:
+            items, self.__position, missed = self.__ring._read_from(self.__position, maximum)
+            self.__read += len(items)
+            self.__overflow += missed
+        return items
+
+    def get_statistics(self):
+        """ Get the subscription's read statistics.
+
+        Returns:
+        A dictionary containing:
+        - read: The number of items read.
+        - overflow: The number of items overwritten before they were read.
+        """
+        with self.__lock:
+            return {'read': self.__read, 'overflow': self.__overflow}
@@ -0,0 +1,190 @@
+"""
+Database layout: indexes on the transaction tables, the one-shot upgrade of databases written by earlier versions and
+the migration from one table per blockchain to the single unified transactions table.
+"""
+
+import logging
+import sqlite3
+import whalealert.settings as settings
+
+log = logging.getLogger(__name__)
+
+
+def get_version(connection):
+    """ Get the schema version stored in the database, 0 for a database written before versions were recorded """
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(database):
+    """ Bring a database written by an earlier version up to the current schema.
+
+    Databases already at settings.database_schema_version are left untouched, so this is cheap to call on every start.
+
+    Parameters:
+    database (SQHelper): The database to upgrade.
+
+    Returns:
+    True: The database is at the current schema version.
+    False: An index could not be added, the upgrade is tried again next time.
+    """
+    connection = database.con
+    version = get_version(connection)
+    if version >= settings.database_schema_version:
+        return True
+    log.info("Upgrading database schema from version {} to {}".format(version, settings.database_schema_version))
+    if len(add_missing_indexes(database, get_blockchain_tables(database))) > 0:
+        return False
+    if is_unified(database) and not add_unified_indexes(connection):
+        return False
+    with connection:
+        connection.execute("PRAGMA user_version = {:d}".format(settings.database_schema_version))
+    return True
+
+
+def get_blockchain_tables(database):
+    """ Get the names of the per-blockchain tables, leaving out the unified table and any other reserved tables """
+    return [name for name in database.get_table_names() if name not in settings.database_reserved_tables]
+
+
+def is_unified(database):
+    """ Check if the database stores transactions in the single unified table """
+    return settings.database_unified_table in database.get_table_names()
+
+
+def get_transaction_tables(database):
+    """ Get the names of every table holding transactions, the unified table (if any) last """
+    tables = get_blockchain_tables(database)
+    if is_unified(database):
+        tables.append(settings.database_unified_table)
+    return tables
+
+
+def create_unified_table(database):
+    """ Create the unified transactions table and its indexes, if it doesn't exist.
+
+    Returns:
+    True: The table and its indexes exist.
+    False: An error occured, written to logs.
+    """
+    if len(database.create_table(settings.database_unified_table, settings.database_columns)) == 0:
+        return False
+    return add_unified_indexes(database.con)
+
+
+def add_unified_indexes(connection):
+    """ Add the unique (blockchain, id) index and the composite query indexes to the unified table.
+
+    The (blockchain, timestamp) and (symbol, timestamp) indexes serve filtered queries, the timestamp index serves
+    queries across all blockchains.
+    """
+    table = settings.database_unified_table
+    try:
+        with connection:
+            connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}{1} ON {0}({2}, {3})".format(
+                table, settings.database_unique_index_suffix, settings.database_table_identifier,
+                settings.database_unique_column))
+            for suffix, columns in settings.database_unified_indexes.items():
+                connection.execute("CREATE INDEX IF NOT EXISTS {0}{1} ON {0}({2})".format(
+                    table, suffix, ', '.join(columns)))
+    except sqlite3.Error as e_r:
+        log.error("Cannot add indexes to table {}. Exception {}".format(table, e_r))
+        return False
+    return True
+
+
+def migrate_to_unified(database, chunk_rows=settings.database_migration_chunk_rows):
+    """ Move every per-blockchain table into the unified transactions table.
+
+    Rows are moved in chunks, each copied and deleted from its old table in one database transaction, so the
+    database stays usable while the migration runs and no transaction is ever in both tables. Old tables are dropped
+    once empty. An interrupted migration can be run again to finish it.
+
+    Parameters:
+    database (SQHelper): The database to migrate.
+    chunk_rows (int): The number of rows moved in each database transaction.
+
+    Returns:
+    moved (int): The number of rows added to the unified table, or None if the migration failed (written to logs).
+    Rows already in the unified table are removed from their old table but not counted.
+    """
+    if not create_unified_table(database):
+        return None
+    connection = database.con
+    columns = ', '.join(sorted(settings.database_columns.keys()))
+    moved = 0
+    for table in get_blockchain_tables(database):
+        log.info("Migrating table {} to the {} table".format(table, settings.database_unified_table))
+        try:
+            while True:
+                with connection:
+                    # The empty check and the drop share one write transaction, so no row can be added in between
+                    connection.execute("BEGIN IMMEDIATE")
+                    last = connection.execute(
+                        "SELECT MAX(rowid) FROM (SELECT rowid FROM {} ORDER BY rowid LIMIT ?)".format(table),
+                        (chunk_rows, )).fetchone()[0]
+                    if last is None:
+                        connection.execute("DROP TABLE {}".format(table))
+                        break
+                    moved += connection.execute(
+                        "INSERT OR IGNORE INTO {0}({1}) SELECT {1} FROM {2} WHERE rowid <= ?".format(
+                            settings.database_unified_table, columns, table), (last, )).rowcount
+                    connection.execute("DELETE FROM {} WHERE rowid <= ?".format(table), (last, ))
+        except sqlite3.Error as e_r:
+            log.error("Failed to migrate table {}. Exception {}".format(table, e_r))
+            return None
+    log.info("Moved {} rows to the {} table".format(moved, settings.database_unified_table))
+    return moved
+
+
+def add_missing_indexes(database, table_names):
+    """ Add indexes to any of the given tables which don't have them yet.
+
+    Parameters:
+    database (SQHelper): The database holding the tables.
+    table_names (list): The blockchain tables to check.
+
+    Returns:
+    A list of the tables which could not be indexed.
+    """
+    existing = set(row[0] for row in database.con.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    failed = []
+    for table_name in table_names:
+        names = [table_name + suffix for suffix in (settings.database_unique_index_suffix,
+                                                    settings.database_timestamp_index_suffix)]
+        if all(name in existing for name in names):
+            continue
+        if add_indexes(database.con, table_name) is False:
+            failed.append(table_name)
+    return failed
+
+
+def add_indexes(connection, table_name):
+    """ Add the unique transaction id index and the timestamp index to a blockchain table.
+
+    Tables written before the unique index existed may hold duplicate transactions. Only the first copy of each is
+    kept, so that the index can be built.
+
+    Parameters:
+    connection (sqlite3.Connection): The database connection.
+    table_name (str): The blockchain table to index.
+
+    Returns:
+    True: Both indexes exist.
+    False: An error occured, written to logs.
+    """
+    column = settings.database_unique_column
+    try:
+        with connection:
+            removed = connection.execute(
+                "DELETE FROM {0} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {0} GROUP BY {1})".format(
+                    table_name, column)).rowcount
+            connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {}({})".format(
+                table_name + settings.database_unique_index_suffix, table_name, column))
+            connection.execute("CREATE INDEX IF NOT EXISTS {} ON {}({})".format(
+                table_name + settings.database_timestamp_index_suffix, table_name, settings.database_column_timestamp))
+    except sqlite3.Error as e_r:
+        log.error("Cannot add indexes to table {}. Exception {}".format(table_name, e_r))
+        return False
+    if removed > 0:
+        log.info("Removed {} duplicate transactions from table {}".format(removed, table_name))
+    return True
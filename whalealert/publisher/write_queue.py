@@ -0,0 +1,237 @@
+"""
+Bounded write-behind queue, so storing results never delays the next API call
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# How often a blocked put() checks that the writer thread is still alive
+THREAD_CHECK_SECONDS = 0.5
+
+
+class WriteQueue():
+    """
+    Bounded write-behind queue drained by a dedicated writer thread
+
+    Items put on the queue are collected into batches and passed to the handler on the writer thread. A batch is
+    handed over once it holds batch_size items, or once its oldest item has waited batch_seconds. When the queue holds
+    maximum_depth items, put() blocks until the writer thread catches up, so a stalled disk slows the producer down
+    instead of growing memory without limit.
+
+    Typical Usage:
+
+    queue = WriteQueue(store_pages)
+    queue.start()
+    queue.put(page)
+    ...
+    queue.stop()  # Writes everything still queued
+    """
+    def __init__(self, handler, maximum_depth=50, batch_size=10, batch_seconds=1.0):
+        """
+        Parameters:
+        handler (function): Called on the writer thread with a list of queued items, in the order they were put.
+        maximum_depth (int): The number of items the queue holds before put() blocks.
+        batch_size (int): The number of items which are handed to the handler at once.
+        batch_seconds (float): The longest time an item waits for its batch to fill.
+        """
+        if maximum_depth < 1 or batch_size < 1:
+            raise ValueError("Write queue depth and batch size must be at least one")
+        if batch_seconds < 0:
+            raise ValueError("Write queue batch time cannot be negative")
+        self.__handler = handler
+        self.__maximum_depth = maximum_depth
+        self.__batch_size = min(batch_size, maximum_depth)
+        self.__batch_seconds = batch_seconds
+        self.__items = deque()
+        self.__in_progress = 0
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__stopping = False
+        self.__flush_requested = False
+        self.reset_statistics()
+
+    def start(self):
+        """ Start the writer thread, if it isn't already running """
+        with self.__condition:
+            if self.is_running():
+                return
+            self.__stopping = False
+            self.__thread = threading.Thread(target=self.__run, name='WriteQueue', daemon=True)
+            self.__thread.start()
+        log.debug("Write queue started, depth {}, batches of {} or {} seconds".format(
+            self.__maximum_depth, self.__batch_size, self.__batch_seconds))
+
+    def is_running(self):
+        """ Check if the writer thread is running """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def put(self, item):
+        """ Queue an item to be written, blocking while the queue is full.
+
+        If the writer thread isn't running, the item is handed to the handler straight away on the calling thread. If
+        the writer thread dies while put() waits for space, the items still queued and then this item are handed to
+        the handler on the calling thread instead.
+
+        Returns:
+        wait (float): The number of seconds spent waiting for space in the queue.
+        """
+        if not self.is_running():
+            self.__write([item])
+            return 0.0
+        start = time.monotonic()
+        with self.__condition:
+            blocked = len(self.__items) >= self.__maximum_depth
+            while len(self.__items) >= self.__maximum_depth and self.is_running():
+                self.__condition.wait(THREAD_CHECK_SECONDS)
+            if not self.is_running():
+                stranded = [queued for queued_at, queued in self.__items] + [item]
+                self.__items.clear()
+            else:
+                stranded = None
+                self.__items.append((time.monotonic(), item))
+            self.__statistics['items_queued'] += 1
+            self.__statistics['maximum_depth'] = max(self.__statistics['maximum_depth'], len(self.__items))
+            wait = time.monotonic() - start
+            if blocked:
+                self.__statistics['blocked_puts'] += 1
+                self.__statistics['blocked_seconds'] += wait
+            self.__condition.notify_all()
+        if stranded is not None:
+            log.error("Write queue thread stopped, writing {} items on the calling thread".format(len(stranded)))
+            self.__write(stranded)
+        return wait
+
+    def flush(self, timeout=None):
+        """ Write everything queued now, waiting until it is done.
+
+        Parameters:
+        timeout (float): The longest time to wait, None waits until the queue is empty.
+
+        Returns:
+        True: Every item put before the call has been handed to the handler.
+        False: The timeout expired first.
+        """
+        if not self.is_running():
+            return len(self.__items) == 0
+        with self.__condition:
+            self.__flush_requested = True
+            self.__condition.notify_all()
+            done = self.__condition.wait_for(lambda: (len(self.__items) == 0 and self.__in_progress == 0)
+                                             or not self.is_running(), timeout)
+            return done and len(self.__items) == 0
+
+    def stop(self, timeout=None):
+        """ Write everything still queued, then stop the writer thread.
+
+        Parameters:
+        timeout (float): The longest time to wait for the queue to drain, None waits until it is empty.
+
+        Returns:
+        True: The queue was drained and the writer thread stopped.
+        False: The timeout expired first, the thread finishes writing in the background.
+        """
+        if self.__thread is None:
+            return True
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify_all()
+        self.__thread.join(timeout)
+        if self.__thread.is_alive():
+            log.warning("Write queue still holds {} items after {} seconds".format(len(self.__items), timeout))
+            return False
+        self.__thread = None
+        return True
+
+    def get_depth(self):
+        """ Get the number of items waiting to be written """
+        with self.__condition:
+            return len(self.__items)
+
+    def get_statistics(self):
+        """ Get the queue depth and flush latency statistics.
+
+        Returns:
+        A dictionary containing:
+        - depth: The number of items waiting to be written.
+        - maximum_depth: The most items waiting at once.
+        - items_queued / items_written: Items put on the queue and items handed to the handler.
+        - flushes: The number of batches handed to the handler.
+        - last_flush_seconds / total_flush_seconds / average_flush_seconds: Time spent in the handler.
+        - maximum_wait_seconds: The longest time an item waited in the queue before being written.
+        - blocked_puts / blocked_seconds: Calls to put() which waited for space, and the time spent waiting.
+        """
+        with self.__condition:
+            statistics = dict(self.__statistics)
+            statistics['depth'] = len(self.__items)
+        if statistics['flushes'] > 0:
+            statistics['average_flush_seconds'] = statistics['total_flush_seconds'] / statistics['flushes']
+        else:
+            statistics['average_flush_seconds'] = 0.0
+        return statistics
+
+    def reset_statistics(self):
+        """ Clear the queue statistics """
+        with self.__condition:
+            self.__statistics = {
+                'maximum_depth': 0,
+                'items_queued': 0,
+                'items_written': 0,
+                'flushes': 0,
+                'last_flush_seconds': 0.0,
+                'total_flush_seconds': 0.0,
+                'maximum_wait_seconds': 0.0,
+                'blocked_puts': 0,
+                'blocked_seconds': 0.0
+            }
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__batch_ready():
+                    self.__condition.wait(self.__time_to_batch())
+                if len(self.__items) == 0 and self.__stopping:
+                    return
+                count = min(len(self.__items), self.__batch_size)
+                batch = [self.__items.popleft() for _ in range(count)]
+                self.__in_progress = count
+                if len(self.__items) == 0:
+                    self.__flush_requested = False
+                self.__condition.notify_all()
+
+            now = time.monotonic()
+            waited = max(now - queued_at for queued_at, item in batch)
+            self.__write([item for queued_at, item in batch])
+
+            with self.__condition:
+                self.__in_progress = 0
+                self.__statistics['maximum_wait_seconds'] = max(self.__statistics['maximum_wait_seconds'], waited)
+                self.__condition.notify_all()
+
+    def __batch_ready(self):
+        if len(self.__items) == 0:
+            return self.__stopping
+        if self.__stopping or self.__flush_requested or len(self.__items) >= self.__batch_size:
+            return True
+        return time.monotonic() - self.__items[0][0] >= self.__batch_seconds
+
+    def __time_to_batch(self):
+        if len(self.__items) == 0:
+            return None
+        return max(self.__batch_seconds - (time.monotonic() - self.__items[0][0]), 0.0)
+
+    def __write(self, items):
+        start = time.perf_counter()
+        try:
+            self.__handler(items)
+        except Exception as e_r:
+            log.error("Failed to write {} queued items. Exception {}".format(len(items), e_r))
+        elapsed = time.perf_counter() - start
+        with self.__condition:
+            self.__statistics['items_written'] += len(items)
+            self.__statistics['flushes'] += 1
+            self.__statistics['last_flush_seconds'] = elapsed
+            self.__statistics['total_flush_seconds'] += elapsed
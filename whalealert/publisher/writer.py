@@ -1,18 +1,49 @@
 import logging
+import os
+import sqlite3
+import time
+from collections import deque
 import pandas as pd
 from configchecker import ConfigChecker
 import whalealert.settings as settings
+from whalealert.api.record import Transaction
+import whalealert.publisher.schema as schema
+from whalealert.publisher.history import CallHistory
+from whalealert.publisher.ring import RingBuffer
+from whalealert.publisher.reader import parse_local_time
 
 log = logging.getLogger(__name__)
 
 
 class Writer():
     """ Puslishing Whale Alert API status and database results"""
-    def __init__(self, status, database):
+    def __init__(self, status, database, status_file=None, persist_seconds=0, status_to_database=False):
+        """
+        Parameters:
+        status (ConfigChecker): The logger status.
+        database (SQHelper): The transaction database.
+        status_file (str): Path to the status file, written atomically. If None, the status object's own file is
+        written in place.
+        persist_seconds (float): The shortest time between status file writes, 0 writes on every status update.
+        status_to_database (bool): Also write the status as a row in the database status table.
+        """
         self.__status = status
         self.__database = database
-        self.__health_list = [1] * settings.health_list_length
-        self.__last_written = []
+        self.__status_file = status_file
+        self.__persist_seconds = persist_seconds
+        self.__status_to_database = status_to_database
+        self.__status_values = None
+        self.__status_changed = False
+        self.__status_persisted_at = float('-inf')
+        self.__reset_health()
+        self.__history = CallHistory(database) if database is not None else None
+        self.__new_transactions = RingBuffer(settings.maximum_stored_latest_transaction)
+        self.__last_written = self.__new_transactions.subscribe()
+        self.__known_tables = None
+        self.__unindexed_tables = set()
+        self.__unified = False
+        self.__last_write_counts = {'new': 0, 'duplicate': 0}
+        self.reset_statistics()
         if status is not None:
             log.debug("Pulisher started with initial status {}".format(status.get_expectations()))
 
@@ -24,12 +55,25 @@ class Writer():
         """Return the database object used"""
         return self.__database
 
+    def get_call_history(self):
+        """ Return the CallHistory of calls passed to write_status, None if there is no database """
+        return self.__history
+
     def write_transactions(self, transactions):
         """
         Write transactions to the dataabse
 
+        The transactions are grouped by blockchain and each group is inserted with one multi-row statement. All groups
+        are written in a single database transaction, so either every transaction is stored or none are. Once the
+        database has been migrated to the unified transactions table, every transaction is written to that table.
+
+        Each table is indexed on timestamp and has a unique index on the transaction id, so transactions which are
+        already stored are skipped. Writing an overlapping window again is safe, get_last_write_counts() gives the
+        number of new and duplicate rows.
+
         Parameters:
-        transactions (dict): Transactions returned by api.get_trasactions
+        transactions (list): Transaction records returned by api.get_trasactions. Dictionaries, either flat or in
+        the nested API format, are also accepted.
 
         Returns:
         True: Transactions were written successfully
@@ -39,33 +83,174 @@ class Writer():
             log.debug("Trying to write an empty list of transactions")
             return False
 
+        records = []
+        self.__unindexed_tables = set()
         for transaction in transactions:
             try:
                 transaction = self.__squash_dictionary(transaction)
                 self.__create_tables_as_needed(transaction)
+                records.append(self.__to_record(transaction))
             except KeyError:
                 log.error("Key error parsing keys from transaction {}".format(transaction))
                 return False
             except Exception as e:
                 log.error("Exception {} when parsing keys from transaction {}".format(e, transaction))
                 return False
-            if self.__add_entries(transaction) is False:
-                log.error("Failed to add entriy to database. Entry {}".format(transaction))
-                return False
+
+        start = time.perf_counter()
+        success = self.__add_entries(records)
+        if success is False and self.__known_tables is None:
+            # The tables changed under the writer, for example migrated by another process. Find them again and retry
+            for record in records:
+                self.__create_tables_as_needed(record)
+            success = self.__add_entries(records)
+        if success is False:
+            self.__statistics['failed_pages'] += 1
+            return False
+        self.__statistics['pages'] += 1
+        self.__statistics['rows'] += len(records)
+        self.__statistics['new_rows'] += self.__last_write_counts['new']
+        self.__statistics['duplicate_rows'] += self.__last_write_counts['duplicate']
+        self.__statistics['total_seconds'] += time.perf_counter() - start
+        return True
+
+    def get_last_write_counts(self):
+        """ Get the outcome of the last successful write_transactions call.
+
+        Returns:
+        A dictionary containing:
+        - new: Transactions which were added to the database.
+        - duplicate: Transactions skipped because they were already stored (or repeated in the same call).
+        """
+        return dict(self.__last_write_counts)
+
+    def get_statistics(self):
+        """ Get database write statistics.
+
+        Returns:
+        A dictionary containing:
+        - pages: The number of successful write_transactions calls.
+        - rows: The number of transactions passed to successful write_transactions calls.
+        - new_rows / duplicate_rows: Of those, the transactions added and the transactions already stored.
+        - failed_pages: The number of write_transactions calls which wrote nothing because of a database error.
+        - total_seconds: Time spent inserting and committing rows.
+        - rows_per_second: Rows written per second of insert time.
+        - tables_created: Tables created for blockchains not already in the database.
+        - table_checks_skipped: Transactions whose table was already known, so no CREATE TABLE was issued.
+        - unread_overflow: New transactions overwritten before get_last_written_transactions() read them.
+        """
+        statistics = dict(self.__statistics)
+        statistics['unread_overflow'] = self.__last_written.get_statistics()['overflow']
+        if statistics['total_seconds'] > 0:
+            statistics['rows_per_second'] = statistics['rows'] / statistics['total_seconds']
+        else:
+            statistics['rows_per_second'] = 0.0
+        return statistics
+
+    def reset_statistics(self):
+        """ Clear the write statistics """
+        self.__statistics = {
+            'pages': 0,
+            'rows': 0,
+            'new_rows': 0,
+            'duplicate_rows': 0,
+            'failed_pages': 0,
+            'total_seconds': 0.0,
+            'tables_created': 0,
+            'table_checks_skipped': 0
+        }
+
+    def get_last_written(self, subscription=None):
+        """ Get the transactions written since the last call, as a dataframe with a column for each field """
+        current_transactions = self.get_last_written_transactions(subscription)
+        return pd.DataFrame.from_records([transaction.to_tuple() for transaction in current_transactions],
+                                         columns=Transaction.FIELDS)
+
+    def get_last_written_transactions(self, subscription=None):
+        """ Get the transactions written since the last call, as a list of Transaction records
+
+        The newest settings.maximum_stored_latest_transaction transactions are kept. A reader which falls further
+        behind misses the oldest ones, counted in its subscription's overflow statistic.
+
+        Parameters:
+        subscription (Subscription): The reader's own cursor, from subscribe(). If None, the writer's default cursor
+        is used, shared by every caller which doesn't pass one.
+        """
+        if subscription is None:
+            subscription = self.__last_written
+        return subscription.read()
+
+    def subscribe(self):
+        """ Start a new cursor on newly written transactions, for a reader independent of any others.
+
+        Returns:
+        subscription (Subscription): Pass to get_last_written_transactions() or get_last_written().
+        """
+        return self.__new_transactions.subscribe()
+
+    def __add_entries(self, records):
+        tables = dict()
+        for record in records:
+            key = (record[settings.database_table_identifier], record.id)
+            tables.setdefault(self.__get_table_name(record), dict()).setdefault(key, record)
+
+        connection = self.__database.con
+        written = set()
+        try:
+            with connection:
+                for table_name, table_records in tables.items():
+                    ids = [transaction_id for blockchain, transaction_id in table_records.keys()]
+                    for stored_key in self.__find_stored_keys(connection, table_name, ids):
+                        table_records.pop(stored_key, None)
+                    connection.executemany(self.__make_insert_statement(table_name),
+                                           [record.to_row() for record in table_records.values()])
+                    written.update(id(record) for record in table_records.values())
+        except sqlite3.Error as e_r:
+            log.error("Failed to add {} entries to database, none were written. Exception {}".format(len(records), e_r))
+            if isinstance(e_r, sqlite3.OperationalError):
+                self.__known_tables = None
+            return False
+
+        new_records = []
+        for record in records:
+            if id(record) in written:
+                written.discard(id(record))
+                new_records.append(record)
+
+        self.__last_write_counts = {'new': len(new_records), 'duplicate': len(records) - len(new_records)}
+        if self.__last_write_counts['duplicate'] > 0:
+            log.debug("Skipped {} transactions which were already stored".format(self.__last_write_counts['duplicate']))
+        self.__new_transactions.extend(new_records)
         return True
 
-    def get_last_written(self):
-        current_transactions = list(self.__last_written)
-        self.__last_written.clear()
-        return pd.DataFrame(current_transactions)
+    def __get_table_name(self, record):
+        if self.__unified:
+            return settings.database_unified_table
+        return record[settings.database_table_identifier]
 
-    def __add_entries(self, transaction):
-        table_name = transaction[settings.database_table_identifier]
-        if len(self.__last_written) < settings.maximum_stored_latest_transaction:
-            self.__last_written.append(transaction)
-        return self.__database.insert(table_name, transaction)
+    def __find_stored_keys(self, connection, table_name, ids):
+        stored_keys = []
+        for start in range(0, len(ids), settings.database_maximum_query_variables):
+            chunk = ids[start:start + settings.database_maximum_query_variables]
+            statement = "SELECT {}, {} FROM {} WHERE {} IN ({})".format(settings.database_table_identifier,
+                                                                         settings.database_unique_column, table_name,
+                                                                         settings.database_unique_column,
+                                                                         ','.join('?' * len(chunk)))
+            stored_keys.extend(tuple(row) for row in connection.execute(statement, chunk))
+        return stored_keys
+
+    def __make_insert_statement(self, table_name):
+        return "INSERT OR IGNORE INTO {}({}) VALUES ({})".format(table_name, ','.join(Transaction.ROW_ORDER),
+                                                                 ','.join('?' * len(Transaction.ROW_ORDER)))
+
+    def __to_record(self, transaction):
+        if type(transaction) is Transaction:
+            return transaction
+        return Transaction.from_dict(transaction)
 
     def __squash_dictionary(self, transaction):
+        if settings.whale_transaction_from not in transaction:
+            return transaction
         new_dict = dict(transaction)
         new_dict[settings.database_column_from_address] = transaction['from']['address']
         new_dict[settings.database_column_from_owner] = transaction['from']['owner']
@@ -79,84 +264,197 @@ class Writer():
         return new_dict
 
     def __create_tables_as_needed(self, transaction):
-        self.__database.create_table(transaction[settings.database_table_identifier], settings.database_columns)
+        if self.__known_tables is None:
+            self.__find_known_tables()
+        table_name = self.__get_table_name(transaction)
+        if table_name in self.__known_tables or table_name in self.__unindexed_tables:
+            # Tables which could not be indexed are tried again on the next write, not for every row of this one
+            self.__statistics['table_checks_skipped'] += 1
+            return
+        if not self.__unified and schema.is_unified(self.__database):
+            # Migrated since the tables were found, new blockchains go straight to the unified table
+            self.__find_known_tables()
+            return
+        exists = table_name in self.__database.get_table_names()
+        if len(self.__database.create_table(table_name, settings.database_columns)) > 0:
+            if not exists:
+                self.__statistics['tables_created'] += 1
+            if schema.add_indexes(self.__database.con, table_name):
+                self.__known_tables.add(table_name)
+            else:
+                self.__unindexed_tables.add(table_name)
 
-    def write_status(self, status):
+    def __find_known_tables(self):
+        self.__unified = schema.is_unified(self.__database)
+        if self.__unified:
+            self.__known_tables = {settings.database_unified_table}
+            return
+        table_names = schema.get_blockchain_tables(self.__database)
+        failed = schema.add_missing_indexes(self.__database, table_names)
+        self.__known_tables = set(table_names) - set(failed)
+
+    def write_status(self, status, latency=None, timestamp=None):
         """"
         Write the logger status to the status file
 
+        The status values are kept in memory. The status file (and the status table, if enabled) is rewritten at most
+        once every persist_seconds, call flush_status() to write any remaining changes, e.g. on shutdown. The call is
+        also added to the call history, see get_call_history().
+
+        Parameters:
+        status (dict): The status returned by the API call.
+        latency (float): Duration of the API call in seconds, None if unknown.
+        timestamp (float): Unix time the API call finished, defaults to now.
+
         Returns:
-        True: The file was written successfully
-        False: The file couldn't be written, error status written to logs
+        True: The status was updated, and written if due
+        False: The status couldn't be updated or written, error status written to logs
         """
         if type(self.__status) is not ConfigChecker:
             return False
         try:
-            self.__update_all_time(status)
-            self.__update_current(status)
-            self.__update_good_call_stats(status)
-            self.__update_bad_call_stats(status)
+            success = status[settings.status_file_option_error_code] == 200
+            if success:
+                last_call = {
+                    (settings.status_file_last_good_call_section_name, settings.status_file_option_timeStamp):
+                    status[settings.status_file_option_timeStamp],
+                    (settings.status_file_last_good_call_section_name, settings.status_file_option_transaction_count):
+                    status[settings.status_file_option_transaction_count],
+                    (settings.status_file_last_good_call_section_name, settings.status_file_option_unix_time):
+                    self.__to_unix_time(status[settings.status_file_option_timeStamp])
+                }
+            else:
+                last_call = {
+                    (settings.status_file_last_failed_secion_name, settings.status_file_option_timeStamp):
+                    status[settings.status_file_option_timeStamp],
+                    (settings.status_file_last_failed_secion_name, settings.status_file_option_error_code):
+                    status[settings.status_file_option_error_code],
+                    (settings.status_file_last_failed_secion_name, settings.status_file_option_error_message):
+                    status[settings.status_file_option_error_message],
+                    (settings.status_file_last_failed_secion_name, settings.status_file_option_unix_time):
+                    self.__to_unix_time(status[settings.status_file_option_timeStamp])
+                }
         except KeyError:
             log.error("Key error when trying to write status {}".format(status))
             return False
 
-        if not self.__status.write_configuration_file():
+        if self.__history is not None:
+            self.__history.record(timestamp if timestamp is not None else time.time(), latency,
+                                  status[settings.status_file_option_error_code],
+                                  status.get(settings.status_file_option_transaction_count, 0))
+        values = self.__get_status_values()
+        values.update(last_call)
+        self.__count_call(settings.status_file_all_time_section_name, success)
+        self.__count_call(settings.status_file_current_session_section_name, success)
+        self.__calculate_health(success)
+        self.__status_changed = True
+
+        if time.monotonic() - self.__status_persisted_at < self.__persist_seconds:
+            return True
+        return self.flush_status()
+
+    def start_session(self):
+        """ Reset the current session call counts and health, and write the status """
+        values = self.__get_status_values()
+        section = settings.status_file_current_session_section_name
+        values[(section, settings.status_file_option_successful_calls)] = 0
+        values[(section, settings.status_file_option_failed_calls)] = 0
+        values[(section, settings.status_file_option_success_rate)] = 100.0
+        values[(section, settings.status_file_option_health)] = 100.0
+        self.__reset_health()
+        self.__status_changed = True
+        return self.flush_status()
+
+    def flush_status(self):
+        """
+        Write any status changes not yet written to the status file (and status table, if enabled)
+
+        The status file is written to a temporary file which then replaces the old one, so readers never see a
+        partly written file.
+
+        Returns:
+        True: The status is written
+        False: The status file couldn't be written, error status written to logs
+        """
+        if type(self.__status) is not ConfigChecker:
+            return False
+        if not self.__status_changed:
+            return True
+        values = self.__get_status_values()
+        for (section, key), value in values.items():
+            self.__status.set_value(section, key, value)
+        self.__status_persisted_at = time.monotonic()
+
+        if self.__status_to_database:
+            self.__write_status_row(values)
+        if self.__history is not None:
+            self.__history.persist()
+        if not self.__write_status_file():
             log.error("Failed to write status file")
             return False
+        self.__status_changed = False
         return True
 
-    def __update_good_call_stats(self, status):
-        if status[settings.status_file_option_error_code] != 200:
-            return
-        self.__status.set_value(settings.status_file_last_good_call_section_name, settings.status_file_option_timeStamp,
-                                status[settings.status_file_option_timeStamp])
-        self.__status.set_value(settings.status_file_last_good_call_section_name,
-                                settings.status_file_option_transaction_count,
-                                status[settings.status_file_option_transaction_count])
-
-    def __update_bad_call_stats(self, status):
-        if status[settings.status_file_option_error_code] == 200:
-            return
-        self.__status.set_value(settings.status_file_last_failed_secion_name, settings.status_file_option_timeStamp,
-                                status[settings.status_file_option_timeStamp])
-        self.__status.set_value(settings.status_file_last_failed_secion_name, settings.status_file_option_error_code,
-                                status[settings.status_file_option_error_code])
-        self.__status.set_value(settings.status_file_last_failed_secion_name, settings.status_file_option_error_message,
-                                status[settings.status_file_option_error_message])
-
-    def __update_all_time(self, status):
-        if status[settings.status_file_option_error_code] == 200:
-            self.__increment_value(settings.status_file_all_time_section_name,
-                                   settings.status_file_option_successful_calls)
-        else:
-            self.__increment_value(settings.status_file_all_time_section_name, settings.status_file_option_failed_calls)
-
-        self.__calculate_success_rate(settings.status_file_all_time_section_name)
+    def __write_status_file(self):
+        if self.__status_file is None:
+            return self.__status.write_configuration_file()
+        temporary_file = self.__status_file + settings.status_file_temporary_suffix
+        if not self.__status.write_configuration_file(temporary_file):
+            return False
+        try:
+            os.replace(temporary_file, self.__status_file)
+        except OSError as e_r:
+            log.error("Cannot replace status file {}. Exception {}".format(self.__status_file, e_r))
+            return False
+        return True
 
-    def __update_current(self, status):
-        if status[settings.status_file_option_error_code] == 200:
-            self.__increment_value(settings.status_file_current_session_section_name,
-                                   settings.status_file_option_successful_calls)
-            self.__calculate_health(True)
-        else:
-            self.__increment_value(settings.status_file_current_session_section_name,
-                                   settings.status_file_option_failed_calls)
-            self.__calculate_health(False)
-        self.__calculate_success_rate(settings.status_file_current_session_section_name)
+    def __write_status_row(self, values):
+        columns = [settings.database_status_column_updated] + list(settings.database_status_columns.values())
+        row = [time.time()] + [values[key] for key in settings.database_status_columns.keys()]
+        connection = self.__database.con
+        try:
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS {}(id INTEGER PRIMARY KEY, {})".format(
+                    settings.database_status_table, ', '.join(columns)))
+                connection.execute("INSERT OR REPLACE INTO {}(id, {}) VALUES (1, {})".format(
+                    settings.database_status_table, ', '.join(columns), ','.join('?' * len(columns))), row)
+        except sqlite3.Error as e_r:
+            log.error("Failed to write status to the database. Exception {}".format(e_r))
+            return False
         return True
 
-    def __calculate_success_rate(self, section):
-        good_calls = self.__status.get_value(section, settings.status_file_option_successful_calls)
-        bad_calls = self.__status.get_value(section, settings.status_file_option_failed_calls)
+    def __get_status_values(self):
+        if self.__status_values is None:
+            self.__status_values = {(section, key): self.__status.get_value(section, key)
+                                    for section, key in settings.status_file_values}
+        return self.__status_values
+
+    def __to_unix_time(self, timestamp):
+        # Readers fall back to parsing the time string when the unix time is 0
+        try:
+            return parse_local_time(timestamp)
+        except (ValueError, OverflowError, TypeError):
+            log.warning("Cannot convert status timestamp {} to unix time".format(timestamp))
+            return 0
+
+    def __count_call(self, section, success):
+        values = self.__status_values
+        if success:
+            values[(section, settings.status_file_option_successful_calls)] += 1
+        else:
+            values[(section, settings.status_file_option_failed_calls)] += 1
+        good_calls = values[(section, settings.status_file_option_successful_calls)]
+        bad_calls = values[(section, settings.status_file_option_failed_calls)]
         percent = 100 * good_calls / (good_calls + bad_calls)
-        self.__status.set_value(section, settings.status_file_option_success_rate, round(percent, 2))
+        values[(section, settings.status_file_option_success_rate)] = round(percent, 2)
+
+    def __reset_health(self):
+        self.__health_list = deque([1] * settings.health_list_length, maxlen=settings.health_list_length)
+        self.__health_sum = settings.health_list_length
 
     def __calculate_health(self, success):
-        self.__health_list.append((int(success)))
-        self.__health_list.pop(0)
-        health = round((100 * sum(self.__health_list) / len(self.__health_list)), 1)
-        self.__status.set_value(settings.status_file_current_session_section_name, settings.status_file_option_health,
-                                health)
-
-    def __increment_value(self, section, key):
-        self.__status.set_value(section, key, self.__status.get_value(section, key) + 1)
+        self.__health_sum += int(success) - self.__health_list[0]
+        self.__health_list.append(int(success))
+        health = round((100 * self.__health_sum / len(self.__health_list)), 1)
+        self.__status_values[(settings.status_file_current_session_section_name,
+                              settings.status_file_option_health)] = health
@@ -18,6 +18,36 @@ API_option_minimum_value = 'minimum_transaction_value'
 API_option_minimum_value_default = 500000
 API_option_historical_limit = 'historical_limit'
 API_option_historical_limit_default = 3599
+API_option_backfill_shards = 'backfill_shards'
+API_option_backfill_shards_default = 6
+API_option_backfill_concurrency = 'backfill_concurrency'
+API_option_backfill_concurrency_default = 3
+API_option_backfill_currencies = 'backfill_currencies'
+API_option_backfill_currencies_default = ''
+API_option_rate_limit = 'rate_limit_per_minute'
+API_option_rate_limit_default = 10
+API_option_rate_limit_burst = 'rate_limit_burst'
+API_option_rate_limit_burst_default = 2
+API_option_json_decoder = 'json_decoder'
+API_option_json_decoder_default = 'json'
+API_option_connection_pool_size = 'connection_pool_size'
+API_option_connection_pool_size_default = 2
+API_option_keep_alive = 'keep_alive'
+API_option_keep_alive_default = True
+API_option_base_url = 'base_url'
+API_option_base_url_default = 'https://api.whale-alert.io'
+API_option_unified_table = 'unified_table'
+API_option_unified_table_default = False
+API_option_write_queue_depth = 'write_queue_depth'
+API_option_write_queue_depth_default = 50
+API_option_write_batch_pages = 'write_batch_pages'
+API_option_write_batch_pages_default = 10
+API_option_write_batch_seconds = 'write_batch_seconds'
+API_option_write_batch_seconds_default = 1.0
+API_option_status_persist_seconds = 'status_persist_seconds'
+API_option_status_persist_seconds_default = 0.0
+API_option_status_to_database = 'status_to_database'
+API_option_status_to_database_default = False
 
 # Status file definitions
 status_file_last_good_call_section_name = 'Last Successful Call'
@@ -25,6 +55,7 @@ status_file_last_failed_secion_name = 'Last Failed Call'
 
 status_file_option_transaction_count = 'transaction_count'
 status_file_option_timeStamp = 'timestamp'
+status_file_option_unix_time = 'unix_time'
 status_file_option_error_code = 'error_code'
 status_file_option_error_message = 'error_message'
 
@@ -35,6 +66,7 @@ status_file_option_successful_calls = 'successful_calls'
 status_file_option_failed_calls = 'failed_calls'
 status_file_option_success_rate = 'success_rate'
 status_file_option_health = "health"
+status_file_temporary_suffix = '.tmp'
 
 # Database definitions
 database_column_blockchain = 'blockchain'
@@ -54,6 +86,28 @@ database_column_amount_usd = 'amount_usd'
 database_column_transaction_count = 'transaction_count'
 
 database_table_identifier = 'blockchain'
+database_unique_column = database_column_id
+database_unique_index_suffix = '_unique_id'
+database_timestamp_index_suffix = '_timestamp'
+database_schema_version = 1
+database_unified_table = 'transactions'
+database_status_table = 'status'
+database_call_history_table = 'call_history'
+database_call_history_columns = ['timestamp', 'latency', 'error_code', 'rows']
+database_reserved_tables = [database_unified_table, database_status_table, database_call_history_table]
+database_unified_indexes = {
+    '_blockchain_timestamp': [database_column_blockchain, database_column_timestamp],
+    '_symbol_timestamp': [database_column_symbol, database_column_timestamp],
+    '_timestamp': [database_column_timestamp]
+}
+database_migration_chunk_rows = 10000
+# SQLite before 3.32 allows at most 999 variables in a statement
+database_maximum_query_variables = 500
+database_journal_mode = 'WAL'
+database_synchronous = 'NORMAL'
+database_cache_size_kib = 16384
+database_mmap_size_bytes = 268435456
+database_busy_timeout_seconds = 10.0
 
 database_columns = {
     database_column_blockchain: 'TEXT',
@@ -73,10 +127,41 @@ database_columns = {
     database_column_transaction_count: 'NUMERIC'
 }
 
+database_status_column_updated = 'updated'
+database_status_columns = {
+    (status_file_last_good_call_section_name, status_file_option_timeStamp): 'last_good_call_timestamp',
+    (status_file_last_good_call_section_name, status_file_option_transaction_count): 'last_good_call_transaction_count',
+    (status_file_last_failed_secion_name, status_file_option_timeStamp): 'last_failed_call_timestamp',
+    (status_file_last_failed_secion_name, status_file_option_error_code): 'last_failed_call_error_code',
+    (status_file_last_failed_secion_name, status_file_option_error_message): 'last_failed_call_error_message',
+    (status_file_current_session_section_name, status_file_option_successful_calls): 'session_successful_calls',
+    (status_file_current_session_section_name, status_file_option_failed_calls): 'session_failed_calls',
+    (status_file_current_session_section_name, status_file_option_success_rate): 'session_success_rate',
+    (status_file_current_session_section_name, status_file_option_health): 'session_health',
+    (status_file_all_time_section_name, status_file_option_successful_calls): 'all_time_successful_calls',
+    (status_file_all_time_section_name, status_file_option_failed_calls): 'all_time_failed_calls',
+    (status_file_all_time_section_name, status_file_option_success_rate): 'all_time_success_rate'
+}
+
+# Every value kept in the status file: the status table columns, plus the last call times as unix timestamps
+status_file_values = list(database_status_columns.keys()) + [
+    (status_file_last_good_call_section_name, status_file_option_unix_time),
+    (status_file_last_failed_secion_name, status_file_option_unix_time)
+]
+
 # Whale Alert API
-whale_get_transactions_url = 'https://api.whale-alert.io/v1/transactions'
+whale_transactions_path = '/v1/transactions'
+whale_get_transactions_url = API_option_base_url_default + whale_transactions_path
 whale_retries_on_failure = 3
 whale_call_timeout_seconds = 10
+whale_retry_base_delay_seconds = 2
+whale_retry_max_delay_seconds = 30
+whale_retry_jitter = 0.5
+whale_retry_status_codes = [429, 500, 502, 503, 504]
+whale_circuit_breaker_failure_threshold = 5
+whale_circuit_breaker_reset_seconds = 300
+whale_error_preview_length = 200
+whale_accept_encoding = 'gzip, deflate'
 
 whale_error_message = 'message'
 
@@ -102,6 +187,8 @@ whale_transaction_transaction_count = 'transaction_count'
 
 # Puslisher settings
 health_list_length = 30
+call_history_length = 8640
+call_history_windows = {'5m': 300, '1h': 3600, '24h': 86400}
 
 # Data request settings
 request_blockchain = 'blockchain'
@@ -109,15 +196,22 @@ request_symbols = 'symbols'
 request_from_time = 'from_time'
 request_output_format = 'output_format'
 request_maximum_results = 'maximum_results'
+request_timezone = 'timezone'
 
 request_format = {
     request_blockchain: [],
     request_symbols: [],
     request_from_time: 0,
     request_output_format: 'str',
-    request_maximum_results: 1
+    request_maximum_results: 1,
+    request_timezone: None
 }
 
 request_time_format = "%m/%d/%Y %H:%M:%S"
 
 maximum_stored_latest_transaction = 1000
+
+# Local stand-in API server
+standin_maximum_page_size = 100
+standin_retry_after_seconds = 1
+standin_synthetic_seed = 0
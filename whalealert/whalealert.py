@@ -3,13 +3,24 @@ import os
 import sys
 import socket
 import subprocess
+import signal
+import threading
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from configchecker import ConfigChecker
-from dbops.sqhelper import SQHelper
 from whalealert.api.transactions import Transactions
+from whalealert.api.async_transactions import AsyncTransactions
+from whalealert.api.backfill import Backfill
+from whalealert.api.ratelimit import get_rate_limiter
+from whalealert.api.decoder import get_decoder
 from whalealert.publisher.writer import Writer
 from whalealert.publisher.reader import Reader
+from whalealert.publisher.write_queue import WriteQueue
+from whalealert.publisher.history import CallHistory
+import whalealert.publisher.schema as schema
+import whalealert.publisher.connection as connection
 import whalealert.settings as settings
 
 log = logging.getLogger(__name__)
@@ -29,24 +40,60 @@ def daemon_already_running():
         return True
 
 
+def _exit_on_terminate(signum, frame):
+    # Unwind the daemon loop as for Ctrl-C, so queued results are written before the process ends
+    raise SystemExit(0)
+
+
 class WhaleAlert():
     """ Python wrapper for the Whale Watch API"""
-    def __init__(self, working_directory=None, log_level=logging.WARNING):
+    def __init__(self, working_directory=None, log_level=logging.WARNING, read_only=False):
+        """
+        Parameters:
+        working_directory (str): Directory for the configuration, status and database files. None to only make API
+        calls.
+        log_level (int): Level of messages written to the log file.
+        read_only (bool): Only open the database for reading, for queries, status requests and exports which run
+        alongside the daemon. No write connection is opened and the database is not upgraded or migrated, so
+        get_database() returns None and storing transactions fails. Ignored if the database doesn't exist yet.
+        """
         if working_directory is not None:
             self.__make_directories_as_needed(working_directory)
             self.__setup_logging(working_directory, log_level)
             self.__config = self.__generate_configuration(working_directory)
-            self.__database = self.__setup_database(working_directory)
+            self.__configure_rate_limiter()
+            self.__configure_decoder()
+            if read_only and os.path.exists(self.__get_database_location(working_directory)):
+                self.__database = None
+            else:
+                self.__database = self.__setup_database(working_directory)
+                if self.__config.get_value(settings.API_section_name, settings.API_option_unified_table):
+                    self.migrate_to_unified_table()
+            self.__reader_database = self.__setup_reader_database(working_directory)
             self.__status = self.__setup_status_file(working_directory)
-            self.__writer = Writer(self.__status, self.__database)
-            self.__reader = Reader(self.__status, self.__database, self.__config)
+            self.__writer = self.__make_writer(working_directory)
+            history = self.__writer.get_call_history()
+            if history is None:
+                history = CallHistory(self.__reader_database)
+            self.__reader = Reader(self.__status, self.__reader_database, self.__config, history)
+            self.__write_queue = self.__make_write_queue()
+            self.__print_subscription = None
             self.__last_data_request_time = int(time.time())
         else:
             self.__config = None
             self.__status = None
             self.__database = None
+            self.__reader_database = None
+            self.__write_queue = None
+            self.__print_subscription = None
         log.debug("Started new Whale Alert API wrapper.")
-        self.transactions = Transactions()
+        pool_size, keep_alive = self.__get_connection_options()
+        self.__base_url = self.__get_base_url()
+        self.transactions = Transactions(pool_size=pool_size, keep_alive=keep_alive, base_url=self.__base_url)
+        self.async_transactions = AsyncTransactions(circuit_breaker=self.transactions.get_circuit_breaker(),
+                                                    pool_size=pool_size,
+                                                    keep_alive=keep_alive,
+                                                    base_url=self.__base_url)
 
     def __setup_logging(self, working_directory, log_level):
         logging_file = os.path.join(working_directory, settings.data_file_directory, settings.log_file_name)
@@ -65,6 +112,8 @@ class WhaleAlert():
                                str, '')
         status.set_expectation(settings.status_file_last_good_call_section_name,
                                settings.status_file_option_transaction_count, int, 0)
+        status.set_expectation(settings.status_file_last_good_call_section_name,
+                               settings.status_file_option_unix_time, int, 0)
 
         status.set_expectation(settings.status_file_last_failed_secion_name, settings.status_file_option_timeStamp, str,
                                '')
@@ -72,6 +121,8 @@ class WhaleAlert():
                                int, 0)
         status.set_expectation(settings.status_file_last_failed_secion_name, settings.status_file_option_error_message,
                                str, '')
+        status.set_expectation(settings.status_file_last_failed_secion_name, settings.status_file_option_unix_time,
+                               int, 0)
 
         status.set_expectation(settings.status_file_current_session_section_name,
                                settings.status_file_option_successful_calls, int, 0)
@@ -94,12 +145,22 @@ class WhaleAlert():
         status.write_configuration_file(target_file)
         return status
 
+    def __get_database_location(self, working_directory):
+        return os.path.join(working_directory, settings.data_file_directory, settings.database_file_name)
+
     def __setup_database(self, working_directory):
-        file_location = os.path.join(working_directory, settings.data_file_directory, settings.database_file_name)
-        database = SQHelper(file_location)
+        database = connection.open_writer(self.__get_database_location(working_directory))
         if not database.exists():
             log.critical("Failed to create required database file, exiting")
             raise
+        schema.upgrade(database)
+        return database
+
+    def __setup_reader_database(self, working_directory):
+        database = connection.open_reader(self.__get_database_location(working_directory))
+        if database is None or not database.exists():
+            log.critical("Failed to open the database for reading, exiting")
+            raise
         return database
 
     def __generate_configuration(self, working_directory):
@@ -114,12 +175,106 @@ class WhaleAlert():
                                settings.API_option_minimum_value_default)
         config.set_expectation(settings.API_section_name, settings.API_option_historical_limit, int,
                                settings.API_option_historical_limit_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_backfill_shards, int,
+                               settings.API_option_backfill_shards_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_backfill_concurrency, int,
+                               settings.API_option_backfill_concurrency_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_backfill_currencies, str,
+                               settings.API_option_backfill_currencies_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_rate_limit, int,
+                               settings.API_option_rate_limit_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_rate_limit_burst, int,
+                               settings.API_option_rate_limit_burst_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_json_decoder, str,
+                               settings.API_option_json_decoder_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_connection_pool_size, int,
+                               settings.API_option_connection_pool_size_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_keep_alive, bool,
+                               settings.API_option_keep_alive_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_base_url, str,
+                               settings.API_option_base_url_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_unified_table, bool,
+                               settings.API_option_unified_table_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_write_queue_depth, int,
+                               settings.API_option_write_queue_depth_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_write_batch_pages, int,
+                               settings.API_option_write_batch_pages_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_write_batch_seconds, float,
+                               settings.API_option_write_batch_seconds_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_status_persist_seconds, float,
+                               settings.API_option_status_persist_seconds_default)
+        config.set_expectation(settings.API_section_name, settings.API_option_status_to_database, bool,
+                               settings.API_option_status_to_database_default)
 
         target_directory = os.path.join(working_directory, settings.input_configuation_filename)
         config.set_configuration_file(target_directory)
         config.write_configuration_file(target_directory)
         return config
 
+    def __configure_rate_limiter(self):
+        requests_per_minute = self.__config.get_value(settings.API_section_name, settings.API_option_rate_limit)
+        burst = self.__config.get_value(settings.API_section_name, settings.API_option_rate_limit_burst)
+        try:
+            get_rate_limiter().configure(requests_per_minute, burst)
+        except ValueError as e_r:
+            log.error("Invalid rate limit configuration, API calls are not rate limited. Exception '{}'".format(e_r))
+            get_rate_limiter().configure(None)
+
+    def __configure_decoder(self):
+        backend = self.__config.get_value(settings.API_section_name, settings.API_option_json_decoder)
+        try:
+            get_decoder().configure(backend)
+        except ValueError as e_r:
+            log.error("Invalid JSON decoder configuration, using the standard library. Exception '{}'".format(e_r))
+            get_decoder().configure('json')
+
+    def __get_connection_options(self):
+        pool_size = settings.API_option_connection_pool_size_default
+        keep_alive = settings.API_option_keep_alive_default
+        if self.__config is None:
+            return pool_size, keep_alive
+        configured_size = self.__config.get_value(settings.API_section_name, settings.API_option_connection_pool_size)
+        if configured_size < 1:
+            log.error("Invalid connection pool size {}, using {}".format(configured_size, pool_size))
+        else:
+            pool_size = configured_size
+        keep_alive = self.__config.get_value(settings.API_section_name, settings.API_option_keep_alive)
+        return pool_size, keep_alive
+
+    def __make_writer(self, working_directory):
+        status_file = os.path.join(working_directory, settings.data_file_directory, settings.status_file_name)
+        persist_seconds = self.__config.get_value(settings.API_section_name, settings.API_option_status_persist_seconds)
+        if persist_seconds < 0:
+            log.error("Invalid status persist interval {}, writing status on every call".format(persist_seconds))
+            persist_seconds = 0
+        status_to_database = self.__config.get_value(settings.API_section_name,
+                                                     settings.API_option_status_to_database)
+        if self.__database is None:
+            status_to_database = False
+        return Writer(self.__status, self.__database, status_file, persist_seconds, status_to_database)
+
+    def __make_write_queue(self):
+        depth = self.__config.get_value(settings.API_section_name, settings.API_option_write_queue_depth)
+        batch_pages = self.__config.get_value(settings.API_section_name, settings.API_option_write_batch_pages)
+        batch_seconds = self.__config.get_value(settings.API_section_name, settings.API_option_write_batch_seconds)
+        try:
+            return WriteQueue(self.__store_pages, depth, batch_pages, batch_seconds)
+        except ValueError as e_r:
+            log.error("Invalid write queue configuration, using defaults. Exception '{}'".format(e_r))
+            return WriteQueue(self.__store_pages, settings.API_option_write_queue_depth_default,
+                              settings.API_option_write_batch_pages_default,
+                              settings.API_option_write_batch_seconds_default)
+
+    def __get_base_url(self):
+        if self.__config is None:
+            return None
+        base_url = self.__config.get_value(settings.API_section_name, settings.API_option_base_url).strip()
+        if base_url == '':
+            return None
+        if base_url != settings.API_option_base_url_default:
+            log.info("Using API base URL '{}'".format(base_url))
+        return base_url
+
     def __make_directories_as_needed(self, working_directory):
         target_directory = os.path.join(working_directory, settings.data_file_directory)
         self.__make_dir(target_directory)
@@ -137,6 +292,7 @@ class WhaleAlert():
         """ Get the configuration used
 
         Note: This function always returns None if a working_directory is not supplied when the class object is created.
+        It also returns None if the object was created with read_only set.
 
         Returns:
         config (ConfigChecker) if a valid configuration exists.
@@ -167,6 +323,74 @@ class WhaleAlert():
         """
         return self.__database
 
+    def migrate_to_unified_table(self):
+        """ Move transactions from the per-blockchain tables into the single unified transactions table
+
+        Once migrated, queries across blockchains are answered by one indexed SQL statement. Rows are moved in small
+        database transactions, so a running daemon can keep writing while the migration runs. Setting unified_table
+        in the configuration file migrates the database every time it is opened, which is quick once done.
+
+        Returns:
+        moved (int): The number of transactions moved.
+        None: No database is connected, or the migration failed (written to logs).
+        """
+        if self.__database is None:
+            return None
+        if schema.is_unified(self.__database) and len(schema.get_blockchain_tables(self.__database)) == 0:
+            return 0
+        return schema.migrate_to_unified(self.__database)
+
+    def get_rate_limiter(self):
+        """ Get the rate limiter shared by all API calls in this process
+
+        Call get_statistics() on the returned object to see how long calls have waited for the rate limit.
+
+        Returns:
+        rate_limiter (RateLimiter): The process wide rate limiter.
+        """
+        return get_rate_limiter()
+
+    def get_decoder(self):
+        """ Get the JSON decoder shared by all API calls in this process
+
+        Call get_statistics() on the returned object to see the size of received pages and the time spent decoding.
+
+        Returns:
+        decoder (Decoder): The process wide decoder.
+        """
+        return get_decoder()
+
+    def get_transport_statistics(self):
+        """ Get connection reuse, compression and timing statistics for get_transactions calls
+
+        Returns:
+        statistics (dict): See TransportStatistics.get_statistics().
+        """
+        return self.transactions.get_transport_statistics()
+
+    def get_write_statistics(self):
+        """ Get the number of transactions written to the database and the rows written per second
+
+        Note: This function always returns None if a working_directory is not supplied when the class object is created.
+
+        Returns:
+        statistics (dict): See Writer.get_statistics().
+        None: No database is connected.
+        """
+        if self.__database is None:
+            return None
+        return self.__writer.get_statistics()
+
+    def get_circuit_breaker(self):
+        """ Get the circuit breaker shared by this object's API calls
+
+        The breaker opens after repeated failed calls, skipping further calls until the API is retried.
+
+        Returns:
+        circuit_breaker (CircuitBreaker): The breaker guarding get_transactions, the daemon and backfills.
+        """
+        return self.transactions.get_circuit_breaker()
+
     def get_transactions(self, start_time, end_time=None, api_key=None, cursor=None, min_value=500000, limit=100):
         """ Use the Whale Alert API to get the lastest transactions for a given time period
 
@@ -186,6 +410,46 @@ class WhaleAlert():
         status (dict): A dictionary containing the timestamp, error_code and error_message for the transaction.
         """
 
+        api_key, min_value = self.__prepare_call_parameters(start_time, end_time, api_key, min_value)
+        success, transactions, status = self.transactions.get_transactions(start_time, end_time, api_key, cursor,
+                                                                           min_value, limit)
+        return self.__to_api_format(success, transactions, status)
+
+    async def get_transactions_async(self,
+                                     start_time,
+                                     end_time=None,
+                                     api_key=None,
+                                     cursor=None,
+                                     min_value=500000,
+                                     limit=100):
+        """ Awaitable version of get_transactions, using the asyncio API wrapper.
+
+        Parameters and return values are the same as get_transactions.
+        """
+        api_key, min_value = self.__prepare_call_parameters(start_time, end_time, api_key, min_value)
+        success, transactions, status = await self.async_transactions.get_transactions(
+            start_time, end_time, api_key, cursor, min_value, limit)
+        return self.__to_api_format(success, transactions, status)
+
+    async def close_async(self):
+        """ Close the aiohttp session used by the awaitable calls, if one is open on the running event loop.
+
+        The object can also be used as an async context manager, which closes the session on exit.
+        """
+        await self.async_transactions.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close_async()
+
+    def __to_api_format(self, success, transactions, status):
+        if success is True:
+            transactions = [transaction.to_api_format() for transaction in transactions]
+        return success, transactions, status
+
+    def __prepare_call_parameters(self, start_time, end_time, api_key, min_value):
         if type(start_time) is not int:
             raise ValueError("Start time must be a unix time stamp integer")
         if end_time is not None and type(end_time) is not int:
@@ -196,10 +460,46 @@ class WhaleAlert():
             api_key = self.__config.get_value(settings.API_section_name, settings.API_option_private_key)
         if self.__config is not None and min_value == 500000:
             min_value = self.__config.get_value(settings.API_section_name, settings.API_option_minimum_value)
+        return api_key, min_value
 
-        success, transactions, status = self.transactions.get_transactions(start_time, end_time, api_key, cursor,
-                                                                           min_value, limit)
-        return success, transactions, status
+    def iter_transactions(self, start_time, end_time=None, api_key=None, min_value=500000, limit=100):
+        """ Get all transactions for a given time period, following the pagnation cursor between pages.
+
+        Pages are requested until one is returned with less than limit transactions, or a call fails. The request
+        for the next page is made in the background while the current page is being handled by the caller.
+
+        Parameters:
+        start_time (int): A unix time stamp representing the start time to get transactions (exclusive)
+        end_time (int): A unix time stamp representing the end time to get transactions (inclusive)
+        api_key (str): Key to use for transaction. Must be supplied if running with no configuration file.
+        min_value (int): The minimum value transaction to return (Free API has 500000 minimum)
+        limit (int): The maximum number of transactions to return per page (Maximum 100)
+
+        Returns:
+        A generator yielding the (success, transactions, status) result of get_transactions for each page.
+        """
+        api_key, min_value = self.__prepare_call_parameters(start_time, end_time, api_key, min_value)
+        pages = self.__iterate_pages(start_time, end_time, api_key, None, min_value, limit)
+        return (self.__to_api_format(success, transactions, status) for success, transactions, status, _, _ in pages)
+
+    def __iterate_pages(self, start_time, end_time, api_key, cursor, min_value, limit):
+        # Yields (success, transactions, status, finished_at, latency) for each page
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_page = executor.submit(self.__timed_get_transactions, start_time, end_time, api_key, cursor,
+                                        min_value, limit)
+            while next_page is not None:
+                page = next_page.result()
+                success, transactions = page[0], page[1]
+                next_page = None
+                if success is True and len(transactions) >= limit:
+                    next_page = executor.submit(self.__timed_get_transactions, start_time, end_time, api_key,
+                                                self.transactions.get_last_cursor(), min_value, limit)
+                yield page
+
+    def __timed_get_transactions(self, *args):
+        call_start = time.perf_counter()
+        success, transactions, status = self.transactions.get_transactions(*args)
+        return success, transactions, status, time.time(), time.perf_counter() - call_start
 
     def write_custom_status(self, status):
         """
@@ -220,6 +520,21 @@ class WhaleAlert():
             return False
         return self.__writer.write_status(status)
 
+    def flush_status(self):
+        """
+        Write any status changes held in memory to the status file
+
+        Only needed when status_persist_seconds is set in the configuration file, otherwise the status file is written
+        on every call. The daemon flushes the status when it stops.
+
+        Returns:
+        True: The status file is up to date
+        False: An error occured. Errors are sent to the logging module
+        """
+        if self.__status is None:
+            return False
+        return self.__writer.flush_status()
+
     def fetch_and_store_data(self, start_time, end_time=None, api_key=None, cursor=None, min_value=500000, limit=100):
         """ Use the Whale Alert API to get the lastest transactions for a given time period. Store the result in given database.
 
@@ -236,31 +551,169 @@ class WhaleAlert():
         Returns:
         success (bool) : If true, then a successful call was made, with data stored. Returns false otherwise.
         """
+        api_key = self.__prepare_fetch_api_key(api_key)
+        if api_key is None:
+            return False
+
+        page = self.__timed_get_transactions(start_time, end_time, api_key, cursor, min_value, limit)
+        return self.__store_pages([page])[0]
+
+    async def fetch_and_store_data_async(self,
+                                         start_time,
+                                         end_time=None,
+                                         api_key=None,
+                                         cursor=None,
+                                         min_value=500000,
+                                         limit=100):
+        """ Awaitable version of fetch_and_store_data, using the asyncio API wrapper.
+
+        Many time windows can be fetched concurrently, for example with asyncio.gather. Database and status writes
+        are made on the event loop thread once each call returns.
+
+        Parameters and return values are the same as fetch_and_store_data.
+        """
+        api_key = self.__prepare_fetch_api_key(api_key)
+        if api_key is None:
+            return False
+
+        call_start = time.perf_counter()
+        success, transactions, status = await self.async_transactions.get_transactions(
+            start_time, end_time, api_key, cursor, min_value, limit)
+        latency = time.perf_counter() - call_start
+        return self.__store_pages([(success, transactions, status, time.time(), latency)])[0]
+
+    def __prepare_fetch_api_key(self, api_key):
         if self.__database is None:
             log.error("Trying to fetch data without an API key or working directory (cannot store data).")
-            return False
-        elif self.__database is not None and api_key is None:
+            return None
+        elif api_key is None:
             api_key = self.__config.get_value(settings.API_section_name, settings.API_option_private_key)
             log.debug("Using configuration supplied API key")
         else:
             log.debug("Using overridden API key")
-
-        success, transactions, status = self.transactions.get_transactions(start_time, end_time, api_key, cursor,
-                                                                           min_value, limit)
-        if success is True and len(transactions) > 0:
-            written_ok = self.__writer.write_transactions(transactions)
-            if written_ok is False:
-                status['error_code'] = 20
-                status['error_message'] = "Failed to write transactions to database"
+        return api_key
+
+    def __store_result(self, success, transactions, status):
+        return self.__store_pages([(success, transactions, status, time.time(), None)])[0]
+
+    def __store_pages(self, pages):
+        # Pages are (success, transactions, status, finished_at, latency). All pages are written in one database
+        # transaction. If that fails, each page is written on its own so that one bad page doesn't lose the others.
+        stored = [page[1] for page in pages if page[0] is True and len(page[1]) > 0]
+        written = []
+        if len(stored) > 0:
+            all_written = self.__writer.write_transactions([transaction for page in stored for transaction in page])
+            if all_written is False and len(stored) > 1:
+                written = [self.__writer.write_transactions(page) for page in stored]
+            else:
+                written = [all_written] * len(stored)
+        written = iter(written)
+
+        results = []
+        for success, transactions, status, finished_at, latency in pages:
+            if success is True and len(transactions) > 0:
+                if next(written) is False:
+                    status['error_code'] = 20
+                    status['error_message'] = "Failed to write transactions to database"
+                    success = False
+            elif success is True and len(transactions) == 0:
                 success = False
-        elif success is True and len(transactions) == 0:
-            success = False
+            self.__writer.write_status(status, latency, finished_at)
+            results.append(success)
+        if self.__print_subscription is not None:
+            output = self.__reader.transactions_to_output(
+                self.__writer.get_last_written_transactions(self.__print_subscription), pretty=True)
+            if len(output) > 0:
+                print(output)
+        return results
+
+    def get_write_queue_statistics(self):
+        """ Get the statistics of the daemon's write-behind queue.
+
+        See WriteQueue.get_statistics for the values returned.
+
+        Returns:
+        A dictionary of statistics, or None if there is no working directory.
+        """
+        if self.__write_queue is None:
+            return None
+        return self.__write_queue.get_statistics()
+
+    def backfill(self, start_time, end_time=None, api_key=None, min_value=500000, shards=None, concurrency=None,
+                 currencies=None):
+        """ Fetch and store all transactions for a historical time period, using concurrent sharded requests.
+
+        The period is split into sub-windows (and optionally currencies) which are fetched concurrently. The
+        results are merged and deduplicated before being written to the database. Transactions are only stored if
+        every shard is fetched successfully.
+
+        Parameters:
+        start_time (int): A unix time stamp representing the start time to get transactions (exclusive)
+        end_time (int): A unix time stamp representing the end time to get transactions (inclusive)
+        api_key (str): Key to use for transaction. Must be supplied if running with no configuration file.
+        min_value (int): The minimum value transaction to return (Free API has 500000 minimum)
+        shards (int): The number of sub-windows to split the period into. Defaults to the configuration value.
+        concurrency (int): The maximum number of API calls in flight. Defaults to the configuration value.
+        currencies (list): Currency codes to shard by. Only these currencies are fetched. Defaults to the
+        configuration value, or all currencies. An empty list fetches all currencies, ignoring the configuration.
 
-        self.__writer.write_status(status)
-        return success
+        Returns:
+        success (bool) : If true, every shard was fetched and the transactions stored. Returns false otherwise.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(
+                self.backfill_async(start_time, end_time, api_key, min_value, shards, concurrency, currencies))
+        finally:
+            loop.close()
+
+    async def backfill_async(self,
+                             start_time,
+                             end_time=None,
+                             api_key=None,
+                             min_value=500000,
+                             shards=None,
+                             concurrency=None,
+                             currencies=None):
+        """ Awaitable version of backfill.
+
+        Parameters and return values are the same as backfill.
+        """
+        if end_time is None:
+            end_time = int(time.time())
+        api_key = self.__prepare_fetch_api_key(api_key)
+        if api_key is None:
+            return False
+        api_key, min_value = self.__prepare_call_parameters(start_time, end_time, api_key, min_value)
+
+        if shards is None:
+            shards = self.__config.get_value(settings.API_section_name, settings.API_option_backfill_shards)
+        if concurrency is None:
+            concurrency = self.__config.get_value(settings.API_section_name, settings.API_option_backfill_concurrency)
+        if currencies is None:
+            currencies = self.__config.get_value(settings.API_section_name, settings.API_option_backfill_currencies)
+            currencies = [currency.strip() for currency in currencies.split(',') if currency.strip() != '']
+
+        backfill = Backfill(shards=shards,
+                            concurrency=concurrency,
+                            currencies=currencies,
+                            circuit_breaker=self.transactions.get_circuit_breaker(),
+                            base_url=self.__base_url)
+        success, transactions, status = await backfill.fetch(start_time, end_time, api_key, min_value)
+        if success is not True:
+            self.__writer.write_status(status)
+            return False
+        if len(transactions) == 0:
+            self.__writer.write_status(status)
+            return True
+        return self.__store_result(success, transactions, status)
 
     def start_daemon(self, force=False, print_output=False):
-        """ Start logging transactions to database based on configuration file values """
+        """ Start logging transactions to database based on configuration file values
+
+        Results are stored by a write-behind queue on a separate thread, so a slow disk never delays the next API
+        call. The queue is drained when the daemon stops.
+        """
         if daemon_already_running() and force is False:
             return
 
@@ -279,41 +732,50 @@ class WhaleAlert():
             log.error("Historical limit cannot be less than or equal to zero, daemon not starting")
             return
 
-        self.__status.set_value(settings.status_file_current_session_section_name,
-                                settings.status_file_option_successful_calls, 0)
-        self.__status.set_value(settings.status_file_current_session_section_name,
-                                settings.status_file_option_failed_calls, 0)
-        self.__status.set_value(settings.status_file_current_session_section_name,
-                                settings.status_file_option_success_rate, 100.0)
-        self.__status.set_value(settings.status_file_current_session_section_name, settings.status_file_option_health,
-                                100.0)
-        self.__status.write_configuration_file()
-
-        while True:
-            if self.transactions.get_last_cursor() is None:
-                start_time = self.__find_latest_timestamp()
-            else:
-                start_time = 0
-
-            end_time = int(time.time())
-            if (end_time - start_time) > historical_limit:
-                start_time = end_time - historical_limit
-
-            success = self.fetch_and_store_data(start_time,
-                                                end_time=end_time,
-                                                api_key=api_key,
-                                                cursor=self.transactions.get_last_cursor())
+        self.__writer.start_session()
 
-            if success is True and print_output:
-                print(self.get_new_transaction(pretty=True))
+        start_time = max(self.__find_latest_timestamp(), int(time.time()) - historical_limit)
+        if int(time.time()) - start_time > request_interval:
+            log.info("Backfilling {} seconds of missed transactions".format(int(time.time()) - start_time))
+            # The daemon logs every currency, so the gap is sharded by time only, whatever backfill_currencies is set to
+            self.backfill(start_time, api_key=api_key, currencies=[])
 
-            time.sleep(request_interval)
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGTERM, _exit_on_terminate)
+        if print_output:
+            self.__print_subscription = self.__writer.subscribe()
+        self.__write_queue.start()
+        try:
+            while True:
+                if self.transactions.get_last_cursor() is None:
+                    self.__write_queue.flush()
+                    start_time = self.__find_latest_timestamp()
+                else:
+                    start_time = 0
+
+                end_time = int(time.time())
+                if (end_time - start_time) > historical_limit:
+                    start_time = end_time - historical_limit
+
+                pages = self.__iterate_pages(start_time, end_time, api_key, self.transactions.get_last_cursor(),
+                                             500000, 100)
+                for page in pages:
+                    self.__write_queue.put(page)
+
+                time.sleep(request_interval)
+        finally:
+            self.__write_queue.stop()
+            self.__writer.flush_status()
+            self.__print_subscription = None
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
 
     def __find_latest_timestamp(self):
-        tables = self.__database.get_table_names()
+        tables = schema.get_transaction_tables(self.__reader_database)
         latest_timestamp = 0
         for table in tables:
-            last = self.__database.get_last_time_entry(table)
+            last = self.__reader_database.get_last_time_entry(table)
             try:
                 if last['timestamp'] > latest_timestamp:
                     latest_timestamp = last['timestamp']
@@ -329,16 +791,16 @@ class WhaleAlert():
 
     def to_excel(self, output_file='whaleAlert.xlsx'):
         """ Write the entire database to an excel file """
-        if self.__database is None:
+        if self.__reader_database is None:
             return False
 
-        tables = self.__database.get_table_names()
+        tables = schema.get_transaction_tables(self.__reader_database)
         if len(tables) == 0:
             return False
 
         df_list = []
         for table in tables:
-            df_list.append(self.__database.table_to_df(table))
+            df_list.append(self.__reader_database.table_to_df(table))
         writer = pd.ExcelWriter(output_file, engine='openpyxl')
         _ = [A.to_excel(writer, sheet_name="{0}".format(tables[i])) for i, A in enumerate(df_list)]
         writer.save()
@@ -351,7 +813,8 @@ class WhaleAlert():
                      max_results=20,
                      pretty=False,
                      as_df=False,
-                     as_dict=False):
+                     as_dict=False,
+                     timezone=None):
         """ Retreive data from the trasaction database
 
         Parameters:
@@ -362,6 +825,7 @@ class WhaleAlert():
         pretty (bool): Use ASIC colour codes to format the output
         as_df (bool): Return the results as a Pandas DataFrame
         as_dict (bool): Return the results as a dictionary.
+        timezone (str): Show times in this IANA timezone (e.g. 'Europe/London') instead of local time.
         """
         request = dict(settings.request_format)
         if blockchain is not None:
@@ -376,18 +840,20 @@ class WhaleAlert():
 
         request[settings.request_from_time] = start
         request[settings.request_maximum_results] = max_results
+        request[settings.request_timezone] = timezone
         return self.__reader.data_request(request, pretty, as_df, as_dict)
 
-    def get_new_transaction(self, pretty=False, as_df=False, as_dict=False):
+    def get_new_transaction(self, pretty=False, as_df=False, as_dict=False, timezone=None):
         """Get the transaction returned since the last call to this method
 
-        WARNING: If start_daemon is called with print_output = True, then this method
-        will not work as expected
+        Up to 1000 of the newest transactions are kept between calls. The daemon's print_output has its own
+        cursor, so both see every new transaction.
 
         Parameters:
         pretty (Bool): Use ascii colour codes to format the output.
         as_df (Bool): Return all transactions as a dataframe
         as_dict (Bool): Retun as a {timestamp: '', 'text' ''} dictionary. Pretty output is also applied
+        timezone (str): Show times in this IANA timezone instead of local time.
 
         as_df takes precendence over as_dict.
 
@@ -397,22 +863,24 @@ class WhaleAlert():
         if as_df is True:
             return self.__writer.get_last_written()
 
-        return self.__reader.dataframe_to_transaction_output(self.__writer.get_last_written(),
-                                                             pretty=pretty,
-                                                             as_dict=as_dict)
+        return self.__reader.transactions_to_output(self.__writer.get_last_written_transactions(),
+                                                    pretty=pretty,
+                                                    as_dict=as_dict,
+                                                    timezone=timezone)
 
-    def dataframe_to_transaction_output(self, df: pd.DataFrame, pretty: bool, as_dict: bool):
+    def dataframe_to_transaction_output(self, df: pd.DataFrame, pretty: bool, as_dict: bool, timezone: str = None):
         """ Directly turn a transaction dataframe into transaction strings (or dictionaries)
 
         Parameters:
         df: A pandas dataframe aquired from data_request or get_new_transaction
         pretty (bool): Use ascii colour codes to format the output.
         as_dict (Bool): Retun as a {timestamp: '', 'text' ''} dictionary. Pretty output is also applied
+        timezone (str): Show times in this IANA timezone instead of local time.
 
         Returns:
         Formatted output depending on the passed parameters.
         """
-        return self.__reader.dataframe_to_transaction_output(df, pretty=pretty, as_dict=as_dict)
+        return self.__reader.dataframe_to_transaction_output(df, pretty=pretty, as_dict=as_dict, timezone=timezone)
 
     def status_request(self, as_dict=False):
         """ Get current status of the running logger"""